@@ -3,8 +3,80 @@
 提供精确的量刑计算功能，避免LLM直接进行数值计算
 """
 
-import json
-from typing import Dict, List, Union
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import Dict, Final, List, Mapping, Tuple, Union
+
+
+# 法定刑档位（单位：月）：罪名 -> (档位金额分界, 各档位上下限)
+_LEGAL_AMOUNT_RANGES = {
+    "盗窃罪": (
+        (30000, 300000),
+        (
+            (6, 36),     # 三年以下 = 6-36个月
+            (36, 120),   # 三年以上十年以下 = 36-120个月
+            (120, 180),  # 十年以上 = 120-180个月(无期除外)
+        ),
+    ),
+    "诈骗罪": (
+        (30000, 500000),
+        ((6, 36), (36, 120), (120, 180)),
+    ),
+}
+
+# 根据最高检相关解释和刑法规定确定故意伤害罪的法定刑范围
+_LEGAL_RANGE_INJURY = {
+    # 轻伤（三年以下有期徒刑、拘役或者管制）
+    "轻伤一级": (6, 36),   # 1年至3年
+    "轻伤二级": (1, 36),   # 6个月至3年
+
+    # 重伤（三年以上十年以下有期徒刑）
+    "重伤一级": (72, 120), # 6年至10年
+    "重伤二级": (36, 96),  # 3年至8年
+
+    # 致人死亡或特别残忍手段致人重伤造成严重残疾（十年以上有期徒刑、无期徒刑或者死刑）
+    "致人死亡": (120, 180), # 10年至15年
+    "死亡": (120, 180)     # 10年至15年
+}
+
+
+class LazySteps:
+    """
+    计算步骤的惰性记录
+
+    只保存 (格式串, 参数)，在迭代或 JSON 序列化时才格式化为文本，
+    调用方不读取计算步骤时可省去逐条字符串格式化的开销。
+    """
+
+    __slots__ = ("_records",)
+
+    def __init__(self):
+        self._records = []
+
+    def append(self, fmt: str, *args) -> None:
+        self._records.append((fmt, args))
+
+    def __iter__(self):
+        return (fmt.format(*args) for fmt, args in self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def _json_default(obj):
+    """json.dumps 的 default 钩子：将 LazySteps 展开为字符串列表"""
+    if isinstance(obj, LazySteps):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
 class SentencingCalculator:
@@ -283,35 +355,29 @@ class SentencingCalculator:
         计算基准刑（单位：月）- 改进版
         采用"档位基准刑 + 超额累进"模式，参考大多数省份标准
         """
-        # 获取地区标准
-        if region in SentencingCalculator.REGIONAL_STANDARDS:
-            standards = SentencingCalculator.REGIONAL_STANDARDS[region]
-        elif region in SentencingCalculator.REGIONAL_STANDARDS.get("cities_to_provinces", {}):
-            province = SentencingCalculator.REGIONAL_STANDARDS["cities_to_provinces"][region]
-            standards = SentencingCalculator.REGIONAL_STANDARDS[province]
-        else:
-            standards = SentencingCalculator.REGIONAL_STANDARDS["default"]
+        # 获取地区标准（城市已在导入时解析到对应省份）
+        region_id = _REGION_ID.get(region, _DEFAULT_REGION_ID)
 
         if crime_type == "盗窃罪":
-            theft_standards = standards["theft"]
+            large, huge, especially_huge = _REGION_THEFT_THRESHOLDS[region_id]
             # 根据地区标准计算
             if amount is None:
                 base = 12
-            elif amount < theft_standards["large"]:
+            elif amount < large:
                 base = 6  # 可能不构成犯罪或拘役
-            elif amount < theft_standards["huge"]:  # 数额较大档
+            elif amount < huge:  # 数额较大档
                 base = 6
-                excess = amount - theft_standards["large"]
+                excess = amount - large
                 additional = int(excess / 2000) * 1  # 每增加 2 000 加 1 个月
                 base = min(base + additional, 36)
-            elif amount < theft_standards["especially_huge"]:  # 数额巨大档
+            elif amount < especially_huge:  # 数额巨大档
                 base = 36
-                excess = amount - theft_standards["huge"]
+                excess = amount - huge
                 additional = int(excess / 3000) * 1.5  # 每增加 3 000 加 1 个月
                 base = min(int(base + additional), 72)
             else:  # 数额特别巨大档
                 base = 120
-                excess = amount - theft_standards["especially_huge"]
+                excess = amount - especially_huge
                 additional = int(excess / 50000) * 1  # 每增加 50 000 加 1 个月
                 base = min(int(base + additional), 180)
                 
@@ -324,24 +390,24 @@ class SentencingCalculator:
 
             # ---------- 诈骗罪 ----------
         elif crime_type == "诈骗罪":
-            fraud_standards = standards["fraud"]
+            large, huge, especially_huge = _REGION_FRAUD_THRESHOLDS[region_id]
             if amount is None:
                 return 12
-            if amount < fraud_standards["large"]:
+            if amount < large:
                 return 6
-            elif amount < fraud_standards["huge"]:  # 数额较大
+            elif amount < huge:  # 数额较大
                 base = 6
-                excess = amount - fraud_standards["large"]
+                excess = amount - large
                 additional = int(excess / 1000) * 2
                 return min(base + additional, 36)
-            elif amount < fraud_standards["especially_huge"]:  # 数额巨大（标准与盗窃不同）
+            elif amount < especially_huge:  # 数额巨大（标准与盗窃不同）
                 base = 36
-                excess = amount - fraud_standards["huge"]
+                excess = amount - huge
                 additional = int(excess / 10000) * 1.5
                 return min(int(base + additional), 120)
             else:  # 数额特别巨大
                 base = 120
-                excess = amount - fraud_standards["especially_huge"]
+                excess = amount - especially_huge
                 additional = int(excess / 100000) * 1
                 return min(int(base + additional), 180)
 
@@ -402,9 +468,9 @@ class SentencingCalculator:
         """
         分层计算最终刑期 - 增强版,带约束条件
         """
-        steps = []
+        steps = LazySteps()
         current_months = base_months
-        steps.append(f"基准刑: {base_months}个月")
+        steps.append("基准刑: {}个月", base_months)
 
         # 第一层面：连乘
         layer1_multiplier = 1.0
@@ -413,11 +479,11 @@ class SentencingCalculator:
             name = factor.get("name") or factor.get("factor")
             ratio = factor["ratio"]
             layer1_multiplier *= ratio
-            steps.append(f"第一层面 - {name}: ×{ratio}")
+            steps.append("第一层面 - {}: ×{}", name, ratio)
 
         if layer1_factors:
             current_months = base_months * layer1_multiplier
-            steps.append(f"第一层面结果: {current_months:.2f}个月")
+            steps.append("第一层面结果: {:.2f}个月", current_months)
 
         # 第二层面：加减
         layer2_adjustment = 0.0
@@ -427,20 +493,20 @@ class SentencingCalculator:
             ratio = factor["ratio"]
             adjustment = ratio - 1.0
             layer2_adjustment += adjustment
-            steps.append(f"第二层面 - {name}: {'+' if adjustment > 0 else ''}{adjustment * 100:.0f}%")
+            steps.append("第二层面 - {}: {}{:.0f}%", name, "+" if adjustment > 0 else "", adjustment * 100)
 
+        temp_final = current_months
         if layer2_factors:
-            layer2_multiplier = 1.0 + layer2_adjustment
-            temp_final = current_months * layer2_multiplier
-            steps.append(f"第二层面初步结果: {temp_final:.2f}个月")
-        else:
-            temp_final = current_months
+            temp_final = current_months * (1.0 + layer2_adjustment)
+            steps.append("第二层面初步结果: {:.2f}个月", temp_final)
 
         # 移除所有法定约束检查，只保留基本的有效性检查
         # 确保刑期不低于1个月
+        constrained = False
         if temp_final < 1:
-            steps.append(f"⚠️ 调整: 结果({temp_final:.2f}月)低于1个月")
-            steps.append(f"   调整至最低刑期: 1个月")
+            steps.append("⚠️ 调整: 结果({:.2f}月)低于1个月", temp_final)
+            steps.append("   调整至最低刑期: 1个月")
+            constrained = True
             temp_final = 1
 
         final_months = round(temp_final, 2)
@@ -449,7 +515,7 @@ class SentencingCalculator:
             "final_months": final_months,
             "base_months": base_months,
             "calculation_steps": steps,
-            "constrained": temp_final != current_months * (1.0 + layer2_adjustment)
+            "constrained": constrained
         }
 
     @staticmethod
@@ -457,39 +523,14 @@ class SentencingCalculator:
         """
         获取法定刑档位的上下限
         """
-        if crime_type == "盗窃罪":
-            if amount < 30000:
-                return (6, 36)  # 三年以下 = 6-36个月
-            elif amount < 300000:
-                return (36, 120)  # 三年以上十年以下 = 36-120个月
-            else:
-                return (120, 180)  # 十年以上 = 120-180个月(无期除外)
-
-        elif crime_type == "诈骗罪":
-            if amount < 30000:
-                return (6, 36)
-            elif amount < 500000:
-                return (36, 120)
-            else:
-                return (120, 180)
+        amount_ranges = _LEGAL_AMOUNT_RANGES.get(crime_type)
+        if amount_ranges is not None:
+            thresholds, ranges = amount_ranges
+            return ranges[bisect_right(thresholds, amount)]
 
-        elif crime_type == "故意伤害罪":
-            # 根据最高检相关解释和刑法规定确定故意伤害罪的法定刑范围
-            injury_range_map = {
-                # 轻伤（三年以下有期徒刑、拘役或者管制）
-                "轻伤一级": (6, 36),   # 1年至3年
-                "轻伤二级": (1, 36),   # 6个月至3年
-
-                # 重伤（三年以上十年以下有期徒刑）
-                "重伤一级": (72, 120), # 6年至10年
-                "重伤二级": (36, 96),  # 3年至8年
-
-                # 致人死亡或特别残忍手段致人重伤造成严重残疾（十年以上有期徒刑、无期徒刑或者死刑）
-                "致人死亡": (120, 180), # 10年至15年
-                "死亡": (120, 180)     # 10年至15年
-            }
+        if crime_type == "故意伤害罪":
             # 默认返回较宽泛的范围
-            return injury_range_map.get(injury_level, (1, 180))
+            return _LEGAL_RANGE_INJURY.get(injury_level, (1, 180))
 
         # 默认
         return (6, 120)
@@ -627,6 +668,39 @@ class SentencingCalculator:
         return months
 
 
+# 地区数额标准的扁平查表：地区名（含城市别名）-> 地区编号 -> (较大, 巨大, 特别巨大)
+_STANDARD_TIERS = ("large", "huge", "especially_huge")
+
+
+def _build_region_tables(standards: dict) -> tuple:
+    """将嵌套的 REGIONAL_STANDARDS 展开为按地区编号索引的阈值表"""
+    region_id = {}
+    theft_thresholds = []
+    fraud_thresholds = []
+    for region, region_standards in standards.items():
+        if region == "cities_to_provinces":
+            continue
+        region_id[region] = len(theft_thresholds)
+        theft_thresholds.append(tuple(region_standards["theft"][k] for k in _STANDARD_TIERS))
+        fraud_thresholds.append(tuple(region_standards["fraud"][k] for k in _STANDARD_TIERS))
+
+    # 地区自身的标准优先于城市到省份的映射
+    for city, province in standards.get("cities_to_provinces", {}).items():
+        region_id.setdefault(city, region_id[province])
+
+    return MappingProxyType(region_id), tuple(theft_thresholds), tuple(fraud_thresholds)
+
+
+# 导入时一次性构建，运行期只读
+_REGION_ID: Final[Mapping[str, int]]
+_REGION_THEFT_THRESHOLDS: Final[Tuple[Tuple[int, int, int], ...]]
+_REGION_FRAUD_THRESHOLDS: Final[Tuple[Tuple[int, int, int], ...]]
+_REGION_ID, _REGION_THEFT_THRESHOLDS, _REGION_FRAUD_THRESHOLDS = _build_region_tables(
+    SentencingCalculator.REGIONAL_STANDARDS
+)
+_DEFAULT_REGION_ID: Final[int] = _REGION_ID["default"]
+
+
 # 工具函数定义（OpenAI Function Calling格式）
 SENTENCING_TOOLS = [
     {
@@ -805,6 +879,9 @@ def execute_tool_call(tool_name: str, tool_arguments: dict) -> str:
     Returns:
         执行结果的JSON字符串
     """
+    # 仅工具调用层需要 json，按需导入以减少只使用计算器时的导入开销
+    import json
+
     calculator = SentencingCalculator()
 
     try:
@@ -818,7 +895,7 @@ def execute_tool_call(tool_name: str, tool_arguments: dict) -> str:
 
         elif tool_name == "calculate_layered_sentence_with_constraints":
             result = calculator.calculate_layered_sentence_with_constraints(**tool_arguments)
-            return json.dumps(result, ensure_ascii=False)
+            return json.dumps(result, ensure_ascii=False, default=_json_default)
 
         elif tool_name == "months_to_range":
             result = calculator.months_to_range(**tool_arguments)
@@ -846,8 +923,10 @@ if __name__ == "__main__":
 
     # 示例2：分层计算
     print("=== 示例2：分层计算 ===")
-    result = calc.calculate_layered_sentence(
+    result = calc.calculate_layered_sentence_with_constraints(
         base_months=100,
+        crime_type="盗窃罪",
+        amount=50000,
         layer1_factors=[
             {"name": "未成年人", "ratio": 0.5},
             {"name": "从犯", "ratio": 0.8}
@@ -1,9 +1,151 @@
 import json
+import sys
+from functools import lru_cache
+from math import prod
+from types import MappingProxyType
 from typing import Dict, List, Union
 
+try:
+    import orjson
+except ImportError:  # orjson 仅用于加速序列化，缺失时回退到标准库 json
+    orjson = None
+
+__all__ = [
+    "SentencingCalculator",
+    "calculate_base_sentence",
+    "calculate_layered_sentence_with_constraints",
+    "months_to_range",
+    "validate_legal_range",
+    "SENTENCING_TOOLS",
+    "SENTENCING_TOOLS_JSON",
+    "execute_tool_call",
+]
+
+
+# 驻留的罪名常量：经 execute_tool_call 驻留后的参数与其比较时可直接命中指针相等
+_GYSHZ = sys.intern("故意伤害罪")
+
+# 需要在工具调用边界驻留的字符串参数
+_INTERNED_ARGS = ("crime_type", "injury_level")
+
+
+def _intern_keys(mapping: dict) -> MappingProxyType:
+    """驻留所有键后返回只读视图"""
+    return MappingProxyType({sys.intern(k): v for k, v in mapping.items()})
+
+
+# 故意伤害罪基准刑标准
+# 轻伤：二年以下有期徒刑、拘役或者管制（1-24个月）
+# 重伤：三年以上十年以下有期徒刑（36-120个月）
+# 致死：十年以上有期徒刑、无期徒刑或者死刑（120个月以上）
+_INJURY_BASE = _intern_keys({
+    "轻伤二级": 15,  # 6个月至2年，取中点1年
+    "轻伤一级": 18,  # 6个月至2年，取中点1.5年
+    "重伤二级": 48,  # 3年至10年，取中点6年
+    "重伤一级": 72,  # 3年至10年，取中点6年
+    "致人死亡": 120, # 10年至15年，取中点10年
+    "死亡": 120,     # 10年至15年，取中点10年
+})
+
+# 根据最高检相关解释和刑法规定确定故意伤害罪的法定刑范围
+_INJURY_RANGE = _intern_keys({
+    # 轻伤（三年以下有期徒刑、拘役或者管制）
+    "轻伤一级": (6, 24),   # 6个月至2年
+    "轻伤二级": (1, 24),   # 6个月至2年
+
+    # 重伤（三年以上十年以下有期徒刑）
+    "重伤一级": (36, 120), # 3年至10年
+    "重伤二级": (36, 120), # 3年至10年
+
+    # 致人死亡或特别残忍手段致人重伤造成严重残疾（十年以上有期徒刑、无期徒刑或者死刑）
+    "致人死亡": (120, 180), # 10年至15年
+    "死亡": (120, 180)     # 10年至15年
+})
+_INJURY_DEFAULT_RANGE = (1, 180)  # 伤害等级未知时的较宽泛范围
+_DEFAULT_RANGE = (6, 120)
+
+def _normalize_factors(factors, with_names: bool = True) -> tuple:
+    """
+    在调用边界统一情节记录的字段
+
+    Args:
+        factors: 情节列表 [{"name": "未成年人", "ratio": 0.5}, ...]，兼容 name 和 factor 两种字段名
+        with_names: 是否解析情节名称（仅记录计算步骤时需要）
+
+    Returns:
+        (调节比例列表, 情节名称列表)；with_names=False 时名称列表为空
+    """
+    if not factors:
+        return [], []
+    ratios = [factor["ratio"] for factor in factors]
+    if not with_names:
+        return ratios, []
+    return ratios, [factor.get("name") or factor.get("factor") for factor in factors]
+
+
+def _layered_kernel(base_months: float, ratios1, ratios2) -> tuple:
+    """
+    分层计算的纯数值部分
+
+    Args:
+        base_months: 基准刑（月）
+        ratios1: 第一层面调节比例（连乘）
+        ratios2: 第二层面调节比例（加减）
+
+    Returns:
+        (第一层面结果, 第二层面初步结果, 第二层面调节比例之和)
+    """
+    current_months = base_months * prod(ratios1) if ratios1 else base_months
+    if not ratios2:
+        return current_months, current_months, 0.0
+
+    layer2_adjustment = sum([ratio - 1.0 for ratio in ratios2])
+    return current_months, current_months * (1.0 + layer2_adjustment), layer2_adjustment
+
+
+# 多名受害者的基准刑倍数，按受害人数索引
+# 对于多名受害者的案件，根据受害人数适当增加基准刑期，每多1人增加50%，最多增加200%
+# 增加的比例基于司法实践中的常见做法
+_VICTIM_MULT = tuple(1.0 + min(0.5 * (i - 1), 2.0) if i >= 1 else 1.0 for i in range(16))
+_VICTIM_MULT_MAX_INDEX = len(_VICTIM_MULT) - 1
+
+
+@lru_cache(maxsize=512)
+def _calc_base_sentence_cached(crime_type: str, injury_level: str, victim_count: int) -> int:
+    """计算基准刑（单位：月），以 (罪名, 伤害等级, 受害人数) 为键缓存"""
+    # ---------- 故意伤害罪 ----------
+    if crime_type == _GYSHZ:
+        base_sentence = _INJURY_BASE.get(injury_level, 12)
+
+        # 如果涉及多名受害者，按受害人数查表增加基准刑期
+        if victim_count and victim_count > 1:
+            if isinstance(victim_count, int):
+                multiplier = _VICTIM_MULT[min(victim_count, _VICTIM_MULT_MAX_INDEX)]
+            else:
+                # 非整数人数（如 2.5）不截断，按原公式计算
+                multiplier = 1.0 + min(0.5 * (victim_count - 1), 2.0)
+            base_sentence = int(base_sentence * multiplier)
+
+        return base_sentence
+
+    # 默认兜底
+    return 12
+
+
+@lru_cache(maxsize=512)
+def _get_legal_range_cached(crime_type: str, injury_level: str) -> tuple:
+    """获取法定刑档位的上下限，以 (罪名, 伤害等级) 为键缓存"""
+    if crime_type == _GYSHZ:
+        return _INJURY_RANGE.get(injury_level, _INJURY_DEFAULT_RANGE)
+
+    # 默认
+    return _DEFAULT_RANGE
+
 
 class SentencingCalculator:
-    """量刑计算器：用于精确计算刑期"""
+    """量刑计算器：用于精确计算刑期（仅含静态方法，无需实例化）"""
+
+    __slots__ = ()
 
 
 
@@ -16,33 +158,8 @@ class SentencingCalculator:
         计算基准刑（单位：月）- 改进版
         采用"档位基准刑 + 超额累进"模式，参考大多数省份标准
         """
-            # ---------- 故意伤害罪 ----------
-        if crime_type == "故意伤害罪":
-            # 故意伤害罪基准刑标准
-            # 轻伤：二年以下有期徒刑、拘役或者管制（1-24个月）
-            # 重伤：三年以上十年以下有期徒刑（36-120个月）
-            # 致死：十年以上有期徒刑、无期徒刑或者死刑（120个月以上）
-            injury_map = {
-                "轻伤二级": 15,  # 6个月至2年，取中点1年
-                "轻伤一级": 18,  # 6个月至2年，取中点1.5年
-                "重伤二级": 48,  # 3年至10年，取中点6年
-                "重伤一级": 72,  # 3年至10年，取中点6年
-                "致人死亡": 120, # 10年至15年，取中点10年
-                "死亡": 120,     # 10年至15年，取中点10年
-            }
-            base_sentence = injury_map.get(injury_level, 12)
-            
-            # 如果涉及多名受害者，增加基准刑期
-            if victim_count and victim_count > 1:
-                # 对于多名受害者的案件，根据受害人数适当增加基准刑期
-                # 增加的比例基于司法实践中的常见做法
-                additional_percentage = min(0.5 * (victim_count - 1), 2.0)  # 最多增加200%
-                base_sentence = int(base_sentence * (1 + additional_percentage))
-                
-            return base_sentence
-
-            # 默认兜底
-        return 12
+        # 当前仅支持故意伤害罪，金额、地区、次数不影响结果，不计入缓存键
+        return _calc_base_sentence_cached(crime_type, injury_level, victim_count)
 
     @staticmethod
     def calculate_layered_sentence_with_constraints(
@@ -53,54 +170,53 @@ class SentencingCalculator:
             layer2_factors: List[Dict[str, Union[str, float]]] = None,
             has_statutory_mitigation: bool = False,  # 是否有法定减轻情节
             injury_level: str = None,  # 伤害等级（用于故意伤害罪）
-            victim_count: int = None   # 受害者人数（用于故意伤害罪）
+            victim_count: int = None,  # 受害者人数（用于故意伤害罪）
+            verbose: bool = True       # 是否记录计算步骤
     ) -> Dict[str, Union[float, str]]:
         """
         分层计算最终刑期 - 增强版,带约束条件
+
+        verbose=False 时不生成计算步骤，calculation_steps 返回空列表
         """
-        steps = []
-        current_months = base_months
-        steps.append(f"基准刑: {base_months}个月")
+        # 第一层面：连乘；第二层面：加减
+        ratios1, names1 = _normalize_factors(layer1_factors, verbose)
+        ratios2, names2 = _normalize_factors(layer2_factors, verbose)
+        current_months, temp_final, layer2_adjustment = _layered_kernel(base_months, ratios1, ratios2)
 
-        # 如果涉及多名受害者，添加说明
-        if victim_count and victim_count > 1:
-            steps.append(f"涉及{victim_count}名受害者，已考虑加重情节")
-
-        # 第一层面：连乘
-        layer1_multiplier = 1.0
-        if layer1_factors:
-            for factor in layer1_factors:
-                # 兼容 name 和 factor 两种字段名
-                name = factor.get("name") or factor.get("factor")
-                ratio = factor["ratio"]
-                layer1_multiplier *= ratio
-                steps.append(f"第一层面 - {name}: ×{ratio}")
-
-            current_months = base_months * layer1_multiplier
-            steps.append(f"第一层面结果: {current_months:.2f}个月")
-
-        # 第二层面：加减
-        layer2_adjustment = 0.0
-        if layer2_factors:
-            for factor in layer2_factors:
-                # 兼容 name 和 factor 两种字段名
-                name = factor.get("name") or factor.get("factor")
-                ratio = factor["ratio"]
-                adjustment = ratio - 1.0
-                layer2_adjustment += adjustment
-                steps.append(f"第二层面 - {name}: {'+' if adjustment > 0 else ''}{adjustment * 100:.0f}%")
-
-            layer2_multiplier = 1.0 + layer2_adjustment
-            temp_final = current_months * layer2_multiplier
-            steps.append(f"第二层面初步结果: {temp_final:.2f}个月")
-        else:
-            temp_final = current_months
+        steps = []
+        if verbose:
+            # 各层面结果在此时均已算出；每个层面的情节汇总为一行，以 " | " 分隔
+            layer1_steps = ()
+            if ratios1:
+                layer1_steps = (
+                    "第一层面: " + " | ".join([f"{name}×{ratio}" for name, ratio in zip(names1, ratios1)]),
+                    f"第一层面结果: {current_months:.2f}个月",
+                )
+            layer2_steps = ()
+            if ratios2:
+                layer2_steps = (
+                    "第二层面: " + " | ".join([
+                        f"{name}{'+' if ratio > 1.0 else ''}{(ratio - 1.0) * 100:.0f}%"
+                        for name, ratio in zip(names2, ratios2)
+                    ]),
+                    f"第二层面初步结果: {temp_final:.2f}个月",
+                )
+
+            steps = [
+                f"基准刑: {base_months}个月",
+                # 如果涉及多名受害者，添加说明
+                *((f"涉及{victim_count}名受害者，已考虑加重情节",) if victim_count and victim_count > 1 else ()),
+                *layer1_steps,
+                *layer2_steps,
+            ]
 
         # 移除所有法定约束检查，只保留基本的有效性检查
         # 确保刑期不低于1个月
-        if temp_final < 1:
-            steps.append(f"⚠️ 调整: 结果({temp_final:.2f}月)低于1个月")
-            steps.append(f"   调整至最低刑期: 1个月")
+        constrained = temp_final < 1
+        if constrained:
+            if verbose:
+                steps.append(f"⚠️ 调整: 结果({temp_final:.2f}月)低于1个月")
+                steps.append(f"   调整至最低刑期: 1个月")
             temp_final = 1
 
         final_months = round(temp_final, 2)
@@ -109,7 +225,7 @@ class SentencingCalculator:
             "final_months": final_months,
             "base_months": base_months,
             "calculation_steps": steps,
-            "constrained": temp_final != current_months * (1.0 + layer2_adjustment)
+            "constrained": constrained
         }
 
     @staticmethod
@@ -117,26 +233,7 @@ class SentencingCalculator:
         """
         获取法定刑档位的上下限
         """
-        if crime_type == "故意伤害罪":
-            # 根据最高检相关解释和刑法规定确定故意伤害罪的法定刑范围
-            injury_range_map = {
-                # 轻伤（三年以下有期徒刑、拘役或者管制）
-                "轻伤一级": (6, 24),   # 6个月至2年
-                "轻伤二级": (1, 24),   # 6个月至2年
-
-                # 重伤（三年以上十年以下有期徒刑）
-                "重伤一级": (36, 120), # 3年至10年
-                "重伤二级": (36, 120), # 3年至10年
-
-                # 致人死亡或特别残忍手段致人重伤造成严重残疾（十年以上有期徒刑、无期徒刑或者死刑）
-                "致人死亡": (120, 180), # 10年至15年
-                "死亡": (120, 180)     # 10年至15年
-            }
-            # 默认返回较宽泛的范围
-            return injury_range_map.get(injury_level, (1, 180))
-
-        # 默认
-        return (6, 120)
+        return _get_legal_range_cached(crime_type, injury_level)
 
     @staticmethod
     def apply_factor(base_months: int, factor_name: str, factor_ratio: float) -> float:
@@ -173,26 +270,22 @@ class SentencingCalculator:
     @staticmethod
     def months_to_range(center_months: float, width: int = 12) -> List[int]:
         """
-        将中心月数转换为刑期区间（修改后版本）
-        
-        新规则：
-        - 下限：对中心月数向下偏移1/3宽度
-        - 上限：对中心月数向上偏移2/3宽度
-        
+        将中心月数转换为刑期区间
+
+        区间宽度取中心月数的15%，并限制在6-12个月之间，以中心月数对称展开；
+        上下限用 round 取整，且不低于1个月。
+
         Args:
             center_months: 中心月数
-            width: 区间宽度（默认12个月）
+            width: 保留参数（实际宽度由中心月数决定）
 
         Returns:
             [最小月数, 最大月数]
         """
-
-        width = max(6, min(12, center_months * 0.15))
-        half_width = width / 2
-        # 确保不低于1个月，同时正确处理浮点数
-        min_months = max(1, round(center_months - half_width))
-        max_months = max(1, round(center_months + half_width))
-        return [min_months, max_months]
+        w = center_months * 0.15
+        half_width = 3.0 if w < 6 else (6.0 if w > 12 else w * 0.5)
+        # round 为银行家舍入（.5 取偶），与原实现保持一致
+        return [max(1, round(center_months - half_width)), max(1, round(center_months + half_width))]
 
 
     @staticmethod
@@ -208,11 +301,31 @@ class SentencingCalculator:
         Returns:
             调整后的合法月数
         """
-        if months < min_legal:
-            return min_legal
-        elif months > max_legal:
-            return max_legal
-        return months
+        return min_legal if months < min_legal else max_legal if months > max_legal else months
+
+    @staticmethod
+    def validate_legal_range_vec(months, min_legal, max_legal):
+        """
+        批量验证并调整刑期（validate_legal_range 的向量化版本）
+
+        Args:
+            months: 计算出的月数数组
+            min_legal: 法定最低月数（标量或与 months 同形的数组）
+            max_legal: 法定最高月数（标量或与 months 同形的数组）
+
+        Returns:
+            调整后的合法月数数组（numpy.ndarray）
+        """
+        import numpy as np
+
+        return np.clip(months, min_legal, max_legal)
+
+
+# 模块级函数别名，调用方与工具分发表可直接引用
+calculate_base_sentence = SentencingCalculator.calculate_base_sentence
+calculate_layered_sentence_with_constraints = SentencingCalculator.calculate_layered_sentence_with_constraints
+months_to_range = SentencingCalculator.months_to_range
+validate_legal_range = SentencingCalculator.validate_legal_range
 
 
 # 工具函数定义（OpenAI Function Calling格式）
@@ -307,6 +420,11 @@ SENTENCING_TOOLS = [
                     "victim_count": {
                         "type": "integer",
                         "description": "受害者人数，适用于故意伤害罪"
+                    },
+                    "verbose": {
+                        "type": "boolean",
+                        "description": "是否返回计算步骤（默认true）",
+                        "default": True
                     }
                 },
                 "required": ["base_months", "crime_type"]
@@ -340,6 +458,49 @@ SENTENCING_TOOLS = [
     }
 ]
 
+# 预序列化的工具定义（UTF-8 JSON bytes）
+# 直接以原始 HTTP 请求发送工具定义时应优先使用该缓存，避免每次请求重新序列化
+if orjson is not None:
+    SENTENCING_TOOLS_JSON: bytes = orjson.dumps(SENTENCING_TOOLS)
+else:
+    SENTENCING_TOOLS_JSON: bytes = json.dumps(SENTENCING_TOOLS, ensure_ascii=False).encode("utf-8")
+
+
+if orjson is not None:
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    def _dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+
+@lru_cache(maxsize=64)
+def _error_response(message: str) -> str:
+    """序列化错误响应；客户端配置错误时同一错误会反复出现，直接复用已序列化的结果"""
+    return _dumps({"error": message})
+
+
+@lru_cache(maxsize=64)
+def _unknown_tool_response(tool_name: str) -> str:
+    return _error_response(f"未知工具: {tool_name}")
+
+
+# 工具名 -> (计算函数, 结果包装函数)
+_DISPATCH = {
+    "calculate_base_sentence": (
+        calculate_base_sentence, lambda r: {"base_months": r}
+    ),
+    "calculate_layered_sentence_with_constraints": (
+        calculate_layered_sentence_with_constraints, lambda r: r
+    ),
+    "months_to_range": (
+        months_to_range, lambda r: {"range": r}
+    ),
+    "validate_legal_range": (
+        validate_legal_range, lambda r: {"validated_months": r}
+    ),
+}
+
 
 def execute_tool_call(tool_name: str, tool_arguments: dict) -> str:
     """
@@ -352,34 +513,20 @@ def execute_tool_call(tool_name: str, tool_arguments: dict) -> str:
     Returns:
         执行结果的JSON字符串
     """
-    calculator = SentencingCalculator()
+    entry = _DISPATCH.get(tool_name)
+    if entry is None:
+        return _unknown_tool_response(tool_name)
 
+    func, wrap = entry
     try:
-        if tool_name == "calculate_base_sentence":
-            result = calculator.calculate_base_sentence(**tool_arguments)
-            return json.dumps({"base_months": result}, ensure_ascii=False)
-
-        # elif tool_name == "calculate_layered_sentence":
-        #     result = calculator.calculate_layered_sentence(**tool_arguments)
-        #     return json.dumps(result, ensure_ascii=False)
-
-        elif tool_name == "calculate_layered_sentence_with_constraints":
-            result = calculator.calculate_layered_sentence_with_constraints(**tool_arguments)
-            return json.dumps(result, ensure_ascii=False)
-
-        elif tool_name == "months_to_range":
-            result = calculator.months_to_range(**tool_arguments)
-            return json.dumps({"range": result}, ensure_ascii=False)
-
-        elif tool_name == "validate_legal_range":
-            result = calculator.validate_legal_range(**tool_arguments)
-            return json.dumps({"validated_months": result}, ensure_ascii=False)
-
-        else:
-            return json.dumps({"error": f"未知工具: {tool_name}"}, ensure_ascii=False)
-
+        # 在副本上驻留字符串参数,不修改调用方的字典;参数不是字典时同样返回错误JSON
+        arguments = {
+            key: sys.intern(value) if key in _INTERNED_ARGS and type(value) is str else value
+            for key, value in tool_arguments.items()
+        }
+        return _dumps(wrap(func(**arguments)))
     except Exception as e:
-        return json.dumps({"error": str(e)}, ensure_ascii=False)
+        return _error_response(str(e))
 
 
 if __name__ == "__main__":
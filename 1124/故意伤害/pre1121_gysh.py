@@ -1,6 +1,15 @@
+import hashlib
 import json
+import logging
 import os
 import re
+import shelve
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from types import SimpleNamespace
 from openai import OpenAI
 from dotenv import load_dotenv
 from cal_gysh import SentencingCalculator, SENTENCING_TOOLS, execute_tool_call
@@ -8,99 +17,132 @@ from cal_gysh import SentencingCalculator, SENTENCING_TOOLS, execute_tool_call
 # 加载环境变量
 load_dotenv()
 
-
-class SentencingPredictor:
+logger = logging.getLogger(__name__)
+
+# 预编译的正则表达式，避免每条数据重复查找 re 模块的内部缓存
+_VICTIM_RE = re.compile(r'故意伤害致(\d+)人')
+_RANGE_RE = re.compile(r'\[\s*(\d+)\s*,\s*(\d+)\s*\]')
+_COMPENSATION_RE = re.compile(r'赔偿(\d+)元')
+_THEFT_COUNT_RE = re.compile(r'盗窃次数(\d+)次')
+_FRAUD_COUNT_RE = re.compile(r'诈骗次数(\d+)次')
+
+# 常见的地区关键词（省份优先，其次城市；同类中按列表顺序优先）
+_PROVINCES = ("北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
+              "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
+              "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
+              "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
+              "香港", "澳门")
+_CITIES = ("江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
+           "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
+           "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
+           "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
+           "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
+           "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州")
+_REGION_NAMES = _PROVINCES + _CITIES
+_REGION_RANK = {name: rank for rank, name in enumerate(_REGION_NAMES)}
+# 零宽先行断言使相互重叠的地名（如"河北京"中的"河北"与"北京"）都能被匹配到，一次扫描即可
+_REGION_RE = re.compile("(?=(" + "|".join(map(re.escape, _REGION_NAMES)) + "))")
+
+# 伤情等级关键词（按优先顺序）-> 计算器使用的伤情等级
+_INJURY_LEVELS = (
+    ("轻伤一级", "轻伤一级"),
+    ("轻伤二级", "轻伤二级"),
+    ("重伤一级", "重伤一级"),
+    ("重伤二级", "重伤二级"),
+    ("死亡", "致人死亡"),
+)
+
+
+# 标准调节比例
+_FACTOR_RATIOS = {
+    # 法定从重情节
+    "累犯": 1.30,
+
+    # 酌定从重情节
+    "前科": 1.10,
+    "多次伤害": 1.20,
+    "主犯": 1.25,
+
+    # 法定从轻、减轻情节
+    "未成年人犯罪": 0.70,
+    "从犯": 0.90,
+    "胁从犯": 0.80,
+    "防卫过当": 0.50,
+    "避险过当": 0.50,
+
+    # 酌定从轻情节
+    "自首": 0.75,
+    "坦白": 0.90,
+    "立功": 0.80,
+    "重大立功": 0.50,
+    "认罪认罚": 0.95,
+    "赔偿全部损失": 0.85,
+    "取得谅解": 0.85,
+    "被害人过错": 0.80
+}
+# 第一层面情节(连乘): 未成年人、从犯、胁从犯、防卫过当、避险过当
+_LAYER1_KEYWORDS = ("未成年人犯罪", "从犯", "胁从犯", "防卫过当", "避险过当")
+# 第二层面情节(加减): 其他情节
+_LAYER2_KEYWORDS = tuple(k for k in _FACTOR_RATIOS if k not in _LAYER1_KEYWORDS)
+
+
+@lru_cache(maxsize=1024)
+def _classify_factor(factor):
     """
-    一个基于大型语言模型的法律量刑预测器。
-    采用"提取-注入-计算"的三步混合法，并集成了权威的、分层的量刑计算规则。
-    支持工具调用，使用专业计算器进行精确的刑期计算。
+    将单个情节按关键词（子串匹配）归入两个层面,返回 (第一层面, 第二层面) 的 (名称, 比例) 元组。
+    情节标签来自固定词表,重复出现的情节直接命中缓存。
     """
+    layer1 = tuple((kw, _FACTOR_RATIOS[kw]) for kw in _LAYER1_KEYWORDS if kw in factor)
+
+    # 特殊处理具体赔偿金额
+    compensation_match = _COMPENSATION_RE.search(factor)
+    if compensation_match:
+        compensation_amount = int(compensation_match.group(1))
+        # 有赔偿时默认调节比例0.85
+        layer2 = ((f"赔偿{compensation_amount}元", 0.85),) if compensation_amount > 0 else ()
+    else:
+        layer2 = tuple((kw, _FACTOR_RATIOS[kw]) for kw in _LAYER2_KEYWORDS if kw in factor)
+    return layer1, layer2
+
+# 法定减轻情节关键词
+_STATUTORY_KEYWORDS = frozenset({
+    "自首", "立功", "重大立功",
+    "未成年人", "已满十四周岁不满十八周岁",
+    "从犯", "胁从犯",
+    "防卫过当", "避险过当",
+    "七十五周岁", "75周岁"
+})
+
+
+def _has_statutory_mitigation(sentencing_factors):
+    """判断量刑情节中是否含有法定减轻情节（关键词子串匹配）"""
+    return any(kw in factor for factor in sentencing_factors for kw in _STATUTORY_KEYWORDS)
+
+
+def _extract_injury_and_victims(sentencing_factors):
+    """
+    一次遍历量刑情节,提取伤情等级和受害人数（均以第一个匹配的情节为准）。
+    未找到受害人数时默认为1。
+    """
+    injury_level = None
+    victim_count = None
+    for factor in sentencing_factors:
+        if injury_level is None:
+            for keyword, level in _INJURY_LEVELS:
+                if keyword in factor:
+                    injury_level = level
+                    break
+        if victim_count is None:
+            # 匹配"故意伤害致X人..."模式
+            match = _VICTIM_RE.search(factor)
+            if match:
+                victim_count = int(match.group(1))
+        if injury_level is not None and victim_count is not None:
+            break
+    return injury_level, victim_count if victim_count is not None else 1
 
-    def __init__(self):
-        """
-        初始化客户端和模型配置。
-        """
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_BASE_URL")
-        )
-        self.model_name = os.getenv("OPENAI_MODEL", "qwen-max")
-        self.temperature_task1 = 1.0 # Task1使用较高温度以增加多样性
-        self.temperature_task2 = 0.1  # Task2使用较低温度以确保稳定性
-        self.max_tokens = 32768
-
-    def identify_crime_type(self, defendant_info, case_description):
-        """
-        增强版的罪名识别函数。
-        优先从指控中识别,其次通过关键词匹配。
-        """
-        text = defendant_info + case_description
-        text = text.replace(" ", "").replace("\n", "")
-
-        # 1. 优先匹配指控罪名,这是最准确的方式
-        charge_match = re.search(r'(因涉嫌|指控犯)(.*?)罪', text)
-        if charge_match:
-            crime = charge_match.group(2)
-            if "盗窃" in crime: return "盗窃罪"
-            if "故意伤害" in crime: return "故意伤害罪"
-            if "诈骗" in crime: return "诈骗罪"
-            if "职务侵占" in crime: return "职务侵占罪"
-
-        # 2. 如果指控不明确,使用关键词作为备用方案
-        theft_keywords = ["盗窃", "窃取", "扒窃", "盗走"]
-        injury_keywords = ["故意伤害", "殴打", "打伤", "轻伤", "重伤"]
-        fraud_keywords = ["诈骗", "骗取", "虚构事实"]
-        embezzlement_keywords = ["职务侵占", "挪用资金", "非法占有"]
-
-        if any(k in text for k in theft_keywords): return "盗窃罪"
-        if any(k in text for k in injury_keywords): return "故意伤害罪"
-        if any(k in text for k in fraud_keywords): return "诈骗罪"
-        if any(k in text for k in embezzlement_keywords): return "职务侵占罪"
-
-        # 3. 默认回退,根据数据集的多数罪名来定,此处以盗窃罪为例
-        return "故意伤害罪"
-
-    def extract_region(self, defendant_info, case_description):
-        """
-        从案件信息中提取地区信息
-        """
-        text = defendant_info + case_description
-        # 常见的地区关键词
-        regions = ["北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
-                   "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
-                   "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
-                   "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
-                   "香港", "澳门"]
-
-        # 常见的城市关键词
-        cities = ["江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
-                  "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
-                  "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
-                  "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
-                  "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
-                  "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州"]
-
-        # 先尝试查找省份
-        for region in regions:
-            if region in text:
-                return region
-
-        # 如果没有找到省份，尝试查找城市
-        for city in cities:
-            if city in text:
-                return city
-
-        # 如果没有找到明确的地区，返回默认值
-        return "default"
-
-    def build_prompt_task1_authoritative(self, defendant_info, case_description):
-        """
-        构建故意伤害罪量刑情节提取Prompt (Task 1)。
-        """
-        crime_type = self.identify_crime_type(defendant_info, case_description)
-        region = self.extract_region(defendant_info, case_description)
-
-        prompt = f"""你是一名只负责【故意伤害罪】的量刑情节标注员，只做“看文书→打标签”的工作，不做复杂法理推理。
+# Task1 提示词的固定部分,模块加载时构建一次,每条数据只拼接案情描述
+_TASK1_PREFIX = """你是一名只负责【故意伤害罪】的量刑情节标注员，只做“看文书→打标签”的工作，不做复杂法理推理。
 
         目标是在不胡编乱造的前提下，**优先保证标签准确和与标注体系的一致性，其次再考虑不要漏掉特别明显、容易识别的情节**。对于边界模糊、把握不大的情节，宁可不标，也不要勉强输出。
 
@@ -248,7 +290,8 @@ class SentencingPredictor:
 
         -------------------------
         【案件信息】
-        案情描述：{case_description}
+        案情描述："""
+_TASK1_SUFFIX = """
         罪名：故意伤害罪
 
         -------------------------
@@ -261,67 +304,31 @@ class SentencingPredictor:
 
         """
 
-        return prompt
+# Task1 批量标注:沿用相同的规则部分,案件信息与输出格式改为多案件版本
+_TASK1_RULES = _TASK1_PREFIX[:_TASK1_PREFIX.index("【案件信息】")]
+_TASK1_BATCH_SUFFIX = """
+        -------------------------
+        【最终输出格式】
 
-    def build_prompt_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
-        """
-        构建故意伤害罪刑期预测Prompt (Task 2)。
-        """
-        # 判断是否有法定减轻情节
-        statutory_mitigation_keywords = [
-            "自首", "立功", "重大立功",
-            "未成年人", "已满十四周岁不满十八周岁",
-            "从犯", "胁从犯",
-            "防卫过当", "避险过当",
-            "七十五周岁", "75周岁"
-        ]
-        has_statutory = any(kw in str(sentencing_factors) for kw in statutory_mitigation_keywords)
+        只输出一个 JSON 二维数组，按案件顺序每个案件对应一个标签数组，数组个数必须与案件数相同，例如（2件案件）：
+        [["故意伤害致1人轻伤二级", "自首", "认罪认罚"], ["故意伤害致1人重伤二级", "坦白", "取得谅解"]]
 
-        crime_type = self.identify_crime_type(defendant_info, case_description)
-        factors_str = "\n- ".join(sentencing_factors)
+        不要输出任何解释文字或Markdown，不要加字段名或嵌套对象。
 
-        # 提取伤情等级和受害人数
-        injury_level = None
-        victim_count = 1  # 默认至少有一个受害者
-        
-        for factor in sentencing_factors:
-            # 提取伤害等级
-            if "轻伤一级" in factor:
-                injury_level = "轻伤一级"
-                break
-            elif "轻伤二级" in factor:
-                injury_level = "轻伤二级"
-                break
-            elif "重伤一级" in factor:
-                injury_level = "重伤一级"
-                break
-            elif "重伤二级" in factor:
-                injury_level = "重伤二级"
-                break
-            elif "死亡" in factor:
-                injury_level = "致人死亡"
-                break
-                
-        # 提取受害人数
-        for factor in sentencing_factors:
-            # 匹配"故意伤害致X人..."模式
-            match = re.search(r'故意伤害致(\d+)人', factor)
-            if match:
-                victim_count = int(match.group(1))
-                break
+        """
 
-        region = self.extract_region(defendant_info, case_description)
+# Task1 提示词版本,提示词改动后结果缓存自动失效
+_TASK1_PROMPT_VERSION = hashlib.sha256(
+    (_TASK1_PREFIX + _TASK1_SUFFIX + _TASK1_BATCH_SUFFIX).encode('utf-8')
+).hexdigest()[:16]
 
-        prompt = f"""你是一位精通量刑计算的刑事法官。你必须使用提供的专业计算器工具来进行精确计算,不要自己估算数值。
+# Task2 的静态提示词（规则与比例表）。放在消息最前面且逐字不变,便于服务端前缀缓存命中;
+# 案件相关的内容由 build_prompt_task2_with_tools 生成,附在其后
+_TASK2_SYSTEM_PROMPT = "你是一位刑事法官,必须使用提供的计算器工具进行精确计算,不要自己估算数值。"
+_STATIC_TASK2_PREFIX = """你是一位精通量刑计算的刑事法官。你必须使用提供的专业计算器工具来进行精确计算,不要自己估算数值。
 
 **重要约束条件:**
-1. 总调节减轻幅度原则上不得超过基准刑的50%(除非有法定减轻情节)
-2. 本案{'有' if has_statutory else '无'}法定减轻情节
-
-**已认定的量刑情节:**
-- {factors_str}
-
-**案件地区:** {region}
+总调节减轻幅度原则上不得超过基准刑的50%(除非有法定减轻情节)
 
 **你的任务:**
 严格按照以下步骤使用工具进行计算:
@@ -380,8 +387,8 @@ class SentencingPredictor:
 - 使用 `calculate_layered_sentence_with_constraints` 工具
 - 传入基准刑、罪名、第一层面情节列表、第二层面情节列表和是否有法定减轻情节
 - 注意：第一层面和第二层面情节需要以如下格式传入：
-  第一层面: [{{"name": "从犯", "ratio": 0.9}}]
-  第二层面: [{{"name": "自首", "ratio": 0.75}}, {{"name": "认罪认罚", "ratio": 0.95}}, ...]
+  第一层面: [{"name": "从犯", "ratio": 0.9}]
+  第二层面: [{"name": "自首", "ratio": 0.75}, {"name": "认罪认罚", "ratio": 0.95}, ...]
   重要：确保使用 "name" 字段而不是 "factor" 字段
 
 **步骤4: 生成刑期区间**
@@ -389,12 +396,162 @@ class SentencingPredictor:
 - 将最终月数转换为合理区间
 
 请按顺序调用工具,完成计算后,输出最终的刑期区间。如果刑期区间下限为0，请调整为1
+"""
+
+
+class LLMCache:
+    """
+    基于SQLite的LLM响应缓存。
+    以 (模型, 温度, 消息, 工具) 的SHA256为键,相同请求直接从本地返回,省去网络往返和token开销。
+    只应用于低温度的确定性调用。
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, resp BLOB, ts REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(model, temperature, messages, tools=None):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "tools": tools, "temperature": temperature},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT resp FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, response_dict):
+        blob = json.dumps(response_dict, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, resp, ts) VALUES (?, ?, ?)",
+                (key, blob, time.time())
+            )
+            self._conn.commit()
+
+
+def _message_to_dict(message):
+    """将助手消息转为可缓存的字典"""
+    return {
+        "content": message.content,
+        "tool_calls": [
+            {"id": tc.id, "name": tc.function.name, "arguments": tc.function.arguments}
+            for tc in message.tool_calls
+        ] if message.tool_calls else None
+    }
+
+
+def _message_from_dict(data):
+    """从缓存字典还原出与SDK返回结构一致的助手消息"""
+    tool_calls = None
+    if data["tool_calls"]:
+        tool_calls = [
+            SimpleNamespace(id=tc["id"], function=SimpleNamespace(name=tc["name"], arguments=tc["arguments"]))
+            for tc in data["tool_calls"]
+        ]
+    return SimpleNamespace(content=data["content"], tool_calls=tool_calls)
+
+
+class SentencingPredictor:
+    """
+    一个基于大型语言模型的法律量刑预测器。
+    采用"提取-注入-计算"的三步混合法，并集成了权威的、分层的量刑计算规则。
+    支持工具调用，使用专业计算器进行精确的刑期计算。
     """
-        return prompt
+
+    def __init__(self):
+        """
+        初始化客户端和模型配置。
+        """
+        self.client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL")
+        )
+        self.model_name = os.getenv("OPENAI_MODEL", "qwen-max")
+        self.temperature_task1 = 1.0 # Task1使用较高温度以增加多样性
+        self.temperature_task2 = 0.1  # Task2使用较低温度以确保稳定性
+        self.max_tokens = 32768
+        # 是否输出逐条数据的详细过程（工具参数、计算步骤等）
+        self.verbose = os.getenv("GYSH_VERBOSE", "").strip().lower() in ("1", "true", "yes")
+        # 计算器无状态,复用同一实例
+        self._calculator = SentencingCalculator()
+        # 并发请求数，应不超过接口允许的并发上限
+        self.max_workers = int(os.getenv("OPENAI_MAX_WORKERS", "8"))
+        # Task1 每次调用合并的案件数,设为1则逐条调用
+        self.task1_batch_size = int(os.getenv("GYSH_TASK1_BATCH_SIZE", "4"))
+        # 每完成多少条数据将进度刷新到磁盘一次
+        self.save_interval = 10
+        # Task2温度较低,结果基本确定,对其响应做本地缓存;Task1温度较高,不缓存。
+        # 仅在设置 LLM_CACHE_PATH(缓存文件路径)时启用
+        llm_cache_path = os.getenv("LLM_CACHE_PATH")
+        self.llm_cache = LLMCache(llm_cache_path) if llm_cache_path else None
+        # 整条结果缓存,重复案件直接复用;仅在设置 GYSH_RESULT_CACHE(缓存文件路径)时启用
+        result_cache_path = os.getenv("GYSH_RESULT_CACHE")
+        self._result_cache = shelve.open(result_cache_path, writeback=False) if result_cache_path else None
+        self._result_cache_lock = threading.Lock()
+
+    def __del__(self):
+        cache = getattr(self, "_result_cache", None)
+        if cache is not None:
+            cache.close()
+
+    def extract_region(self, defendant_info, case_description):
+        """
+        从案件信息中提取地区信息
+        """
+        text = defendant_info + case_description
+
+        # 一次扫描找出所有出现的地区，取优先级最高者（省份先于城市）
+        best = None
+        for match in _REGION_RE.finditer(text):
+            rank = _REGION_RANK[match.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+
+        # 如果没有找到明确的地区，返回默认值
+        return _REGION_NAMES[best] if best is not None else "default"
+
+    def build_prompt_task1_authoritative(self, defendant_info, case_description):
+        """
+        构建故意伤害罪量刑情节提取Prompt (Task 1)。
+        提示词只随案情描述变化。
+        """
+        return _TASK1_PREFIX + case_description + _TASK1_SUFFIX
+
+    def build_prompt_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
+        """
+        构建故意伤害罪刑期预测Prompt (Task 2) 中与案件相关的部分,
+        与 _STATIC_TASK2_PREFIX 分开发送。
+        伤情等级、受害人数由模型调用工具时确定。
+        """
+        # 判断是否有法定减轻情节
+        has_statutory = _has_statutory_mitigation(sentencing_factors)
+        factors_str = "\n- ".join(sentencing_factors)
+
+        region = self.extract_region(defendant_info, case_description)
+
+        return f"""**本案情况:**
+本案{'有' if has_statutory else '无'}法定减轻情节
+
+**已认定的量刑情节:**
+- {factors_str}
+
+**案件地区:** {region}
+"""
 
     def predict_task1_authoritative(self, defendant_info, case_description):
         """
         执行Task 1:提取量刑情节。
+        API调用失败或输出无法解析时返回None,由调用方决定兜底值。
         """
         prompt = self.build_prompt_task1_authoritative(defendant_info, case_description)
         try:
@@ -410,16 +567,59 @@ class SentencingPredictor:
             )
             result_text = response.choices[0].message.content.strip()
 
-            # 使用正则表达式从文本中提取JSON数组
-            json_match = re.search(r'\[.*?\]', result_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(0))
+            # 从文本中提取JSON数组:第一个"["到其后第一个"]"
+            start = result_text.find('[')
+            end = result_text.find(']', start + 1) if start >= 0 else -1
+            if end >= 0:
+                return json.loads(result_text[start:end + 1])
             else:
-                print(f"警告 (Task 1): 未能在输出中找到JSON数组。返回: {result_text}")
-                return ["盗窃数额较大"]  # Fallback
+                logger.warning("警告 (Task 1): 未能在输出中找到JSON数组。返回: %s", result_text)
+                return None
+        except Exception as e:
+            logger.error("错误 (Task 1): API调用或JSON解析失败: %s", e)
+            return None
+
+    def build_prompt_task1_batch(self, case_descriptions):
+        """
+        构建多案件合并的Task 1 Prompt,要求按顺序输出各案件的标签数组。
+        """
+        cases = "\n\n".join(
+            f"        【案件{i}】\n        案情描述：{case_description}"
+            for i, case_description in enumerate(case_descriptions, 1)
+        )
+        return (_TASK1_RULES + f"【案件信息】（共{len(case_descriptions)}件，罪名均为故意伤害罪）\n\n"
+                + cases + "\n" + _TASK1_BATCH_SUFFIX)
+
+    def predict_task1_batch(self, case_descriptions):
+        """
+        执行Task 1的批量版本:一次调用提取多个案件的量刑情节。
+        返回与输入等长的列表;输出无法解析或数量不符时对应位置为None,由调用方逐条重试。
+        """
+        prompt = self.build_prompt_task1_batch(case_descriptions)
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system",
+                     "content": "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.temperature_task1,
+                max_tokens=self.max_tokens
+            )
+            result_text = response.choices[0].message.content.strip()
+
+            start = result_text.find('[')
+            end = result_text.rfind(']')
+            if 0 <= start < end:
+                answers = json.loads(result_text[start:end + 1])
+                if (isinstance(answers, list) and len(answers) == len(case_descriptions)
+                        and all(isinstance(answer, list) for answer in answers)):
+                    return answers
+            logger.warning("警告 (Task 1 批量): 输出格式不符,改为逐条提取。返回: %s", result_text)
         except Exception as e:
-            print(f"错误 (Task 1): API调用或JSON解析失败: {e}")
-            return ["盗窃数额较大"]  # Fallback
+            logger.error("错误 (Task 1 批量): API调用或JSON解析失败: %s", e)
+        return [None] * len(case_descriptions)
 
     def predict_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
         """
@@ -430,9 +630,10 @@ class SentencingPredictor:
 
         prompt = self.build_prompt_task2_with_tools(defendant_info, case_description, sentencing_factors)
 
+        # 静态部分在前、案件部分在后,使各案件共享相同的提示词前缀
         messages = [
-            {"role": "system",
-             "content": "你是一位刑事法官,必须使用提供的计算器工具进行精确计算,不要自己估算数值。"},
+            {"role": "system", "content": _TASK2_SYSTEM_PROMPT},
+            {"role": "user", "content": _STATIC_TASK2_PREFIX},
             {"role": "user", "content": prompt}
         ]
 
@@ -442,30 +643,39 @@ class SentencingPredictor:
 
         for iteration in range(max_iterations):
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    tools=SENTENCING_TOOLS,
-                    temperature=self.temperature_task2,  # Task2使用较低温度
-                    max_tokens=self.max_tokens
-                )
-
-                assistant_message = response.choices[0].message
+                cached = None
+                if self.llm_cache is not None:
+                    cache_key = LLMCache._key(self.model_name, self.temperature_task2, messages, SENTENCING_TOOLS)
+                    cached = self.llm_cache.get(cache_key)
+                if cached is not None:
+                    assistant_message = _message_from_dict(cached)
+                else:
+                    response = self.client.chat.completions.create(
+                        model=self.model_name,
+                        messages=messages,
+                        tools=SENTENCING_TOOLS,
+                        temperature=self.temperature_task2,  # Task2使用较低温度
+                        max_tokens=self.max_tokens
+                    )
+
+                    assistant_message = response.choices[0].message
+                    if self.llm_cache is not None:
+                        self.llm_cache.set(cache_key, _message_to_dict(assistant_message))
 
                 # 如果没有工具调用,说明完成
                 if not assistant_message.tool_calls:
                     content = assistant_message.content
-                    print(f"  模型最终回复: {content}")
+                    logger.debug("  模型最终回复: %s", content)
 
                     # 从最终响应中提取区间
-                    json_match = re.search(r'\[\s*(\d+)\s*,\s*(\d+)\s*\]', content)
+                    json_match = _RANGE_RE.search(content)
                     if json_match:
                         final_range = [int(json_match.group(1)), int(json_match.group(2))]
                         break
                     elif final_range:  # 如果之前已经计算出了区间
                         break
                     else:
-                        print(f"警告: 未找到刑期区间,使用默认值")
+                        logger.warning("警告: 未找到刑期区间,使用默认值")
                         return [6, 12]
 
                 # 添加助手消息
@@ -489,8 +699,9 @@ class SentencingPredictor:
                     function_name = tool_call.function.name
                     function_args = json.loads(tool_call.function.arguments)
 
-                    print(f"  🔧 调用工具: {function_name}")
-                    print(f"     参数: {json.dumps(function_args, ensure_ascii=False)}")
+                    logger.debug("  🔧 调用工具: %s", function_name)
+                    if self.verbose:
+                        logger.debug("     参数: %s", json.dumps(function_args, ensure_ascii=False))
 
                     # 特殊处理：在调用calculate_base_sentence时，提取盗窃次数参数
                     if function_name == "calculate_base_sentence" and "crime_type" in function_args and function_args["crime_type"] == "盗窃罪":
@@ -499,14 +710,14 @@ class SentencingPredictor:
                         for factor in sentencing_factors:
                             if "盗窃次数" in factor:
                                 try:
-                                    theft_count = int(re.search(r'盗窃次数(\d+)次', factor).group(1))
+                                    theft_count = int(_THEFT_COUNT_RE.search(factor).group(1))
                                     break
                                 except:
                                     pass
 
                         if theft_count is not None:
                             function_args["theft_count"] = theft_count
-                            print(f"     添加盗窃次数参数: {theft_count}")
+                            logger.debug("     添加盗窃次数参数: %s", theft_count)
                         
                         # 如果没有盗窃金额，确保amount为None而不是默认值
                         if "amount" not in function_args:
@@ -519,14 +730,14 @@ class SentencingPredictor:
                         for factor in sentencing_factors:
                             if "诈骗次数" in factor:
                                 try:
-                                    fraud_count = int(re.search(r'诈骗次数(\d+)次', factor).group(1))
+                                    fraud_count = int(_FRAUD_COUNT_RE.search(factor).group(1))
                                     break
                                 except:
                                     pass
 
                         if fraud_count is not None:
                             function_args["fraud_count"] = fraud_count
-                            print(f"     添加诈骗次数参数: {fraud_count}")
+                            logger.debug("     添加诈骗次数参数: %s", fraud_count)
                         
                         # 如果没有诈骗金额，确保amount为None而不是默认值
                         if "amount" not in function_args:
@@ -534,42 +745,18 @@ class SentencingPredictor:
 
                     # 特殊处理：在调用calculate_base_sentence时，确保故意伤害罪有injury_level和victim_count参数
                     if function_name == "calculate_base_sentence" and "crime_type" in function_args and function_args["crime_type"] == "故意伤害罪":
+                        # 从量刑情节中提取伤害等级和受害人数
+                        injury_level, victim_count = _extract_injury_and_victims(sentencing_factors)
+
                         # 确保injury_level参数存在
-                        if "injury_level" not in function_args:
-                            # 从量刑情节中提取伤害等级
-                            injury_level = None
-                            for factor in sentencing_factors:
-                                if "轻伤一级" in factor:
-                                    injury_level = "轻伤一级"
-                                    break
-                                elif "轻伤二级" in factor:
-                                    injury_level = "轻伤二级"
-                                    break
-                                elif "重伤一级" in factor:
-                                    injury_level = "重伤一级"
-                                    break
-                                elif "重伤二级" in factor:
-                                    injury_level = "重伤二级"
-                                    break
-                                elif "死亡" in factor or "致人死亡" in factor:
-                                    injury_level = "致人死亡"
-                                    break
+                        if "injury_level" not in function_args and injury_level is not None:
+                            function_args["injury_level"] = injury_level
+                            logger.debug("     添加伤害等级参数: %s", injury_level)
 
-                            if injury_level is not None:
-                                function_args["injury_level"] = injury_level
-                                print(f"     添加伤害等级参数: {injury_level}")
-                        
-                        # 提取受害人数
+                        # 确保victim_count参数存在
                         if "victim_count" not in function_args:
-                            victim_count = 1
-                            for factor in sentencing_factors:
-                                match = re.search(r'故意伤害致(\d+)人', factor)
-                                if match:
-                                    victim_count = int(match.group(1))
-                                    break
-                                    
                             function_args["victim_count"] = victim_count
-                            print(f"     添加受害人数参数: {victim_count}")
+                            logger.debug("     添加受害人数参数: %s", victim_count)
                         
                         # 如果没有伤害金额，确保amount为None而不是默认值
                         if "amount" not in function_args:
@@ -577,7 +764,7 @@ class SentencingPredictor:
 
                     # 执行工具
                     function_response = execute_tool_call(function_name, function_args)
-                    print(f"     结果: {function_response}")
+                    logger.debug("     结果: %s", function_response)
 
                     # 检查是否是最终的区间结果
                     if function_name == "months_to_range":
@@ -595,14 +782,18 @@ class SentencingPredictor:
                         "content": function_response
                     })
 
+                # months_to_range 已返回区间即为最终结果,无需再请求模型复述
+                if final_range is not None:
+                    break
+
             except Exception as e:
-                print(f"工具调用错误: {e}")
+                logger.error("工具调用错误: %s", e)
                 return [6, 12]  # Fallback
 
         if final_range:
             return final_range
         else:
-            print("警告: 达到最大迭代次数但未获得结果")
+            logger.warning("警告: 达到最大迭代次数但未获得结果")
             return [6, 12]  # Fallback
 
     def predict_task2_direct_calculation(self, defendant_info, case_description, sentencing_factors):
@@ -613,122 +804,28 @@ class SentencingPredictor:
             sentencing_factors = ["犯罪情节较轻"]
 
         # 判断是否有法定减轻情节
-        statutory_mitigation_keywords = [
-            "自首", "立功", "重大立功",
-            "未成年人", "已满十四周岁不满十八周岁",
-            "从犯", "胁从犯",
-            "防卫过当", "避险过当",
-            "七十五周岁", "75周岁"
-        ]
-        has_statutory = any(kw in str(sentencing_factors) for kw in statutory_mitigation_keywords)
+        has_statutory = _has_statutory_mitigation(sentencing_factors)
 
         # 提取伤情等级和受害人数
-        injury_level = None
-        victim_count = 1  # 默认至少有一个受害者
-        
-        for factor in sentencing_factors:
-            # 提取伤害等级
-            if "轻伤一级" in factor:
-                injury_level = "轻伤一级"
-                break
-            elif "轻伤二级" in factor:
-                injury_level = "轻伤二级"
-                break
-            elif "重伤一级" in factor:
-                injury_level = "重伤一级"
-                break
-            elif "重伤二级" in factor:
-                injury_level = "重伤二级"
-                break
-            elif "死亡" in factor:
-                injury_level = "致人死亡"
-                break
-                
-        # 提取受害人数
-        for factor in sentencing_factors:
-            # 匹配"故意伤害致X人..."模式
-            match = re.search(r'故意伤害致(\d+)人', factor)
-            if match:
-                victim_count = int(match.group(1))
-                break
+        injury_level, victim_count = _extract_injury_and_victims(sentencing_factors)
 
         # 步骤1: 计算基准刑
-        calculator = SentencingCalculator()
+        calculator = self._calculator
         base_sentence_result = calculator.calculate_base_sentence(
             crime_type="故意伤害罪",
             injury_level=injury_level,
             victim_count=victim_count
         )
-        print(f"  基准刑: {base_sentence_result}个月")
+        logger.debug("  基准刑: %s个月", base_sentence_result)
 
         # 步骤2: 分析和分层情节
-        # 定义标准调节比例
-        factor_ratios = {
-            # 法定从重情节
-            "累犯": 1.30,
-            
-            # 酌定从重情节
-            "前科": 1.10,
-            "多次伤害": 1.20,
-            "主犯": 1.25,
-            
-            # 法定从轻、减轻情节
-            "未成年人犯罪": 0.70,
-            "从犯": 0.90,
-            "胁从犯": 0.80,
-            "防卫过当": 0.50,
-            "避险过当": 0.50,
-            
-            # 酌定从轻情节
-            "自首": 0.75,
-            "坦白": 0.90,
-            "立功": 0.80,
-            "重大立功": 0.50,
-            "认罪认罚": 0.95,
-            "赔偿全部损失": 0.85,
-            "取得谅解": 0.85,
-            "被害人过错": 0.80
-        }
-        
-        # 第一层面情节(连乘): 未成年人、从犯、胁从犯、防卫过当、避险过当
-        layer1_keywords = ["未成年人犯罪", "从犯", "胁从犯", "防卫过当", "避险过当"]
         layer1_factors = []
-        for factor in sentencing_factors:
-            for keyword in layer1_keywords:
-                if keyword in factor:
-                    if keyword in factor_ratios:
-                        layer1_factors.append({
-                            "name": keyword,
-                            "ratio": factor_ratios[keyword]
-                        })
-        
-        # 第二层面情节(加减): 其他情节
-        layer2_keywords = [k for k in factor_ratios.keys() if k not in layer1_keywords]
         layer2_factors = []
-        # 特殊处理赔偿金额
-        compensation_amount = 0
         for factor in sentencing_factors:
-            # 处理具体赔偿金额
-            compensation_match = re.search(r'赔偿(\d+)元', factor)
-            if compensation_match:
-                compensation_amount = int(compensation_match.group(1))
-                # 根据赔偿金额确定调节比例
-                compensation_factor = 0.85  # 默认有赔偿
-                if compensation_amount > 0:
-                    layer2_factors.append({
-                        "name": f"赔偿{compensation_amount}元",
-                        "ratio": compensation_factor
-                    })
-            else:
-                # 处理其他情节
-                for keyword in layer2_keywords:
-                    if keyword in factor:
-                        if keyword in factor_ratios:
-                            layer2_factors.append({
-                                "name": keyword,
-                                "ratio": factor_ratios[keyword]
-                            })
-        
+            layer1_matches, layer2_matches = _classify_factor(factor)
+            layer1_factors.extend({"name": name, "ratio": ratio} for name, ratio in layer1_matches)
+            layer2_factors.extend({"name": name, "ratio": ratio} for name, ratio in layer2_matches)
+
         # 步骤3: 计算最终刑期
         final_sentence_result = calculator.calculate_layered_sentence_with_constraints(
             base_months=base_sentence_result,
@@ -737,134 +834,169 @@ class SentencingPredictor:
             layer2_factors=layer2_factors,
             has_statutory_mitigation=has_statutory,
             injury_level=injury_level,
-            victim_count=victim_count
+            victim_count=victim_count,
+            verbose=self.verbose  # 不输出时跳过计算步骤的生成
         )
         
-        print("  计算步骤:")
-        for step in final_sentence_result['calculation_steps']:
-            print(f"    {step}")
+        if self.verbose:
+            logger.debug("  计算步骤:\n%s", "\n".join(f"    {step}" for step in final_sentence_result['calculation_steps']))
         
         final_months = final_sentence_result['final_months']
-        print(f"  最终刑期: {final_months}个月")
+        logger.debug("  最终刑期: %s个月", final_months)
 
         # 步骤4: 生成刑期区间
         range_result = calculator.months_to_range(final_months)
-        print(f"  刑期区间: {range_result}")
+        logger.debug("  刑期区间: %s", range_result)
         
         return range_result
 
-    def process_all_data(self, preprocessed_data, output_file):
+    def _result_cache_key(self, case_description):
         """
-        主处理流程:遍历所有数据,执行两阶段预测,并保存结果。
+        结果缓存键:模型、Task1提示词版本和温度任一变化都不会命中旧结果。
         """
-        results = []
-
-        for idx, item in enumerate(preprocessed_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(preprocessed_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
-
-            answer1, answer2 = [], []
-            try:
-                # 第一步:调用权威版 Task 1 预测,提取量刑情节
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    item['defendant_info'],
-                    item['case_description']
-                )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                # 第二步:使用直接计算进行刑期预测
-                print("\n【步骤2: 使用直接计算刑期】")
-                answer2 = self.predict_task2_direct_calculation(
-                    item['defendant_info'],
-                    item['case_description'],
-                    answer1,
-                )
-                print(f"✓ 预测刑期区间: {answer2}")
+        payload = json.dumps(
+            [self.model_name, _TASK1_PROMPT_VERSION, self.temperature_task1, case_description],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["盗窃数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
+    def _get_cached_result(self, cache_key):
+        """
+        查找已缓存的 (answer1, answer2),未命中或未启用缓存时返回None。
+        """
+        if self._result_cache is None:
+            return None
+        with self._result_cache_lock:
+            return self._result_cache.get(cache_key)
 
-            result = {
-                "id": item['id'],
+    def _process_one(self, idx, total, item_id, defendant_info, case_description, answer1=None):
+        """
+        处理单条数据:执行两阶段预测,返回结果。
+        answer1 为批量 Task1 已提取的情节,传入时跳过 Task1 调用。
+        """
+        if self.verbose:
+            logger.debug("\n%s\n处理第 %d/%d 条数据 (ID: %s)\n%s", '=' * 60, idx + 1, total, item_id, '=' * 60)
+
+        # 相同案情描述已处理过时直接返回缓存结果（同一模型与提示词下Task1/Task2只依赖案情描述）
+        cache_key = self._result_cache_key(case_description)
+        cached = self._get_cached_result(cache_key)
+        if cached is not None:
+            answer1, answer2 = cached
+            logger.info("【最终结果 ID: %s】(缓存) 答案1 (情节提取): %s 答案2 (刑期预测): %s", item_id, answer1, answer2)
+            return {
+                "id": item_id,
                 "answer1": answer1,
                 "answer2": answer2
             }
-            results.append(result)
-
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
 
-            # 每处理10条数据保存一次,防止意外中断丢失进度
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
+        answer2 = []
+        # Task1 失败时使用兜底情节,该结果不写入缓存
+        task1_failed = False
+        try:
+            # 第一步:调用权威版 Task 1 预测,提取量刑情节
+            logger.debug("\n【步骤1: 提取量刑情节】")
+            if answer1 is None:
+                answer1 = self.predict_task1_authoritative(defendant_info, case_description)
+            if answer1 is None:
+                task1_failed = True
+                answer1 = ["盗窃数额较大"]  # Fallback
+            logger.debug("✓ 提取到的情节: %s", answer1)
+
+            # 第二步:使用直接计算进行刑期预测
+            logger.debug("\n【步骤2: 使用直接计算刑期】")
+            answer2 = self.predict_task2_direct_calculation(
+                defendant_info,
+                case_description,
+                answer1,
+            )
+            logger.debug("✓ 预测刑期区间: %s", answer2)
 
-        # 最终保存所有结果
-        self._save_results(results, output_file)
-        print(f"\n所有数据处理完成,结果已保存至: {output_file}")
-        return results
+            if self._result_cache is not None and not task1_failed:
+                with self._result_cache_lock:
+                    self._result_cache[cache_key] = (answer1, answer2)
 
-    def process_fact_data(self, fact_data, output_file):
-        """
-        处理fact格式的数据（新格式）
-        """
-        results = []
+        except Exception as e:
+            logger.error("!!! 处理ID %s 时发生未知严重错误: %s", item_id, e)
+            answer1 = answer1 if answer1 else ["盗窃数额较大"]
+            answer2 = answer2 if answer2 else [6, 12]
 
-        for idx, item in enumerate(fact_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(fact_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
+        logger.info("【最终结果 ID: %s】 答案1 (情节提取): %s 答案2 (刑期预测): %s", item_id, answer1, answer2)
 
-            answer1, answer2 = [], []
-            try:
-                # 第一步:调用权威版 Task 1 预测,提取量刑情节
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    "",  # 被告人信息为空
-                    item['fact']  # 使用fact字段作为案情描述
-                )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                # 第二步:使用直接计算进行刑期预测
-                print("\n【步骤2: 使用直接计算刑期】")
-                # 从案件信息中提取地区
-                answer2 = self.predict_task2_direct_calculation(
-                    "",  # 被告人信息为空
-                    item['fact'],  # 使用fact字段作为案情描述
-                    answer1,
-                )
-                print(f"✓ 预测刑期区间: {answer2}")
+        return {
+            "id": item_id,
+            "answer1": answer1,
+            "answer2": answer2
+        }
 
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["盗窃数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
+    def _process_batch(self, start, chunk, total):
+        """
+        处理一组连续的数据:未命中缓存的案件合并为一次 Task1 调用,Task2 逐条本地计算。
+        """
+        answers1 = [None] * len(chunk)
+        pending = [i for i, item in enumerate(chunk) if self._get_cached_result(self._result_cache_key(item[2])) is None]
+        if len(pending) > 1:
+            batch_answers = self.predict_task1_batch([chunk[i][2] for i in pending])
+            for i, answer1 in zip(pending, batch_answers):
+                answers1[i] = answer1
+        return [
+            self._process_one(start + i, total, *item, answer1=answers1[i])
+            for i, item in enumerate(chunk)
+        ]
 
-            result = {
-                "id": item['id'],
-                "answer1": answer1,
-                "answer2": answer2
+    def _process_items(self, items, output_file):
+        """
+        并发处理 (id, 被告人信息, 案情描述) 列表,结果按输入顺序保存。
+        各案件相互独立,LLM调用期间线程释放GIL,多个请求可同时在途。
+        """
+        total = len(items)
+        results = [None] * total
+
+        # 完成一条追加一条,中断时已完成的结果不会丢失;文件保持打开,定期刷新
+        with open(output_file, 'w', encoding='utf-8') as out, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # 每个任务处理 task1_batch_size 条连续数据
+            batch_size = max(1, self.task1_batch_size)
+            futures = {
+                executor.submit(self._process_batch, start, items[start:start + batch_size], total): start
+                for start in range(0, total, batch_size)
             }
-            results.append(result)
+            done = 0
+            for future in as_completed(futures):
+                for offset, result in enumerate(future.result()):
+                    results[futures[future] + offset] = result
+                    self._append_result(result, out)
+
+                    done += 1
+                    if done % self.save_interval == 0:
+                        logger.info("--- 进度保存:已处理 %d 条数据 ---", done)
+                        out.flush()
+
+        # 追加顺序为完成顺序,最后按输入顺序整理一次
+        self._save_results(results, output_file)
+        logger.info("所有数据处理完成,结果已保存至: %s", output_file)
+        return results
 
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
+    def process_all_data(self, preprocessed_data, output_file):
+        """
+        主处理流程:遍历所有数据,执行两阶段预测,并保存结果。
+        """
+        items = [(item['id'], item['defendant_info'], item['case_description']) for item in preprocessed_data]
+        return self._process_items(items, output_file)
 
-            # 每处理10条数据保存一次,防止意外中断丢失进度
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
+    def process_fact_data(self, fact_data, output_file):
+        """
+        处理fact格式的数据（新格式）
+        """
+        # 被告人信息为空,使用fact字段作为案情描述
+        items = [(item['id'], "", item['fact']) for item in fact_data]
+        return self._process_items(items, output_file)
 
-        # 最终保存所有结果
-        self._save_results(results, output_file)
-        print(f"\n所有数据处理完成,结果已保存至: {output_file}")
-        return results
+    @staticmethod
+    def _append_result(result, f):
+        """
+        将单条结果以jsonl格式追加到已打开的文件。
+        """
+        f.write(json.dumps(result, ensure_ascii=False) + '\n')
 
     def _save_results(self, results, output_file):
         """
@@ -913,6 +1045,9 @@ def main():
     """
     主函数:初始化并运行整个预测流程。
     """
+    # 设置 GYSH_VERBOSE=1 输出逐条数据的详细过程
+    verbose = os.getenv("GYSH_VERBOSE", "").strip().lower() in ("1", "true", "yes")
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format="%(message)s")
     # 配置文件路径
     preprocessed_file = "extracted_info_fusai1.json"
     fact_file = "data/gysh.jsonl"
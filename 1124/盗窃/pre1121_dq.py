@@ -1,112 +1,313 @@
+import asyncio
 import json
+import logging
 import os
 import re
-from openai import OpenAI
+from types import SimpleNamespace
+from typing import List, Optional, Pattern
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from cal_dq import SentencingCalculator, SENTENCING_TOOLS, execute_tool_call
 
+try:
+    import orjson
+except ImportError:  # orjson 仅用于加速解析和序列化，缺失时回退到标准库 json
+    orjson = None
+
+try:
+    from tqdm import tqdm
+except ImportError:  # tqdm 仅用于显示进度条，缺失时改为按条输出进度日志
+    tqdm = None
+
+logger = logging.getLogger(__name__)
+
+# 解析与序列化 JSON(输入数据、模型输出、工具参数/结果、结果文件)
+_loads = orjson.loads if orjson is not None else json.loads
+
+if orjson is not None:
+    def _dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
 # 加载环境变量
 load_dotenv()
 
+# 接口配置只在导入时读取一次
+_API_KEY = os.getenv("OPENAI_API_KEY")
+_BASE_URL = os.getenv("OPENAI_BASE_URL")
+_MODEL_NAME = os.getenv("OPENAI_MODEL", "qwen-max")
+_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+# 设置 DQ_VERBOSE=1 输出逐条数据的详细过程
+_VERBOSE = os.getenv("DQ_VERBOSE", "").strip().lower() in ("1", "true", "yes")
+
+# 按案情长度分箱的边界(字符数):短于500、500~2000、2000以上
+_LENGTH_BINS = (500, 2000)
+
+# Task1 不把多个案件合并到同一个请求中:自回归解码耗时与输出token总数成正比,
+# 合并后一次请求要依次生成所有案件的标签,反而比多个独立请求并发更慢。
+# 每个案件单独调用 chat.completions.create,吞吐量由并发数（max_concurrency）提升。
+BATCH_MERGE = False
+
+# Task2 默认只让模型做一次情节分层,再在本地用计算器算出刑期;
+# 置为 True 时改用多轮工具调用,由模型逐步调用计算器。
+TASK2_USE_TOOLS = False
+
+# 预编译的正则表达式，避免每条数据、每轮工具调用重复查找 re 模块的内部缓存
+# 指控罪名
+_CHARGE_RE = re.compile(r'(因涉嫌|指控犯)(.*?)罪')
+# 模型输出中的JSON数组、刑期区间
+_JSON_ARRAY_RE = re.compile(r'\[.*?\]', re.DOTALL)
+_RANGE_RE = re.compile(r'\[\s*(\d+)\s*,\s*(\d+)\s*\]')
+# 量刑情节中的金额、次数
+_AMOUNT_RE = re.compile(r'(\d+\.?\d*)元')
+_THEFT_COUNT_RE = re.compile(r'盗窃次数(\d+)次')
+_FRAUD_COUNT_RE = re.compile(r'诈骗次数(\d+)次')
+# Task2 分层结果中的 JSON 对象
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+# 法定减轻情节关键词,合并为一个正则只扫描一遍
+_STATUTORY_RE = re.compile("|".join([
+    "自首", "立功", "重大立功",
+    "未成年人", "已满十四周岁不满十八周岁",
+    "从犯", "胁从犯",
+    "犯罪中止", "犯罪未遂", "犯罪预备",
+    "防卫过当", "避险过当",
+    "七十五周岁", "75周岁"
+]))
+# 指控不明确时按关键词识别罪名,按顺序优先
+_CRIME_KEYWORD_PATTERNS = (
+    ("盗窃罪", re.compile("盗窃|窃取|扒窃|盗走")),
+    ("故意伤害罪", re.compile("故意伤害|殴打|打伤|轻伤|重伤")),
+    ("诈骗罪", re.compile("诈骗|骗取|虚构事实")),
+    ("职务侵占罪", re.compile("职务侵占|挪用资金|非法占有")),
+)
+
+# 常见的地区关键词（省份优先，其次城市；同类中按列表顺序优先）
+_PROVINCES = ("北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
+              "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
+              "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
+              "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
+              "香港", "澳门")
+_CITIES = ("江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
+           "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
+           "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
+           "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
+           "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
+           "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州")
+_REGION_NAMES = _PROVINCES + _CITIES
+_REGION_RANK = {name: rank for rank, name in enumerate(_REGION_NAMES)}
+# 零宽先行断言使相互重叠的地名（如"河北京"中的"河北"与"北京"）都能被匹配到，一次扫描即可
+_REGION_RE = re.compile("(?=(" + "|".join(map(re.escape, _REGION_NAMES)) + "))")
+
+
+def _identify_crime_type(defendant_info: str, case_description: str) -> str:
+    """
+    增强版的罪名识别函数。
+    优先从指控中识别,其次通过关键词匹配。
+    """
+    text = defendant_info + case_description
+    text = text.replace(" ", "").replace("\n", "")
 
-class SentencingPredictor:
+    # 1. 优先匹配指控罪名,这是最准确的方式
+    charge_match = _CHARGE_RE.search(text)
+    if charge_match:
+        crime = charge_match.group(2)
+        if "盗窃" in crime: return "盗窃罪"
+        if "故意伤害" in crime: return "故意伤害罪"
+        if "诈骗" in crime: return "诈骗罪"
+        if "职务侵占" in crime: return "职务侵占罪"
+
+    # 2. 如果指控不明确,使用关键词作为备用方案
+    for crime_type, pattern in _CRIME_KEYWORD_PATTERNS:
+        if pattern.search(text):
+            return crime_type
+
+    # 3. 默认回退,根据数据集的多数罪名来定,此处以盗窃罪为例
+    return "盗窃罪"
+
+
+def _extract_region(defendant_info: str, case_description: str) -> str:
     """
-    一个基于大型语言模型的法律量刑预测器。
-    采用"提取-注入-计算"的三步混合法，并集成了权威的、分层的量刑计算规则。
-    支持工具调用，使用专业计算器进行精确的刑期计算。
+    从案件信息中提取地区信息
     """
+    text = defendant_info + case_description
 
-    def __init__(self):
-        """
-        初始化客户端和模型配置。
-        """
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_BASE_URL")
-        )
-        self.model_name = os.getenv("OPENAI_MODEL", "qwen-max")
-        self.temperature_task1 = 0.1  # Task1使用较高温度以增加多样性
-        self.temperature_task2 = 0.1  # Task2使用较低温度以确保稳定性
-        self.max_tokens = 32768
+    # 一次扫描找出所有出现的地区，取优先级最高者（省份先于城市）
+    best = None
+    for match in _REGION_RE.finditer(text):
+        rank = _REGION_RANK[match.group(1)]
+        if best is None or rank < best:
+            best = rank
+            if rank == 0:
+                break
 
-    def identify_crime_type(self, defendant_info, case_description):
-        """
-        增强版的罪名识别函数。
-        优先从指控中识别,其次通过关键词匹配。
-        """
-        text = defendant_info + case_description
-        text = text.replace(" ", "").replace("\n", "")
+    # 如果没有找到明确的地区，返回默认值
+    return _REGION_NAMES[best] if best is not None else "default"
 
-        # 1. 优先匹配指控罪名,这是最准确的方式
-        charge_match = re.search(r'(因涉嫌|指控犯)(.*?)罪', text)
-        if charge_match:
-            crime = charge_match.group(2)
-            if "盗窃" in crime: return "盗窃罪"
-            if "故意伤害" in crime: return "故意伤害罪"
-            if "诈骗" in crime: return "诈骗罪"
-            if "职务侵占" in crime: return "职务侵占罪"
 
-        # 2. 如果指控不明确,使用关键词作为备用方案
-        theft_keywords = ["盗窃", "窃取", "扒窃", "盗走"]
-        injury_keywords = ["故意伤害", "殴打", "打伤", "轻伤", "重伤"]
-        fraud_keywords = ["诈骗", "骗取", "虚构事实"]
-        embezzlement_keywords = ["职务侵占", "挪用资金", "非法占有"]
+def _extract_amount(sentencing_factors: List[str]) -> Optional[float]:
+    """
+    从量刑情节中提取盗窃或诈骗既遂金额,未找到时返回 None
+    """
+    for factor in sentencing_factors:
+        if "盗窃金额既遂" in factor or "诈骗金额既遂" in factor:
+            # 确保我们提取的是盗窃或诈骗金额，而不是退赔金额
+            if "退赔" not in factor and "退赃" not in factor:
+                try:
+                    return float(_AMOUNT_RE.search(factor).group(1))
+                except:
+                    return None
+    return None
+
+
+def _extract_count(sentencing_factors: List[str], keyword: str, count_re: Pattern) -> Optional[int]:
+    """
+    从量刑情节中提取盗窃/诈骗次数,未找到时返回 None
+    """
+    for factor in sentencing_factors:
+        if keyword in factor:
+            try:
+                return int(count_re.search(factor).group(1))
+            except:
+                pass
+    return None
+
+
+# 可在本地直接分层的情节标签及其调节比例,与 Task2 提示词中的"标准调节比例参考"一致
+_FACTOR_TO_RATIO = {
+    # 第一层面(连乘)
+    "未成年人": ("layer1", 0.7),
+    "未成年人犯罪": ("layer1", 0.7),
+    "从犯": ("layer1", 0.9),
+    "胁从犯": ("layer1", 0.8),
+    "犯罪预备": ("layer1", 0.5),
+    "犯罪中止": ("layer1", 0.5),
+    "犯罪未遂": ("layer1", 0.5),
+    # 第二层面(加减)
+    "累犯": ("layer2", 1.30),
+    "前科": ("layer2", 1.10),
+    "多次盗窃": ("layer2", 1.13),
+    "多次诈骗": ("layer2", 1.13),
+    "多次犯罪": ("layer2", 1.13),
+    "入户盗窃": ("layer2", 1.30),
+    "携带凶器盗窃": ("layer2", 1.2),
+    "扒窃": ("layer2", 1.1),
+    "主犯": ("layer2", 1.25),
+    "自首": ("layer2", 0.75),
+    "坦白": ("layer2", 0.75),
+    "立功": ("layer2", 0.8),
+    "重大立功": ("layer2", 0.5),
+    "认罪认罚": ("layer2", 0.95),
+    "取得谅解": ("layer2", 0.90),
+}
+# 退赃/退赔(含金额)统一按 0.75 调节
+_RESTITUTION_RE = re.compile(r'^(退赔|退赃)')
+_RESTITUTION_RATIO = 0.75
+# 不调节刑期的标签:既遂金额、数额档次、次数(已用于基准刑)以及汇总性标签
+_NEUTRAL_FACTOR_RE = re.compile(
+    r'^(?:(?:盗窃|诈骗|职务侵占)金额既遂\d+(?:\.\d+)?元'
+    r'|(?:盗窃|诈骗|职务侵占)数额(?:较大|巨大|特别巨大)'
+    r'|(?:盗窃|诈骗)次数\d+次'
+    r'|法定减轻|犯罪情节较轻)$'
+)
+
+
+def _classify_factors_locally(sentencing_factors: List[str]) -> Optional[tuple]:
+    """
+    所有情节都能按固定比例表分层时,返回 (第一层面, 第二层面) 情节列表;
+    只要有一个情节不在表中就返回 None,交由模型分层。
+    """
+    layer1, layer2 = [], []
+    for factor in sentencing_factors:
+        factor = factor.strip()
+        if factor in _FACTOR_TO_RATIO:
+            layer, ratio = _FACTOR_TO_RATIO[factor]
+            (layer1 if layer == "layer1" else layer2).append({"name": factor, "ratio": ratio})
+        elif _RESTITUTION_RE.match(factor):
+            layer2.append({"name": factor, "ratio": _RESTITUTION_RATIO})
+        elif not _NEUTRAL_FACTOR_RE.match(factor):
+            return None
+    return layer1, layer2
+
+
+_STANDARDS = SentencingCalculator.REGIONAL_STANDARDS
+
+_EMBEZZLEMENT_STANDARDS_TEXT = """**河南职务侵占罪数额标准:**
+- **数额较大**: 6万元以上不满100万元
+- **数额巨大**: 100万元以上不满1500万元
+- **数额特别巨大**: 1500万元以上"""
 
-        if any(k in text for k in theft_keywords): return "盗窃罪"
-        if any(k in text for k in injury_keywords): return "故意伤害罪"
-        if any(k in text for k in fraud_keywords): return "诈骗罪"
-        if any(k in text for k in embezzlement_keywords): return "职务侵占罪"
+_GENERAL_STANDARDS_TEXT = """**全国通用数额标准参考:**
+- **盗窃罪**:
+  - 数额较大: 1000元以上不满30000元
+  - 数额巨大: 30000元以上不满300000元
+  - 数额特别巨大: 300000元以上
+- **诈骗罪**:
+  - 数额较大: 3000元以上不满30000元
+  - 数额巨大: 30000元以上不满500000元
+  - 数额特别巨大: 500000元以上"""
 
-        # 3. 默认回退,根据数据集的多数罪名来定,此处以盗窃罪为例
-        return "盗窃罪"
 
-    def extract_region(self, defendant_info, case_description):
-        """
-        从案件信息中提取地区信息
-        """
-        text = defendant_info + case_description
-        # 常见的地区关键词
-        regions = ["北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
-                   "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
-                   "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
-                   "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
-                   "香港", "澳门"]
-
-        # 常见的城市关键词
-        cities = ["江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
-                  "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
-                  "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
-                  "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
-                  "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
-                  "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州"]
-
-        # 先尝试查找省份
-        for region in regions:
-            if region in text:
-                return region
-
-        # 如果没有找到省份，尝试查找城市
-        for city in cities:
-            if city in text:
-                return city
-
-        # 如果没有找到明确的地区，返回默认值
-        return "default"
-
-    def build_prompt_task1_authoritative(self, defendant_info, case_description):
-        """
-        构建权威版的量刑情节提取Prompt (Task 1)。
-        Prompt内容严格依据官方量刑指导意见中的情节分类。
-        """
-        crime_type = self.identify_crime_type(defendant_info, case_description)
+def _format_amount_standards(crime_type: str, region: str) -> str:
+    """
+    按地区数额标准生成盗窃罪/诈骗罪的提示文本
+    """
+    # 获取地区标准
+    if region in _STANDARDS:
+        standards = _STANDARDS[region]
+    elif region in _STANDARDS.get("cities_to_provinces", {}):
+        standards = _STANDARDS[_STANDARDS["cities_to_provinces"][region]]
+    else:
+        standards = _STANDARDS["default"]
+
+    if crime_type == "盗窃罪" and "theft" in standards:
+        theft_standards = standards["theft"]
+        return f"""**{region}盗窃罪数额标准:**
+- **数额较大**: {theft_standards['large']}元以上不满{theft_standards['huge']}元
+- **数额巨大**: {theft_standards['huge']}元以上不满{theft_standards['especially_huge']}元
+- **数额特别巨大**: {theft_standards['especially_huge']}元以上"""
 
-        # 获取地区信息
-        region = self.extract_region(defendant_info, case_description)
+    elif crime_type == "诈骗罪" and "fraud" in standards:
+        fraud_standards = standards["fraud"]
+        return f"""**{region}诈骗罪数额标准:**
+- **数额较大**: {fraud_standards['large']}元以上不满{fraud_standards['huge']}元
+- **数额巨大**: {fraud_standards['huge']}元以上不满{fraud_standards['especially_huge']}元
+- **数额特别巨大**: {fraud_standards['especially_huge']}元以上"""
+
+    return _GENERAL_STANDARDS_TEXT
+
+
+# 导入时为所有可能识别出的地区预先生成数额标准文本,构建提示词时直接取用
+_FORMATTED_STANDARDS = {
+    (crime_type, region): _format_amount_standards(crime_type, region)
+    for crime_type in ("盗窃罪", "诈骗罪")
+    for region in _REGION_NAMES + ("default",)
+}
 
-        # 构建地区特定的数额标准说明
-        amount_standards = self._get_amount_standards_for_prompt(crime_type, region)
 
-        prompt = f"""你是一位极其严谨的刑事法官。你的任务是阅读案件事实,按照中国刑法以及量刑指导意见,从中**系统、完整且准确地**提取所有对量刑有影响的关键情节。
+def _get_amount_standards_for_prompt(crime_type: str, region: str) -> str:
+    """
+    根据罪名和地区的数额标准生成提示信息
+    """
+    text = _FORMATTED_STANDARDS.get((crime_type, region))
+    if text is not None:
+        return text
+    if crime_type == "职务侵占罪":
+        # 使用河南标准作为默认
+        return _EMBEZZLEMENT_STANDARDS_TEXT
+    if crime_type in ("盗窃罪", "诈骗罪"):
+        return _format_amount_standards(crime_type, region)
+    # 默认标准
+    return _GENERAL_STANDARDS_TEXT
+
+
+# 提示词中的静态部分只在导入时构建一次,构建时只拼接案件相关的少量动态内容。
+# 动态内容(罪名、地区、数额标准、案情、情节)一律放在提示词末尾,
+# 使各案件请求的前缀逐字节相同,便于服务端复用前缀缓存(prefix caching)。
+_TASK1_STATIC = """你是一位极其严谨的刑事法官。你的任务是阅读案件事实,按照中国刑法以及量刑指导意见,从中**系统、完整且准确地**提取所有对量刑有影响的关键情节。
 
 请在内部按如下两个阶段进行推理,但最终**只输出最后的情节标签 JSON 数组**,不要展示你的推理过程。
 
@@ -168,8 +369,7 @@ class SentencingPredictor:
 - "诈骗数额较大" / "诈骗数额巨大" / "诈骗数额特别巨大"
 - "职务侵占数额较大" / "职务侵占数额巨大" / "职务侵占数额特别巨大"
 
-**数额判断标准（基于案件地区）**:
-{amount_standards}
+**数额判断标准（基于案件地区）**: 见文末【案件信息】中的"地区数额标准"。
 
 3. 次数与多次犯罪:
 - "盗窃次数X次"
@@ -218,12 +418,6 @@ class SentencingPredictor:
 - 如果某类信息原文完全没有,就不要输出该类标签。
 - 如果两个标签含义完全重复,只保留一种最标准表达。
 
--------------------------
-【案件信息】
-案情描述: {case_description}
-本案罪名(初步判断): {crime_type}
-案件地区: {region}
-
 -------------------------
 【最终输出格式要求】
 
@@ -233,101 +427,11 @@ class SentencingPredictor:
 - 不要输出键名、字段名, 也不要套一层对象, 直接输出数组本身。
 
 """
-        return prompt
-
-    def _get_amount_standards_for_prompt(self, crime_type, region):
-        """
-        根据罪名和地区的数额标准生成提示信息
-        """
-        # 导入计算器中的标准
-        from cal_dq import SentencingCalculator
-
-        # 获取地区标准
-        if region in SentencingCalculator.REGIONAL_STANDARDS:
-            standards = SentencingCalculator.REGIONAL_STANDARDS[region]
-        elif region in SentencingCalculator.REGIONAL_STANDARDS.get("cities_to_provinces", {}):
-            province = SentencingCalculator.REGIONAL_STANDARDS["cities_to_provinces"][region]
-            standards = SentencingCalculator.REGIONAL_STANDARDS[province]
-        else:
-            standards = SentencingCalculator.REGIONAL_STANDARDS["default"]
-
-        # 生成提示文本
-        if crime_type == "盗窃罪" and "theft" in standards:
-            theft_standards = standards["theft"]
-            return f"""**{region}盗窃罪数额标准:**
-- **数额较大**: {theft_standards['large']}元以上不满{theft_standards['huge']}元
-- **数额巨大**: {theft_standards['huge']}元以上不满{theft_standards['especially_huge']}元
-- **数额特别巨大**: {theft_standards['especially_huge']}元以上"""
-
-        elif crime_type == "诈骗罪" and "fraud" in standards:
-            fraud_standards = standards["fraud"]
-            return f"""**{region}诈骗罪数额标准:**
-- **数额较大**: {fraud_standards['large']}元以上不满{fraud_standards['huge']}元
-- **数额巨大**: {fraud_standards['huge']}元以上不满{fraud_standards['especially_huge']}元
-- **数额特别巨大**: {fraud_standards['especially_huge']}元以上"""
-
-        elif crime_type == "职务侵占罪":
-            # 使用河南标准作为默认
-            return """**河南职务侵占罪数额标准:**
-- **数额较大**: 6万元以上不满100万元
-- **数额巨大**: 100万元以上不满1500万元
-- **数额特别巨大**: 1500万元以上"""
 
-        else:
-            # 默认标准
-            return """**全国通用数额标准参考:**
-- **盗窃罪**:
-  - 数额较大: 1000元以上不满30000元
-  - 数额巨大: 30000元以上不满300000元
-  - 数额特别巨大: 300000元以上
-- **诈骗罪**:
-  - 数额较大: 3000元以上不满30000元
-  - 数额巨大: 30000元以上不满500000元
-  - 数额特别巨大: 500000元以上"""
-
-    def build_prompt_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
-        """
-        构建支持工具调用的刑期预测Prompt (Task 2)。
-        模型将使用计算器工具进行精确的刑期计算。
-        """
-        # 判断是否有法定减轻情节
-        statutory_mitigation_keywords = [
-            "自首", "立功", "重大立功",
-            "未成年人", "已满十四周岁不满十八周岁",
-            "从犯", "胁从犯",
-            "犯罪中止", "犯罪未遂", "犯罪预备",
-            "防卫过当", "避险过当",
-            "七十五周岁", "75周岁"
-        ]
-        has_statutory = any(kw in str(sentencing_factors) for kw in statutory_mitigation_keywords)
-
-        crime_type = self.identify_crime_type(defendant_info, case_description)
-        factors_str = "\n- ".join(sentencing_factors)
-
-        # 提取金额用于计算
-        amount = None
-        for factor in sentencing_factors:
-            if "盗窃金额既遂" in factor or "诈骗金额既遂" in factor:
-                # 确保我们提取的是盗窃或诈骗金额，而不是退赔金额
-                if "退赔" not in factor and "退赃" not in factor:
-                    try:
-                        amount = float(re.search(r'(\d+\.?\d*)元', factor).group(1))
-                    except:
-                        pass
-                    break
-
-        # 提取地区信息
-        region = self.extract_region(defendant_info, case_description)
-
-        prompt = f"""你是一位精通量刑计算的刑事法官。你必须使用提供的专业计算器工具来进行精确计算,不要自己估算数值。
+_TASK2_STATIC = """你是一位精通量刑计算的刑事法官。你必须使用提供的专业计算器工具来进行精确计算,不要自己估算数值。
  **重要约束条件:**
     1. 总调节减轻幅度原则上不得超过基准刑的50%(除非有法定减轻情节)
-    2. 本案{'有' if has_statutory else '无'}法定减轻情节
-
-**已认定的量刑情节:**
-- {factors_str}
-
-**案件地区:** {region}
+    2. 本案是否有法定减轻情节、已认定的量刑情节和案件地区见文末【案件信息】
 
 **你的任务:**
 严格按照以下步骤使用工具进行计算:
@@ -339,7 +443,7 @@ class SentencingPredictor:
 - 工具会根据地区性的数额标准以及罪名相关的量刑规范，计算出准确的基准刑月份。
 
 **步骤2: 分析和分层情节**
-从上述情节中,识别:
+从已认定的量刑情节中,识别:
 - **第一层面情节(连乘)**: 未成年人、从犯、胁从犯、犯罪预备、犯罪中止、犯罪未遂
 - **第二层面情节(加减)**: 累犯、自首、坦白、立功、认罪认罚、退赔、取得谅解、前科、多次盗窃、多次犯罪
 
@@ -381,8 +485,8 @@ class SentencingPredictor:
 - 使用 `calculate_layered_sentence_with_constraints` 工具
 - 传入基准刑、罪名、金额、第一层面情节列表、第二层面情节列表和是否有法定减轻情节
 - 注意：第一层面和第二层面情节需要以如下格式传入：
-  第一层面: [{{"name": "从犯", "ratio": 0.9}}]
-  第二层面: [{{"name": "自首", "ratio": 0.8}}, {{"name": "认罪认罚", "ratio": 0.95}}, ...]
+  第一层面: [{"name": "从犯", "ratio": 0.9}]
+  第二层面: [{"name": "自首", "ratio": 0.8}, {"name": "认罪认罚", "ratio": 0.95}, ...]
   重要：确保使用 "name" 字段而不是 "factor" 字段
 
 **步骤4: 生成刑期区间**
@@ -391,82 +495,366 @@ class SentencingPredictor:
 
 请按顺序调用工具,完成计算后,输出最终的刑期区间。如果刑期区间下限为0，请调整为1
 """
-        return prompt
 
-    def predict_task1_authoritative(self, defendant_info, case_description):
+# Task2 工具调用中,完成基准刑/分层计算后把之前的多轮对话压缩为一段进度说明
+_CONDENSED_TOOLS = frozenset({"calculate_base_sentence", "calculate_layered_sentence_with_constraints"})
+_TASK2_PROGRESS_HEADER = "\n【已完成的计算步骤】(以下结果已由计算器给出,请在此基础上继续下一步,不要重复调用)\n"
+
+# Task2 直接计算:模型只负责情节分层,调节比例参考沿用工具调用版的说明
+_TASK2_DIRECT_STATIC = """你是一位精通量刑计算的刑事法官。请将文末列出的已认定量刑情节划分为第一层面和第二层面,并给出每个情节的调节比例。
+基准刑和最终刑期由计算器在本地计算,你不需要计算刑期。
+
+""" + _TASK2_STATIC[
+    _TASK2_STATIC.index("**步骤2: 分析和分层情节**"):_TASK2_STATIC.index("**步骤3: 计算最终刑期**")
+] + """**输出格式要求:**
+- 只输出一个 JSON 对象, 不要输出任何解释或 Markdown, 例如:
+  {"layer1": [{"name": "从犯", "ratio": 0.9}], "layer2": [{"name": "自首", "ratio": 0.75}, {"name": "认罪认罚", "ratio": 0.95}], "has_statutory": true}
+- 金额、次数、数额档次等不调节刑期的情节不要放入任何层面。
+- has_statutory 表示是否存在法定减轻情节。
+"""
+
+_TASK1_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"
+}
+_TASK2_DIRECT_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "你是一位刑事法官,精通量刑情节的分层与调节比例,只输出要求的 JSON 对象。"
+}
+_TASK2_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "你是一位刑事法官,必须使用提供的计算器工具进行精确计算,不要自己估算数值。请根据案件信息判断案件所在地区，如无法判断则使用默认标准。"
+}
+
+
+class SentencingPredictor:
+    """
+    一个基于大型语言模型的法律量刑预测器。
+    采用"提取-注入-计算"的三步混合法，并集成了权威的、分层的量刑计算规则。
+    支持工具调用，使用专业计算器进行精确的刑期计算。
+    """
+
+    def __init__(self):
+        """
+        初始化客户端和模型配置。
+        """
+        # 异步客户端在每次运行(_process_items)开始时创建,结束时关闭
+        self.client = None
+        self.model_name = _MODEL_NAME
+        self.temperature_task1 = 0.1  # Task1使用较高温度以增加多样性
+        self.temperature_task2 = 0.1  # Task2使用较低温度以确保稳定性
+        # 单次输出上限:Task1 只输出标签数组,Task2 只输出工具调用参数或区间;
+        # 过大的上限会让服务端为每个请求预留更多 KV 缓存,降低可并发的批量
+        self.max_tokens_task1 = 512
+        self.max_tokens_task2 = 1024
+        # 同时处理的数据条数上限,应不超过接口允许的并发数
+        self.max_concurrency = _MAX_CONCURRENCY
+        # 结果文件每写入 flush_interval 条刷新一次缓冲,每 fsync_interval 条强制落盘一次
+        self.flush_interval = 32
+        self.fsync_interval = 256
+        # 是否输出逐条数据的详细过程(工具参数等)
+        self.verbose = _VERBOSE
+
+    @staticmethod
+    def _create_client():
+        """
+        创建异步客户端,多条数据的请求可同时在途;遇到限流时由SDK按 retry-after 自动退避重试。
+        显式配置连接池,保持长连接复用,避免并发请求反复进行 TCP/TLS 握手。
+        连接池绑定到当前事件循环,因此每次运行单独创建。
+        """
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=128, max_keepalive_connections=64),
+            timeout=httpx.Timeout(600.0, connect=10.0)
+        )
+        return AsyncOpenAI(
+            api_key=_API_KEY,
+            base_url=_BASE_URL,
+            max_retries=_MAX_RETRIES,
+            http_client=http_client
+        )
+
+    def identify_crime_type(self, defendant_info, case_description):
+        """
+        增强版的罪名识别函数。
+        优先从指控中识别,其次通过关键词匹配。
+        """
+        return _identify_crime_type(defendant_info, case_description)
+
+    def extract_region(self, defendant_info, case_description):
+        """
+        从案件信息中提取地区信息
+        """
+        return _extract_region(defendant_info, case_description)
+
+    async def _stream_message(self, stop_re=None, **kwargs):
+        """
+        以流式方式请求模型,拼装出与非流式返回结构一致的助手消息。
+        输出因达到 max_tokens 被截断时,将上限放宽一倍重试一次。
+        """
+        message = await self._stream_once(stop_re, **kwargs)
+        if message.finish_reason == "length":
+            logger.warning("警告: 输出达到 max_tokens=%s 被截断,放宽上限重试", kwargs["max_tokens"])
+            kwargs["max_tokens"] *= 2
+            message = await self._stream_once(stop_re, **kwargs)
+        return message
+
+    async def _stream_once(self, stop_re=None, **kwargs):
+        """
+        发起一次流式请求并拼装助手消息。
+        正文中已出现 stop_re 的匹配且没有工具调用时提前关闭流,不再等待模型继续输出;
+        因为只取第一个匹配,提前结束不影响解析结果。
+        """
+        stream = await self.client.chat.completions.create(stream=True, **kwargs)
+        parts = []
+        tool_calls = {}
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                delta = choice.delta
+                if delta.content:
+                    parts.append(delta.content)
+                    if stop_re is not None and not tool_calls and stop_re.search("".join(parts)):
+                        break
+                # 工具调用的参数分片到达,按 index 拼接
+                for tc in delta.tool_calls or ():
+                    entry = tool_calls.setdefault(tc.index, {"id": None, "name": "", "arguments": ""})
+                    if tc.id:
+                        entry["id"] = tc.id
+                    if tc.function is not None:
+                        if tc.function.name:
+                            entry["name"] += tc.function.name
+                        if tc.function.arguments:
+                            entry["arguments"] += tc.function.arguments
+        finally:
+            await stream.close()
+
+        return SimpleNamespace(
+            content="".join(parts) if parts else None,
+            tool_calls=[
+                SimpleNamespace(id=entry["id"],
+                                function=SimpleNamespace(name=entry["name"], arguments=entry["arguments"]))
+                for _, entry in sorted(tool_calls.items())
+            ] or None,
+            finish_reason=finish_reason
+        )
+
+    def build_prompt_task1_authoritative(self, defendant_info, case_description, crime_type=None, region=None):
+        """
+        构建权威版的量刑情节提取Prompt (Task 1)。
+        Prompt内容严格依据官方量刑指导意见中的情节分类。
+        crime_type/region 可由调用方预先计算传入,未传入时自行识别。
+        """
+        if crime_type is None:
+            crime_type = self.identify_crime_type(defendant_info, case_description)
+
+        # 获取地区信息
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
+
+        # 构建地区特定的数额标准说明
+        amount_standards = self._get_amount_standards_for_prompt(crime_type, region)
+
+        return "".join([
+            _TASK1_STATIC,
+            "-------------------------\n【案件信息】\n本案罪名(初步判断): ", crime_type,
+            "\n案件地区: ", region,
+            "\n地区数额标准:\n", amount_standards,
+            "\n案情描述: ", case_description, "\n",
+        ])
+
+    def _get_amount_standards_for_prompt(self, crime_type, region):
+        """
+        根据罪名和地区的数额标准生成提示信息
+        """
+        return _get_amount_standards_for_prompt(crime_type, region)
+
+    def build_prompt_task2_with_tools(self, defendant_info, case_description, sentencing_factors,
+                                      crime_type=None, region=None):
+        """
+        构建支持工具调用的刑期预测Prompt (Task 2)。
+        模型将使用计算器工具进行精确的刑期计算。
+        """
+        # 判断是否有法定减轻情节
+        has_statutory = bool(_STATUTORY_RE.search("\n".join(sentencing_factors)))
+        factors_str = "\n- ".join(sentencing_factors)
+
+        # 提取地区信息
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
+
+        return "".join([
+            _TASK2_STATIC,
+            "\n【案件信息】\n本案", "有" if has_statutory else "无", "法定减轻情节",
+            "\n\n**已认定的量刑情节:**\n- ", factors_str,
+            "\n\n**案件地区:** ", region, "\n",
+        ])
+
+    async def predict_task1_authoritative(self, defendant_info, case_description, crime_type=None, region=None):
         """
         执行Task 1:提取量刑情节。
+        每次只处理一个案件（见 BATCH_MERGE）。
         """
-        prompt = self.build_prompt_task1_authoritative(defendant_info, case_description)
+        prompt = self.build_prompt_task1_authoritative(defendant_info, case_description, crime_type, region)
         try:
-            response = self.client.chat.completions.create(
+            # JSON数组一闭合即停止接收
+            message = await self._stream_message(
+                _JSON_ARRAY_RE,
                 model=self.model_name,
-                messages=[
-                    {"role": "system",
-                     "content": "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=[_TASK1_SYSTEM_MESSAGE, {"role": "user", "content": prompt}],
                 temperature=self.temperature_task1,  # Task1使用较高温度
-                max_tokens=self.max_tokens
+                max_tokens=self.max_tokens_task1
             )
-            result_text = response.choices[0].message.content.strip()
+            result_text = message.content.strip()
 
             # 使用正则表达式从文本中提取JSON数组
-            json_match = re.search(r'\[.*?\]', result_text, re.DOTALL)
+            json_match = _JSON_ARRAY_RE.search(result_text)
             if json_match:
-                return json.loads(json_match.group(0))
+                return _loads(json_match.group(0))
             else:
-                print(f"警告 (Task 1): 未能在输出中找到JSON数组。返回: {result_text}")
+                logger.warning("警告 (Task 1): 未能在输出中找到JSON数组。返回: %s", result_text)
                 return ["盗窃数额较大"]  # Fallback
         except Exception as e:
-            print(f"错误 (Task 1): API调用或JSON解析失败: {e}")
+            logger.error("错误 (Task 1): API调用或JSON解析失败: %s", e)
             return ["盗窃数额较大"]  # Fallback
 
-    def predict_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
+    async def predict_task2_direct(self, defendant_info, case_description, sentencing_factors,
+                                   crime_type=None, region=None):
+        """
+        执行Task 2:一次模型调用完成情节分层,再在本地依次调用计算器
+        (基准刑 -> 分层调节 -> 区间),省去多轮工具调用的往返。
+        分层结果无法解析时回退到工具调用版。
+        """
+        if not sentencing_factors:
+            sentencing_factors = ["犯罪情节较轻"]
+        if crime_type is None:
+            crime_type = self.identify_crime_type(defendant_info, case_description)
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
+
+        # 情节全部可按比例表分层时不调用模型
+        local_layers = _classify_factors_locally(sentencing_factors)
+        if local_layers is not None:
+            return self._calculate_range(sentencing_factors, crime_type, region, *local_layers)
+
+        prompt = "".join([_TASK2_DIRECT_STATIC, "\n**已认定的量刑情节:**\n- ", "\n- ".join(sentencing_factors), "\n"])
+        try:
+            message = await self._stream_message(
+                model=self.model_name,
+                messages=[_TASK2_DIRECT_SYSTEM_MESSAGE, {"role": "user", "content": prompt}],
+                temperature=self.temperature_task2,
+                max_tokens=self.max_tokens_task2
+            )
+            json_match = _JSON_OBJECT_RE.search(message.content or "")
+            layers = _loads(json_match.group(0))
+            layer1 = [{"name": f.get("name") or f.get("factor"), "ratio": float(f["ratio"])}
+                      for f in layers.get("layer1") or []]
+            layer2 = [{"name": f.get("name") or f.get("factor"), "ratio": float(f["ratio"])}
+                      for f in layers.get("layer2") or []]
+        except Exception as e:
+            logger.warning("警告 (Task 2): 情节分层解析失败,改用工具调用: %s", e)
+            return await self.predict_task2_with_tools(defendant_info, case_description, sentencing_factors,
+                                                       crime_type, region)
+
+        has_statutory = layers.get("has_statutory")
+        if not isinstance(has_statutory, bool):
+            has_statutory = None
+        return self._calculate_range(sentencing_factors, crime_type, region, layer1, layer2, has_statutory)
+
+    def _calculate_range(self, sentencing_factors, crime_type, region, layer1, layer2, has_statutory=None):
+        """
+        在本地依次调用计算器(基准刑 -> 分层调节 -> 区间)得到刑期区间。
+        has_statutory 为 None 时按情节关键词判断是否有法定减轻情节。
+        """
+        if has_statutory is None:
+            has_statutory = bool(_STATUTORY_RE.search("\n".join(sentencing_factors)))
+
+        amount = _extract_amount(sentencing_factors)
+        try:
+            base_months = SentencingCalculator.calculate_base_sentence(
+                crime_type,
+                amount=amount,
+                region=region,
+                theft_count=_extract_count(sentencing_factors, "盗窃次数", _THEFT_COUNT_RE)
+                if crime_type == "盗窃罪" else None,
+                fraud_count=_extract_count(sentencing_factors, "诈骗次数", _FRAUD_COUNT_RE)
+                if crime_type == "诈骗罪" else None,
+            )
+            result = SentencingCalculator.calculate_layered_sentence_with_constraints(
+                base_months, crime_type, amount, layer1, layer2, has_statutory
+            )
+            final_range = SentencingCalculator.months_to_range(result["final_months"])
+        except Exception as e:
+            logger.error("错误 (Task 2): 本地计算失败: %s", e)
+            return [6, 12]  # Fallback
+
+        logger.debug("  基准刑: %s个月, 最终刑期: %s个月, 区间: %s", base_months, result['final_months'], final_range)
+        return final_range
+
+    async def predict_task2_with_tools(self, defendant_info, case_description, sentencing_factors,
+                                       crime_type=None, region=None):
         """
         执行Task 2:使用工具调用进行刑期预测。
         """
         if not sentencing_factors:
             sentencing_factors = ["犯罪情节较轻"]
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
 
-        prompt = self.build_prompt_task2_with_tools(defendant_info, case_description, sentencing_factors)
+        # 情节全部可按比例表分层时不调用模型
+        local_layers = _classify_factors_locally(sentencing_factors)
+        if local_layers is not None:
+            if crime_type is None:
+                crime_type = self.identify_crime_type(defendant_info, case_description)
+            return self._calculate_range(sentencing_factors, crime_type, region, *local_layers)
 
-        messages = [
-            {"role": "system",
-             "content": "你是一位刑事法官,必须使用提供的计算器工具进行精确计算,不要自己估算数值。请根据案件信息判断案件所在地区，如无法判断则使用默认标准。"},
-            {"role": "user", "content": prompt}
-        ]
+        # 金额与次数在进入工具调用循环前一次性解析,循环内直接补入参数
+        parsed = {
+            "amount": _extract_amount(sentencing_factors),
+            "theft_count": _extract_count(sentencing_factors, "盗窃次数", _THEFT_COUNT_RE),
+            "fraud_count": _extract_count(sentencing_factors, "诈骗次数", _FRAUD_COUNT_RE),
+        }
+
+        prompt = self.build_prompt_task2_with_tools(defendant_info, case_description, sentencing_factors,
+                                                    crime_type, region)
+
+        messages = [_TASK2_SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
 
         # 多轮对话处理工具调用
         max_iterations = 10
         final_range = None
+        completed_steps = []
 
         for iteration in range(max_iterations):
             try:
-                response = self.client.chat.completions.create(
+                # 最终回复中出现刑期区间即停止接收
+                assistant_message = await self._stream_message(
+                    _RANGE_RE,
                     model=self.model_name,
                     messages=messages,
                     tools=SENTENCING_TOOLS,
                     temperature=self.temperature_task2,  # Task2使用较低温度
-                    max_tokens=self.max_tokens
+                    max_tokens=self.max_tokens_task2
                 )
 
-                assistant_message = response.choices[0].message
-
                 # 如果没有工具调用,说明完成
                 if not assistant_message.tool_calls:
                     content = assistant_message.content
-                    print(f"  模型最终回复: {content}")
+                    logger.debug("  模型最终回复: %s", content)
 
                     # 从最终响应中提取区间
-                    json_match = re.search(r'\[\s*(\d+)\s*,\s*(\d+)\s*\]', content)
+                    json_match = _RANGE_RE.search(content)
                     if json_match:
                         final_range = [int(json_match.group(1)), int(json_match.group(2))]
                         break
                     elif final_range:  # 如果之前已经计算出了区间
                         break
                     else:
-                        print(f"警告: 未找到刑期区间,使用默认值")
+                        logger.warning("警告: 未找到刑期区间,使用默认值")
                         return [6, 12]
 
                 # 添加助手消息
@@ -486,65 +874,33 @@ class SentencingPredictor:
                 })
 
                 # 执行工具调用
+                condense = False
                 for tool_call in assistant_message.tool_calls:
                     function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-
-                    print(f"  🔧 调用工具: {function_name}")
-                    print(f"     参数: {json.dumps(function_args, ensure_ascii=False)}")
-
-                    # 特殊处理：在调用calculate_base_sentence时，提取盗窃次数参数
-                    if function_name == "calculate_base_sentence" and "crime_type" in function_args and function_args["crime_type"] == "盗窃罪":
-                        # 从量刑情节中提取盗窃次数
-                        theft_count = None
-                        for factor in sentencing_factors:
-                            if "盗窃次数" in factor:
-                                try:
-                                    theft_count = int(re.search(r'盗窃次数(\d+)次', factor).group(1))
-                                    break
-                                except:
-                                    pass
-
-                        if theft_count is not None:
-                            function_args["theft_count"] = theft_count
-                            print(f"     添加盗窃次数参数: {theft_count}")
-                        
-                        # 如果没有盗窃金额，确保amount为None而不是默认值
-                        if "amount" not in function_args:
-                            function_args["amount"] = None
-
-                    # 特殊处理：在调用calculate_base_sentence时，提取诈骗次数参数
-                    if function_name == "calculate_base_sentence" and "crime_type" in function_args and function_args["crime_type"] == "诈骗罪":
-                        # 从量刑情节中提取诈骗次数
-                        fraud_count = None
-                        for factor in sentencing_factors:
-                            if "诈骗次数" in factor:
-                                try:
-                                    fraud_count = int(re.search(r'诈骗次数(\d+)次', factor).group(1))
-                                    break
-                                except:
-                                    pass
-
-                        if fraud_count is not None:
-                            function_args["fraud_count"] = fraud_count
-                            print(f"     添加诈骗次数参数: {fraud_count}")
-                        
-                        # 如果没有诈骗金额，确保amount为None而不是默认值
-                        if "amount" not in function_args:
-                            function_args["amount"] = None
+                    function_args = _loads(tool_call.function.arguments)
+
+                    logger.debug("  🔧 调用工具: %s", function_name)
+                    if self.verbose:
+                        logger.debug("     参数: %s", _dumps(function_args))
+
+                    # 特殊处理：调用calculate_base_sentence时补入预先解析的次数参数
+                    if function_name == "calculate_base_sentence":
+                        count_key = {"盗窃罪": "theft_count", "诈骗罪": "fraud_count"}.get(function_args.get("crime_type"))
+                        if count_key is not None:
+                            if parsed[count_key] is not None:
+                                function_args[count_key] = parsed[count_key]
+                                logger.debug("     添加次数参数 %s: %s", count_key, parsed[count_key])
+                            # 如果模型没有传入金额，使用情节中的金额（没有则为None）
+                            function_args.setdefault("amount", parsed["amount"])
 
                     # 执行工具
                     function_response = execute_tool_call(function_name, function_args)
-                    print(f"     结果: {function_response}")
+                    logger.debug("     结果: %s", function_response)
+                    result_data = _loads(function_response)
 
                     # 检查是否是最终的区间结果
-                    if function_name == "months_to_range":
-                        try:
-                            result_data = json.loads(function_response)
-                            if "range" in result_data:
-                                final_range = result_data["range"]
-                        except:
-                            pass
+                    if function_name == "months_to_range" and "range" in result_data:
+                        final_range = result_data["range"]
 
                     # 添加工具响应
                     messages.append({
@@ -553,139 +909,165 @@ class SentencingPredictor:
                         "content": function_response
                     })
 
+                    if function_name in _CONDENSED_TOOLS and "error" not in result_data:
+                        completed_steps.append(
+                            f"- {function_name}: 参数 {_dumps(function_args)}"
+                            f" → 结果 {function_response}"
+                        )
+                        condense = True
+
+                # 基准刑或分层结果已经算出:丢弃之前的助手/工具消息,只把结果附在提示词末尾,
+                # 避免每轮请求重复发送不断增长的对话历史
+                if condense:
+                    messages = [
+                        _TASK2_SYSTEM_MESSAGE,
+                        {"role": "user", "content": "".join([prompt, _TASK2_PROGRESS_HEADER, "\n".join(completed_steps)])}
+                    ]
+
             except Exception as e:
-                print(f"工具调用错误: {e}")
+                logger.error("工具调用错误: %s", e)
                 return [6, 12]  # Fallback
 
         if final_range:
             return final_range
         else:
-            print("警告: 达到最大迭代次数但未获得结果")
+            logger.warning("警告: 达到最大迭代次数但未获得结果")
             return [6, 12]  # Fallback
 
-    def process_all_data(self, preprocessed_data, output_file):
+    async def _process_one(self, idx, total, item_id, defendant_info, case_description):
         """
-        主处理流程:遍历所有数据,执行两阶段预测,并保存结果。
+        处理单条数据:执行两阶段预测,返回结果。
         """
-        results = []
+        if self.verbose:
+            logger.debug("\n%s\n处理第 %d/%d 条数据 (ID: %s)\n%s", '=' * 60, idx + 1, total, item_id, '=' * 60)
 
-        for idx, item in enumerate(preprocessed_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(preprocessed_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
+        # 罪名和地区每条数据只识别一次,Task1与Task2共用
+        crime_type = self.identify_crime_type(defendant_info, case_description)
+        region = self.extract_region(defendant_info, case_description)
 
-            answer1, answer2 = [], []
-            try:
-                # 第一步:调用权威版 Task 1 预测,提取量刑情节
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    item['defendant_info'],
-                    item['case_description']
-                )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                # 第二步:使用工具调用进行刑期预测
-                print("\n【步骤2: 使用工具计算刑期】")
-                answer2 = self.predict_task2_with_tools(
-                    item['defendant_info'],
-                    item['case_description'],
-                    answer1,
-                )
-                print(f"✓ 预测刑期区间: {answer2}")
+        answer1, answer2 = [], []
+        try:
+            # 第一步:调用权威版 Task 1 预测,提取量刑情节
+            logger.debug("\n【步骤1: 提取量刑情节】")
+            answer1 = await self.predict_task1_authoritative(defendant_info, case_description, crime_type, region)
+            logger.debug("✓ 提取到的情节: %s", answer1)
+
+            # 第二步:计算刑期(默认本地计算,TASK2_USE_TOOLS 时走多轮工具调用)
+            logger.debug("\n【步骤2: 计算刑期】")
+            predict_task2 = self.predict_task2_with_tools if TASK2_USE_TOOLS else self.predict_task2_direct
+            answer2 = await predict_task2(
+                defendant_info,
+                case_description,
+                answer1,
+                crime_type,
+                region,
+            )
+            logger.debug("✓ 预测刑期区间: %s", answer2)
 
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["盗窃数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
-
-            result = {
-                "id": item['id'],
-                "answer1": answer1,
-                "answer2": answer2
-            }
-            results.append(result)
-
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
-
-            # 每处理10条数据保存一次,防止意外中断丢失进度
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
-
-        # 最终保存所有结果
-        self._save_results(results, output_file)
-        print(f"\n所有数据处理完成,结果已保存至: {output_file}")
-        return results
+        except Exception as e:
+            logger.error("!!! 处理ID %s 时发生未知严重错误: %s", item_id, e)
+            answer1 = answer1 if answer1 else ["盗窃数额较大"]
+            answer2 = answer2 if answer2 else [6, 12]
 
-    def process_fact_data(self, fact_data, output_file):
+        logger.debug("【最终结果 ID: %s】 答案1 (情节提取): %s 答案2 (刑期预测): %s", item_id, answer1, answer2)
+
+        return idx, {
+            "id": item_id,
+            "answer1": answer1,
+            "answer2": answer2
+        }
+
+    async def _run(self, items, output_file):
         """
-        处理fact格式的数据（新格式）
+        创建本次运行的客户端并处理全部数据,结束后关闭连接池。
         """
-        results = []
-
-        for idx, item in enumerate(fact_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(fact_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
+        self.client = self._create_client()
+        try:
+            return await self._process_items(items, output_file)
+        finally:
+            await self.client.close()
+            self.client = None
 
-            answer1, answer2 = [], []
-            try:
-                # 第一步:调用权威版 Task 1 预测,提取量刑情节
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    "",  # 被告人信息为空
-                    item['fact']  # 使用fact字段作为案情描述
-                )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                # 第二步:使用工具调用进行刑期预测
-                print("\n【步骤2: 使用工具计算刑期】")
-                # 从案件信息中提取地区
-                answer2 = self.predict_task2_with_tools(
-                    "",  # 被告人信息为空
-                    item['fact'],  # 使用fact字段作为案情描述
-                    answer1,
-                )
-                print(f"✓ 预测刑期区间: {answer2}")
+    async def _process_items(self, items, output_file):
+        """
+        并发处理 (id, 被告人信息, 案情描述) 列表,同时在途的数据不超过 max_concurrency 条。
+        每完成一条即追加写入结果文件,全部完成后按输入顺序整理一次。
 
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["盗窃数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
-
-            result = {
-                "id": item['id'],
-                "answer1": answer1,
-                "answer2": answer2
-            }
-            results.append(result)
-
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
-
-            # 每处理10条数据保存一次,防止意外中断丢失进度
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
-
-        # 最终保存所有结果
-        self._save_results(results, output_file)
-        print(f"\n所有数据处理完成,结果已保存至: {output_file}")
+        参考多分箱批处理(Multi-Bin Batching)的做法:输出长短差异大的请求混在一起时,
+        服务端批次会被最长的请求拖住。这里按案情长度把数据分为短/中/长三箱,
+        每箱使用独立的并发上限(短案件更高),并让短案件先发出,降低排队等待。
+        """
+        total = len(items)
+        results = [None] * total
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # 各长度分箱(短/中/长)各自的并发上限由总并发数折算:短案件可占满总量,中、长依次减半
+        bin_concurrency = (self.max_concurrency,
+                           max(1, self.max_concurrency // 2),
+                           max(1, self.max_concurrency // 4))
+        bin_semaphores = [asyncio.Semaphore(n) for n in bin_concurrency]
+
+        def text_length(idx):
+            _, defendant_info, case_description = items[idx]
+            return len(defendant_info) + len(case_description)
+
+        def length_bin(length):
+            for i, bound in enumerate(_LENGTH_BINS):
+                if length < bound:
+                    return i
+            return len(_LENGTH_BINS)
+
+        async def bounded(idx, bin_semaphore):
+            async with bin_semaphore, semaphore:
+                return await self._process_one(idx, total, *items[idx])
+
+        # 按长度升序创建任务;信号量先到先得,短案件因此先被处理。
+        # 先显式创建 Task 固定调度顺序(as_completed 内部会把协程放进集合,顺序不确定)
+        order = sorted(range(total), key=text_length)
+        tasks = [asyncio.ensure_future(bounded(idx, bin_semaphores[length_bin(text_length(idx))]))
+                 for idx in order]
+        # 文件只打开一次,完成一条追加一条,中断时已完成的结果不会丢失;
+        # 刷新缓冲与 fsync 按条数批量进行(fsync_interval 为 flush_interval 的整数倍),减少系统调用
+        # 有 tqdm 时用单行进度条显示进度,否则每完成一条输出一行进度日志
+        progress = tqdm(total=total, desc="预测进度") if tqdm is not None else None
+        with open(output_file, 'w', encoding='utf-8') as out:
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                idx, result = await task
+                results[idx] = result
+                out.write(_dumps(result) + '\n')
+                if done % self.flush_interval == 0:
+                    out.flush()
+                if done % self.fsync_interval == 0:
+                    os.fsync(out.fileno())
+                if progress is not None:
+                    progress.update(1)
+                else:
+                    logger.info("--- 进度保存:已处理 %d/%d 条数据 ---", done, total)
+        if progress is not None:
+            progress.close()
+
+        # 追加顺序为完成顺序,最后按输入顺序整理一次;先写临时文件再替换,整理过程中断也不会丢失结果
+        tmp_file = output_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as out:
+            for result in results:
+                out.write(_dumps(result) + '\n')
+        os.replace(tmp_file, output_file)
+        logger.info("所有数据处理完成,结果已保存至: %s", output_file)
         return results
 
-    def _save_results(self, results, output_file):
+    def process_all_data(self, preprocessed_data, output_file):
         """
-        将结果以jsonl格式保存到文件。
+        主处理流程:遍历所有数据,执行两阶段预测,并保存结果。
         """
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                for result in results:
-                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
-        except IOError as e:
-            print(f"错误:无法写入文件 {output_file}。请检查权限或路径。错误信息: {e}")
+        items = [(item['id'], item['defendant_info'], item['case_description']) for item in preprocessed_data]
+        return asyncio.run(self._run(items, output_file))
+
+    def process_fact_data(self, fact_data, output_file):
+        """
+        处理fact格式的数据（新格式）
+        """
+        # 被告人信息为空,使用fact字段作为案情描述
+        items = [(item['id'], "", item['fact']) for item in fact_data]
+        return asyncio.run(self._run(items, output_file))
 
 
 def load_preprocessed_data(preprocessed_file):
@@ -696,8 +1078,8 @@ def load_preprocessed_data(preprocessed_file):
         raise FileNotFoundError(f"错误:预处理文件不存在: {preprocessed_file}\n请确保文件路径正确。")
 
     print(f"正在加载预处理数据: {preprocessed_file}")
-    with open(preprocessed_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with open(preprocessed_file, 'rb') as f:
+        data = _loads(f.read())
     print(f"✓ 成功加载 {len(data)} 条预处理数据")
     return data
 
@@ -711,10 +1093,10 @@ def load_fact_data(fact_file):
 
     print(f"正在加载fact数据: {fact_file}")
     data = []
-    with open(fact_file, 'r', encoding='utf-8') as f:
+    with open(fact_file, 'rb') as f:
         for line in f:
             if line.strip():
-                data.append(json.loads(line.strip()))
+                data.append(_loads(line))
     print(f"✓ 成功加载 {len(data)} 条fact数据")
     return data
 
@@ -723,6 +1105,7 @@ def main():
     """
     主函数:初始化并运行整个预测流程。
     """
+    logging.basicConfig(level=logging.DEBUG if _VERBOSE else logging.INFO, format="%(message)s")
     # 配置文件路径
     preprocessed_file = "extracted_info_fusai1.json"
     fact_file = "data/dq.jsonl"
@@ -1,13 +1,509 @@
+import argparse
+import asyncio
+import hashlib
 import json
 import os
 import re
-from openai import OpenAI
+import sqlite3
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import List, Optional
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from cal_zp import SENTENCING_TOOLS, execute_tool_call,SentencingCalculator
 
+try:
+    import orjson
+except ImportError:  # orjson 仅用于加速解析和序列化，缺失时回退到标准库 json
+    orjson = None
+
+# 解析与序列化 JSON(输入数据、模型输出、工具参数/结果、缓存内容、结果文件)
+_loads = orjson.loads if orjson is not None else json.loads
+
+if orjson is not None:
+    def _dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
 # 加载环境变量
 load_dotenv()
 
+# Task1 是否使用 JSON 模式(response_format=json_object)。
+# 接口或模型不支持时设置 OPENAI_JSON_MODE=0,改为输出 JSON 数组并用正则提取
+_JSON_MODE = os.getenv("OPENAI_JSON_MODE", "1") != "0"
+
+
+# 预编译的正则表达式，避免每条数据、每轮工具调用重复查找 re 模块的内部缓存
+# 指控罪名
+_CHARGE_RE = re.compile(r'(因涉嫌|指控犯)(.*?)罪')
+# 模型输出中的JSON数组、刑期区间
+_JSON_ARRAY_RE = re.compile(r'\[.*?\]', re.DOTALL)
+_RANGE_RE = re.compile(r'\[\s*(\d+)\s*,\s*(\d+)\s*\]')
+# JSON 模式下 Task1 输出的 {"factors": [...]} 对象,仅用于判断流式输出是否已完整
+_FACTORS_OBJECT_RE = re.compile(r'\{\s*"factors"\s*:\s*\[.*?\]\s*\}', re.DOTALL)
+# 量刑情节中的金额、次数
+_AMOUNT_RE = re.compile(r'(\d+\.?\d*)元')
+_THEFT_COUNT_RE = re.compile(r'盗窃次数(\d+)次')
+_FRAUD_COUNT_RE = re.compile(r'诈骗次数(\d+)次')
+
+# 法定减轻情节关键词。情节标签通常就是关键词本身,先按集合精确查找;
+# 不在集合中的复合标签再用合并后的正则做一次子串扫描
+_STATUTORY_MITIGATION_KEYWORDS = frozenset((
+    "自首", "立功", "重大立功",
+    "未成年人", "已满十四周岁不满十八周岁",
+    "从犯", "胁从犯",
+    "犯罪中止", "犯罪未遂", "犯罪预备",
+    "防卫过当", "避险过当",
+    "七十五周岁", "75周岁"
+))
+_STATUTORY_RE = re.compile("|".join(sorted(_STATUTORY_MITIGATION_KEYWORDS)))
+
+# 指控不明确时按关键词识别罪名,罪名按顺序优先
+_CRIME_KEYWORDS = (
+    ("盗窃罪", ("盗窃", "窃取", "扒窃", "盗走")),
+    ("故意伤害罪", ("故意伤害", "殴打", "打伤", "轻伤", "重伤")),
+    ("诈骗罪", ("诈骗", "骗取", "虚构事实")),
+    ("职务侵占罪", ("职务侵占", "挪用资金", "非法占有")),
+)
+_CRIME_NAMES = tuple(crime for crime, _ in _CRIME_KEYWORDS)
+_CRIME_KEYWORD_RANK = {kw: rank for rank, (_, kws) in enumerate(_CRIME_KEYWORDS) for kw in kws}
+
+# 常见的地区关键词（省份优先，其次城市；同类中按列表顺序优先）
+_PROVINCES = ("北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
+              "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
+              "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
+              "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
+              "香港", "澳门")
+_CITIES = ("江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
+           "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
+           "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
+           "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
+           "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
+           "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州")
+_REGION_NAMES = _PROVINCES + _CITIES
+_REGION_RANK = {name: rank for rank, name in enumerate(_REGION_NAMES)}
+
+
+def _keyword_scan_re(keywords):
+    """
+    把关键词合并为一个正则,一次线性扫描找出全部出现位置。
+    零宽先行断言使相互重叠的关键词（如"河北京"中的"河北"与"北京"）都能被匹配到。
+    """
+    return re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))")
+
+
+_CRIME_KEYWORD_RE = _keyword_scan_re(_CRIME_KEYWORD_RANK)
+_REGION_RE = _keyword_scan_re(_REGION_NAMES)
+
+
+# 罪名识别前去除的空白字符
+_STRIP_WHITESPACE = str.maketrans("", "", " \n")
+
+
+def _normalize(text):
+    """去除空格和换行,str.translate 一次遍历完成"""
+    return text.translate(_STRIP_WHITESPACE)
+
+
+def _best_rank(pattern, rank_of, text):
+    """一次扫描 text,返回命中关键词中优先级最高(rank 最小)者的 rank,未命中返回 None"""
+    best = None
+    for match in pattern.finditer(text):
+        rank = rank_of[match.group(1)]
+        if best is None or rank < best:
+            best = rank
+            if rank == 0:
+                break
+    return best
+
+
+@dataclass
+class FactorIndex:
+    """
+    量刑情节的一次性解析结果。
+    Task2 构建提示词和每轮工具调用都复用它,不再反复遍历情节列表。
+    """
+    amount: Optional[float] = None
+    theft_count: Optional[int] = None
+    fraud_count: Optional[int] = None
+    has_statutory: bool = False
+    # 提示词中列出的情节文本
+    factors_str: str = ""
+
+    @classmethod
+    def from_factors(cls, sentencing_factors: List[str], crime_type: Optional[str] = None) -> "FactorIndex":
+        """
+        一次遍历解析量刑情节。
+        诈骗罪且诈骗次数>=3次时,在 sentencing_factors 中补充"多次诈骗"情节。
+        """
+        index = cls()
+        amount_seen = False
+        for factor in sentencing_factors:
+            # 金额取第一个盗窃/诈骗既遂金额,排除退赔、退赃金额
+            if (not amount_seen and ("盗窃金额既遂" in factor or "诈骗金额既遂" in factor)
+                    and "退赔" not in factor and "退赃" not in factor):
+                amount_seen = True
+                match = _AMOUNT_RE.search(factor)
+                if match:
+                    index.amount = float(match.group(1))
+            # 次数取第一个能解析出数字的情节
+            if index.theft_count is None and "盗窃次数" in factor:
+                match = _THEFT_COUNT_RE.search(factor)
+                if match:
+                    index.theft_count = int(match.group(1))
+            if index.fraud_count is None and "诈骗次数" in factor:
+                match = _FRAUD_COUNT_RE.search(factor)
+                if match:
+                    index.fraud_count = int(match.group(1))
+            if not index.has_statutory:
+                index.has_statutory = (factor in _STATUTORY_MITIGATION_KEYWORDS
+                                       or _STATUTORY_RE.search(factor) is not None)
+
+        # 特殊处理：如果诈骗次数>=3次，添加"多次诈骗"情节
+        if (crime_type == "诈骗罪" and index.fraud_count is not None and index.fraud_count >= 3
+                and "多次诈骗" not in sentencing_factors):
+            sentencing_factors.append("多次诈骗")
+        index.factors_str = "\n- ".join(sentencing_factors)
+        return index
+
+
+# 缓存版本号:修改提示词、工具定义或解析逻辑后递增,旧缓存自动失效
+CACHE_VERSION = 1
+
+
+class LLMCache:
+    """
+    基于SQLite的LLM响应缓存。
+    以 (缓存版本, 模型, 温度, 消息, 工具) 的SHA256为键,相同请求直接从本地返回,省去网络往返和token开销。
+    Task2 多轮工具调用的每一轮单独缓存,中断后重跑可从已完成的轮次继续。
+    """
+
+    def __init__(self, path):
+        # 所有读写都在事件循环线程内同步完成,无需加锁
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, resp BLOB, ts REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(model, temperature, messages, tools=None):
+        payload = json.dumps(
+            {"version": CACHE_VERSION, "model": model, "messages": messages,
+             "tools": tools, "temperature": temperature},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        row = self._conn.execute("SELECT resp FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return _loads(row[0]) if row else None
+
+    def set(self, key, response_dict):
+        blob = _dumps(response_dict)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, resp, ts) VALUES (?, ?, ?)",
+            (key, blob, time.time())
+        )
+        self._conn.commit()
+
+
+def _message_to_dict(message):
+    """将助手消息转为可缓存的字典"""
+    return {
+        "content": message.content,
+        "tool_calls": [
+            {"id": tc.id, "name": tc.function.name, "arguments": tc.function.arguments}
+            for tc in message.tool_calls
+        ] if message.tool_calls else None
+    }
+
+
+def _message_from_dict(data):
+    """从缓存字典还原出与SDK返回结构一致的助手消息"""
+    tool_calls = None
+    if data["tool_calls"]:
+        tool_calls = [
+            SimpleNamespace(id=tc["id"], function=SimpleNamespace(name=tc["name"], arguments=tc["arguments"]))
+            for tc in data["tool_calls"]
+        ]
+    return SimpleNamespace(content=data["content"], tool_calls=tool_calls)
+
+
+# 提示词中的静态部分只在导入时构建一次。随案件变化的内容(数额标准、案情、情节、地区)
+# 一律放在静态部分之后,使各请求的前缀逐字节相同,便于服务端复用前缀缓存(prefix caching)。
+_TASK1_STATIC = """你是一名中国刑事法官，专门办理诈骗罪案件。请从下面的案情事实中，提取**与量刑直接相关**的情节，且只能使用下面给定的标签形式。
+
+【标签种类和固定写法（只能用这些）】
+
+1. 金额类（必选其一，如能确定）：
+   - "诈骗金额既遂XXXX元"
+   - "诈骗金额未遂XXXX元"
+   其中 XXXX 必须是案情中明确写出的总金额，或可以由多笔金额简单相加得到的总金额。
+
+2. 数额档次（最多输出一个）：
+   - "诈骗数额较大"
+   - "诈骗数额巨大"
+   - "诈骗数额特别巨大"
+   判断标准请严格根据文末【案件信息】中的本地区数额标准。
+
+3. 次数类（二选一，不能同时出现）：
+   - "诈骗次数X次"   —— 能够从案情中精确统计次数时使用
+   - "多次诈骗"       —— 只能确认“多次”，但无法精确统计次数时使用
+
+4. 犯罪手段：
+   - "电信网络诈骗"   —— 仅在案情中出现电话、短信、微信、QQ、网络平台、APP 等典型电信网络手段时使用
+
+5. 法定/酌定量刑情节：
+   - "自首"
+   - "坦白"
+   - "认罪认罚"
+   - "当庭自愿认罪"
+   - "退赔XXXX元"
+   - "退赃XXXX元"
+   - "退赔全部损失"
+   - "退赔部分损失"
+   - "取得谅解"
+   - "前科"
+   - "累犯"
+
+【严格规则】
+
+- 只能在案情中有明确事实依据时输出标签，宁少勿多；
+- 金额、次数必须与案情文字一致，不要自己估算；
+- 若案情写明“退赔全部损失”，优先使用 "退赔全部损失" 标签，不再额外写具体金额；
+- 若同时出现“累犯”和“前科”事实，只输出“累犯”，不要重复评价；
+- 已经用来确定“诈骗金额”“数额档次”“次数”的事实，在后续量刑情节中不要重复发明新标签描述。
+
+【输出格式】
+
+- 只输出一个 JSON 数组，不要输出任何解释和多余文字；
+- 例如：
+  ["诈骗金额既遂50000元","诈骗数额较大","诈骗次数2次","电信网络诈骗","自首","认罪认罚","退赔全部损失"]
+
+"""
+
+# Task1 批量标注:沿用相同的规则部分,案件信息与输出格式改为多案件版本
+_TASK1_RULES = _TASK1_STATIC[:_TASK1_STATIC.index("【输出格式】")]
+_TASK1_BATCH_SUFFIX = """【输出格式】
+
+- 只输出一个 JSON 二维数组，按案件顺序每个案件对应一个标签数组，数组个数必须与案件数相同，不要输出任何解释和多余文字；
+- 例如（2件案件）：
+  [["诈骗金额既遂50000元","诈骗数额较大","自首"],["诈骗金额既遂3000元","诈骗数额较大","诈骗次数2次","认罪认罚"]]
+
+"""
+
+# Task1 JSON 模式:规则部分相同,输出格式改为 JSON 对象
+_TASK1_JSON_STATIC = _TASK1_RULES + """【输出格式】
+
+- 只输出一个 JSON 对象，标签数组放在 "factors" 字段中，不要输出任何解释和多余文字；
+- 例如：
+  {"factors": ["诈骗金额既遂50000元","诈骗数额较大","诈骗次数2次","电信网络诈骗","自首","认罪认罚","退赔全部损失"]}
+
+"""
+
+# Task2 的计算规则作为系统消息整体固定,每个案件及每轮工具调用都共享这一前缀
+_TASK2_SYSTEM_PROMPT = """你是一位刑事法官,必须使用提供的计算器工具进行精确计算,不要自己估算数值。请根据案件信息判断案件所在地区，如无法判断则使用默认标准。
+
+你是一位精通量刑计算的刑事法官。你必须使用提供的专业计算器工具来进行精确计算, 任何涉及加减乘除的数值运算都不能凭心算或估计。
+
+**重要束条件:**
+1. 所有数值运算(金额折算、比例乘法、年/月换算等)都要调用计算器工具完成。
+2. 总体从轻调节幅度原则上不得超过基准刑的 50%(除非存在法定减轻情节且情节明显, 确有必要突破)。
+3. 本案是否有法定减轻情节、已认定的量刑情节(来自 Task1 的输出)和案件地区见用户消息中的【案件信息】。
+4. 金额、数额档次、犯罪次数等**已经在确定基准刑时充分考虑**, 在后续调节环节**不要重复评价**。
+
+请严格按照以下 4 个步骤完成计算:
+
+------------------------------------------------
+**步骤1: 计算基准刑(月数)**
+
+首先，根据已提取的量刑情节和案件信息，使用 `calculate_base_sentence` 工具计算基准刑（单位：月）。
+
+- 传入参数包括：罪名（crime_type）、涉案金额（amount）、地区（region）等；
+- 对于诈骗罪，还需要传入相应的次数参数（fraud_count）；
+- 工具会根据地区性的数额标准以及罪名相关的量刑规范，计算出准确的基准刑月份。
+
+------------------------------------------------
+**步骤2: 识别量刑情节并分层**
+
+请从已认定的量刑情节中抽取、归类量刑情节, 并且**统一映射为标准名称**, 分成两个层次:
+
+1. **第一层面情节(连乘, 法定减轻/法定从轻优先处理)**:
+   - 未成年人犯罪 → "未成年人"
+   - 从犯 → "从犯"
+   - 胁从犯 → "胁从犯"
+   - 犯罪预备 → "犯罪预备"
+   - 犯罪中止 → "犯罪中止"
+   - 犯罪未遂 → "犯罪未遂"
+
+2. **第二层面情节(在第一层面处理完成后的加减)**:
+   - 累犯
+   - 自首
+   - 坦白
+   - 立功 / 重大立功
+   - 认罪认罚
+   - 退赃/退赔(包括 “退赔XXXX元”“退赃XXXX元”“退赔全部损失”等标签)
+   - 取得谅解
+   - 前科(仅在未构成累犯时使用)
+   - 多次诈骗
+   - 电信网络诈骗
+   - 主犯
+   - 犯罪对象为弱势群体(如“针对老年人实施诈骗”)
+   - 重大灾害期间犯罪
+
+【映射规则举例】:
+- 任何以“退赔”“退赃”开头的标签都归入“退赃/退赔”情节;
+- “针对老年人实施诈骗”等归入“犯罪对象为弱势群体”;
+- 若存在“累犯”, 不再把同一前案单独作为“前科”再次从重;
+- 已用于确定基准刑的“数额档次”“次数”不要再当作第二层面情节;
+- 当诈骗次数大于等于3次时，应添加“多次诈骗”情节到第二层面。
+
+------------------------------------------------
+**步骤3: 选择调节比例, 调用分层计算工具**
+
+先为每个情节选择一个合理的调节系数 ratio, 再调用 `calculate_layered_sentence_with_constraints` 工具。
+使用下面的标准比例:
+
+【法定从重情节】(通常放在第二层面)
+- 累犯: 1.20   # 增加20%
+
+【酌定从重情节】
+- 前科: 1.10                      # 增加10%
+- 犯罪对象为弱势群体: 1.10        # 增加10%
+- 重大灾害期间犯罪: 1.20          # 增加20%
+- 多次诈骗: 1.15 # 增加15%
+- 电信网络诈骗: 1.30              # 增加30%
+- 主犯: 1.25                      # 增加25%
+
+【法定从轻、减轻情节】(第一层面, 按顺序连乘)
+- 未成年人: 0.70   # 降低30%
+- 从犯: 0.90       # 降低10%
+- 胁从犯: 0.80     # 降低20%
+- 犯罪预备: 0.50   # 减半
+- 犯罪中止: 0.50   # 减半
+- 犯罪未遂: 0.50   # 减半
+
+【酌定从轻情节】(第二层面, 在第一层结果基础上连续微调)
+- 自首: 0.75      # 降25%
+- 坦白: 0.80      # 降低20%
+- 立功: 0.80      # 降低20%
+- 重大立功: 0.50  # 减半
+- 认罪认罚: 0.95  # 降低5%
+- 退赃/退赔: 0.85 # 降低15%
+- 取得谅解: 0.95 # 降低5%
+
+【重要约束】:
+- 第一层面情节: 在基准刑基础上**依次连乘**其 ratio;
+- 第二层面情节: 在第一层面结果基础上继续按比例连续调节;
+- 第一层面 + 第二层面合并后的总从轻幅度, 原则上不得超过基准刑的 50%。如本案有法定减轻情节且情节显著, 才可以适度突破, 但也要保持合理。
+
+在完成情节识别与比例选择后:
+
+1. 组装第一层面情节列表, 格式如:
+   第一层面 = [{"name": "从犯", "ratio": 0.9}, {"name": "犯罪未遂", "ratio": 0.5}]
+
+2. 组装第二层面情节列表, 格式如:
+   第二层面 = [{"name": "自首", "ratio": 0.75}, {"name": "认罪认罚", "ratio": 0.95}, ...]
+
+3. 使用 `calculate_layered_sentence_with_constraints` 工具:
+   - 传入: 基准刑(月数)、罪名、总金额、第一层面情节列表、第二层面情节列表、是否有法定减轻情节;
+   - 让工具在内部检查并保证“总减轻幅度原则上不超过基准刑 50%”这一束条件。
+
+工具返回**最终折算的刑期月数**。
+
+------------------------------------------------
+**步骤4: 生成刑期区间**
+
+1. 使用 `months_to_range` 工具, 将最终刑期月数转换为一个合理区间 [下限, 上限]:
+   - 一般案件可在最终月数上下各浮动 3~6 个月形成区间;
+   - 情节复杂、量刑不确定性较大的案件, 区间可以适当加宽, 但总宽度一般控制在 6~18 个月内;
+   - 如果计算得到的区间下限小于或等于 0, 请将下限调整为 1。
+
+2. 最终只输出刑期区间, 例如:
+   [32, 38]
+
+不要输出任何解释性文字。
+"""
+
+
+# Task2 用户消息:随案件变化的只有法定减轻情节有无、情节列表和地区三处,用模板一次格式化
+_TASK2_CASE_TEMPLATE = """【案件信息】
+本案%s法定减轻情节。
+
+**已认定的量刑情节(来自 Task1 的输出):**
+%s
+
+**案件地区:** %s
+"""
+
+@lru_cache(maxsize=256)
+def _get_amount_standards_for_prompt(crime_type: str, region: str) -> str:
+    """
+    根据罪名和地区的数额标准生成提示信息。
+    结果只依赖 (罪名, 地区),缓存后每个组合只格式化一次。
+    """
+    # 获取地区标准
+    if region in SentencingCalculator.REGIONAL_STANDARDS:
+        standards = SentencingCalculator.REGIONAL_STANDARDS[region]
+    elif region in SentencingCalculator.REGIONAL_STANDARDS.get("cities_to_provinces", {}):
+        province = SentencingCalculator.REGIONAL_STANDARDS["cities_to_provinces"][region]
+        standards = SentencingCalculator.REGIONAL_STANDARDS[province]
+    else:
+        standards = SentencingCalculator.REGIONAL_STANDARDS["default"]
+
+    # 生成提示文本
+    if crime_type == "盗窃罪" and "theft" in standards:
+        theft_standards = standards["theft"]
+        return f"""**{region}盗窃罪数额标准:**
+- **数额较大**: {theft_standards['large']}元以上不满{theft_standards['huge']}元
+- **数额巨大**: {theft_standards['huge']}元以上不满{theft_standards['especially_huge']}元
+- **数额特别巨大**: {theft_standards['especially_huge']}元以上"""
+
+    elif crime_type == "诈骗罪" and "fraud" in standards:
+        fraud_standards = standards["fraud"]
+        return f"""**{region}诈骗罪数额标准:**
+- **数额较大**: {fraud_standards['large']}元以上不满{fraud_standards['huge']}元
+- **数额巨大**: {fraud_standards['huge']}元以上不满{fraud_standards['especially_huge']}元
+- **数额特别巨大**: {fraud_standards['especially_huge']}元以上"""
+
+    elif crime_type == "职务侵占罪":
+        # 使用河南标准作为默认
+        return """**河南职务侵占罪数额标准:**
+- **数额较大**: 6万元以上不满100万元
+- **数额巨大**: 100万元以上不满1500万元
+- **数额特别巨大**: 1500万元以上"""
+
+    else:
+        # 默认标准
+        return """**全国通用数额标准参考:**
+- **盗窃罪**:
+  - 数额较大: 1000元以上不满30000元
+  - 数额巨大: 30000元以上不满300000元
+  - 数额特别巨大: 300000元以上
+- **诈骗罪**:
+  - 数额较大: 3000元以上不满30000元
+  - 数额巨大: 30000元以上不满500000元
+  - 数额特别巨大: 500000元以上"""
+
+
+@lru_cache(maxsize=256)
+def _task1_prefix(region: str) -> str:
+    """
+    Task1 提示词中案情之前的全部内容(静态规则 + 地区数额标准),按地区缓存,
+    构建提示词时只需在其后拼接案情描述。
+    """
+    return "".join([
+        _TASK1_JSON_STATIC if _JSON_MODE else _TASK1_STATIC,
+        "【案件信息】\n本地区数额标准：\n", _get_amount_standards_for_prompt("诈骗罪", region),
+        "\n\n【案情事实】\n",
+    ])
+
 
 class SentencingPredictor:
     """
@@ -20,25 +516,56 @@ class SentencingPredictor:
         """
         初始化客户端和模型配置。
         """
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_BASE_URL")
-        )
+        # 异步客户端在每次运行(_process_items)开始时创建,结束时关闭
+        self.client = None
         self.model_name = os.getenv("OPENAI_MODEL", "qwen-max")
         self.temperature_task1 = 0.1 # Task1使用较高温度以增加多样性
         self.temperature_task2 = 0.1  # Task2使用较低温度以确保稳定性
-        self.max_tokens = 32768
+        # 各类调用的输出长度上限:生成耗时随输出token数线性增长,上限越贴近实际输出,异常时的长尾越短;
+        # 部分服务端还会按 max_tokens 预留KV缓存,上限过大会挤占并发请求的排队容量
+        # Task1 只输出一个较短的 JSON 数组
+        self.max_tokens_task1 = 512
+        # Task2 各轮次:助手消息及工具调用参数(months_to_range 返回区间后直接结束,不再请求最终回复)
+        self.max_tokens_task2_tool = 1024
+        # Task1 每次调用合并的案件数,设为1则逐条调用
+        self.task1_batch_size = int(os.getenv("ZP_TASK1_BATCH_SIZE", "8"))
+        # 同时处理的数据条数上限,应不超过接口允许的并发数
+        self.max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+        # 两个任务温度都很低,结果基本确定,对响应做本地缓存,重跑时不再重复请求
+        self.llm_cache = LLMCache(os.getenv("LLM_CACHE_PATH", ".zp_llm_cache.sqlite"))
+
+    @staticmethod
+    def _create_client():
+        """
+        创建异步客户端,多条数据的请求可同时在途;遇到限流或连接错误时由SDK按 retry-after 自动退避重试。
+        显式设置连接池大小(httpx 默认只保持20个空闲连接),使高并发时连接可以复用,不必反复建立TLS连接。
+        连接池绑定到当前事件循环,因此每次运行单独创建。
+        """
+        return AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=128, max_keepalive_connections=64),
+                # 非流式调用要等整段输出生成完才返回,长输出/批量请求可能需要数分钟,读超时保持600秒
+                timeout=httpx.Timeout(connect=5.0, read=600.0, write=30.0, pool=5.0)
+            )
+        )
 
     def identify_crime_type(self, defendant_info, case_description):
         """
         增强版的罪名识别函数。
         优先从指控中识别,其次通过关键词匹配。
         """
-        text = defendant_info + case_description
-        text = text.replace(" ", "").replace("\n", "")
+        return self.identify_crime_type_on_text(_normalize(defendant_info + case_description))
 
+    @staticmethod
+    def identify_crime_type_on_text(text):
+        """
+        在已去除空白的案件文本上识别罪名。
+        """
         # 1. 优先匹配指控罪名,这是最准确的方式
-        charge_match = re.search(r'(因涉嫌|指控犯)(.*?)罪', text)
+        charge_match = _CHARGE_RE.search(text)
         if charge_match:
             crime = charge_match.group(2)
             if "盗窃" in crime: return "盗窃罪"
@@ -46,16 +573,10 @@ class SentencingPredictor:
             if "诈骗" in crime: return "诈骗罪"
             if "职务侵占" in crime: return "职务侵占罪"
 
-        # 2. 如果指控不明确,使用关键词作为备用方案
-        theft_keywords = ["盗窃", "窃取", "扒窃", "盗走"]
-        injury_keywords = ["故意伤害", "殴打", "打伤", "轻伤", "重伤"]
-        fraud_keywords = ["诈骗", "骗取", "虚构事实"]
-        embezzlement_keywords = ["职务侵占", "挪用资金", "非法占有"]
-
-        if any(k in text for k in theft_keywords): return "盗窃罪"
-        if any(k in text for k in injury_keywords): return "故意伤害罪"
-        if any(k in text for k in fraud_keywords): return "诈骗罪"
-        if any(k in text for k in embezzlement_keywords): return "职务侵占罪"
+        # 2. 如果指控不明确,使用关键词作为备用方案:一次扫描,取优先级最高的罪名
+        best = _best_rank(_CRIME_KEYWORD_RE, _CRIME_KEYWORD_RANK, text)
+        if best is not None:
+            return _CRIME_NAMES[best]
 
         # 3. 默认回退,根据数据集的多数罪名来定,此处以盗窃罪为例
         return "盗窃罪"
@@ -64,340 +585,181 @@ class SentencingPredictor:
         """
         从案件信息中提取地区信息
         """
-        text = defendant_info + case_description
-        # 常见的地区关键词
-        regions = ["北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
-                   "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
-                   "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
-                   "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
-                   "香港", "澳门"]
-
-        # 常见的城市关键词
-        cities = ["江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
-                  "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
-                  "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
-                  "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
-                  "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
-                  "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州"]
-
-        # 先尝试查找省份
-        for region in regions:
-            if region in text:
-                return region
-
-        # 如果没有找到省份，尝试查找城市
-        for city in cities:
-            if city in text:
-                return city
+        return self.extract_region_on_text(defendant_info + case_description)
+
+    @staticmethod
+    def extract_region_on_text(text):
+        """
+        在案件文本上提取地区信息
+        """
+        # 一次扫描找出所有出现的地区，取优先级最高者（省份先于城市）
+        best = _best_rank(_REGION_RE, _REGION_RANK, text)
 
         # 如果没有找到明确的地区，返回默认值
-        return "default"
-
-    def build_prompt_task1_authoritative(self, defendant_info, case_description):
-        crime_type = "诈骗罪"
-        region = self.extract_region(defendant_info, case_description)
-        amount_standards = self._get_amount_standards_for_prompt(crime_type, region)
-
-        prompt = f"""
-    你是一名中国刑事法官，专门办理诈骗罪案件。请从下面的案情事实中，提取**与量刑直接相关**的情节，且只能使用下面给定的标签形式。
-
-    【标签种类和固定写法（只能用这些）】
-
-    1. 金额类（必选其一，如能确定）：
-       - "诈骗金额既遂XXXX元"
-       - "诈骗金额未遂XXXX元"
-       其中 XXXX 必须是案情中明确写出的总金额，或可以由多笔金额简单相加得到的总金额。
-
-    2. 数额档次（最多输出一个）：
-       - "诈骗数额较大"
-       - "诈骗数额巨大"
-       - "诈骗数额特别巨大"
-       判断标准请严格根据本地区数额标准：
-    {amount_standards}
-
-    3. 次数类（二选一，不能同时出现）：
-       - "诈骗次数X次"   —— 能够从案情中精确统计次数时使用
-       - "多次诈骗"       —— 只能确认“多次”，但无法精确统计次数时使用
-
-    4. 犯罪手段：
-       - "电信网络诈骗"   —— 仅在案情中出现电话、短信、微信、QQ、网络平台、APP 等典型电信网络手段时使用
-
-    5. 法定/酌定量刑情节：
-       - "自首"
-       - "坦白"
-       - "认罪认罚"
-       - "当庭自愿认罪"
-       - "退赔XXXX元"
-       - "退赃XXXX元"
-       - "退赔全部损失"
-       - "退赔部分损失"
-       - "取得谅解"
-       - "前科"
-       - "累犯"
-
-    【严格规则】
-
-    - 只能在案情中有明确事实依据时输出标签，宁少勿多；
-    - 金额、次数必须与案情文字一致，不要自己估算；
-    - 若案情写明“退赔全部损失”，优先使用 "退赔全部损失" 标签，不再额外写具体金额；
-    - 若同时出现“累犯”和“前科”事实，只输出“累犯”，不要重复评价；
-    - 已经用来确定“诈骗金额”“数额档次”“次数”的事实，在后续量刑情节中不要重复发明新标签描述。
-
-    【输出格式】
-
-    - 只输出一个 JSON 数组，不要输出任何解释和多余文字；
-    - 例如：
-      ["诈骗金额既遂50000元","诈骗数额较大","诈骗次数2次","电信网络诈骗","自首","认罪认罚","退赔全部损失"]
-
-    【案情事实】
-    {case_description}
-    """
-        return prompt
+        return _REGION_NAMES[best] if best is not None else "default"
+
+    def build_prompt_task1_authoritative(self, defendant_info, case_description, region=None):
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
+        return "".join([_task1_prefix(region), case_description, "\n"])
+
+    def build_prompt_task1_batch(self, cases):
+        """
+        构建多案件合并的Task 1 Prompt,cases 为 (被告人信息, 案情描述) 列表,要求按顺序输出各案件的标签数组。
+        """
+        blocks = []
+        for i, (defendant_info, case_description) in enumerate(cases, 1):
+            region = self.extract_region(defendant_info, case_description)
+            blocks.append("".join([
+                "【案件", str(i), "】\n本地区数额标准：\n",
+                self._get_amount_standards_for_prompt("诈骗罪", region),
+                "\n案情事实：", case_description, "\n\n",
+            ]))
+        return "".join([
+            _TASK1_RULES,
+            "【案件信息】（共", str(len(cases)), "件，下文所说的“本地区数额标准”均指该案件下列出的标准）\n\n",
+            *blocks,
+            _TASK1_BATCH_SUFFIX,
+        ])
 
     def _get_amount_standards_for_prompt(self, crime_type, region):
         """
         根据罪名和地区的数额标准生成提示信息
         """
-        # 获取地区标准
-        if region in SentencingCalculator.REGIONAL_STANDARDS:
-            standards = SentencingCalculator.REGIONAL_STANDARDS[region]
-        elif region in SentencingCalculator.REGIONAL_STANDARDS.get("cities_to_provinces", {}):
-            province = SentencingCalculator.REGIONAL_STANDARDS["cities_to_provinces"][region]
-            standards = SentencingCalculator.REGIONAL_STANDARDS[province]
-        else:
-            standards = SentencingCalculator.REGIONAL_STANDARDS["default"]
+        return _get_amount_standards_for_prompt(crime_type, region)
 
-        # 生成提示文本
-        if crime_type == "盗窃罪" and "theft" in standards:
-            theft_standards = standards["theft"]
-            return f"""**{region}盗窃罪数额标准:**
-- **数额较大**: {theft_standards['large']}元以上不满{theft_standards['huge']}元
-- **数额巨大**: {theft_standards['huge']}元以上不满{theft_standards['especially_huge']}元
-- **数额特别巨大**: {theft_standards['especially_huge']}元以上"""
+    def build_prompt_task2_with_tools(self, defendant_info, case_description, sentencing_factors, factor_index=None,
+                                      crime_type=None, region=None):
+        """
+        构建支持工具调用的刑期预测Prompt (Task 2) 中随案件变化的部分。
+        计算规则固定放在系统消息 _TASK2_SYSTEM_PROMPT 中,模型将使用计算器工具进行精确的刑期计算。
+        factor_index 为量刑情节的解析结果,未传入时在此解析。
+        """
+        if factor_index is None:
+            if crime_type is None:
+                crime_type = self.identify_crime_type(defendant_info, case_description)
+            factor_index = FactorIndex.from_factors(sentencing_factors, crime_type)
 
-        elif crime_type == "诈骗罪" and "fraud" in standards:
-            fraud_standards = standards["fraud"]
-            return f"""**{region}诈骗罪数额标准:**
-- **数额较大**: {fraud_standards['large']}元以上不满{fraud_standards['huge']}元
-- **数额巨大**: {fraud_standards['huge']}元以上不满{fraud_standards['especially_huge']}元
-- **数额特别巨大**: {fraud_standards['especially_huge']}元以上"""
+        # 提取地区信息
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
 
-        elif crime_type == "职务侵占罪":
-            # 使用河南标准作为默认
-            return """**河南职务侵占罪数额标准:**
-- **数额较大**: 6万元以上不满100万元
-- **数额巨大**: 100万元以上不满1500万元
-- **数额特别巨大**: 1500万元以上"""
+        return _TASK2_CASE_TEMPLATE % ("有" if factor_index.has_statutory else "无", factor_index.factors_str, region)
 
+    async def _create_message(self, messages, temperature, max_tokens, tools=None, stop_re=None,
+                              response_format=None):
+        """
+        带缓存的 chat.completions.create,返回 (助手消息, 缓存键)。
+        命中缓存时缓存键为None;新请求到的响应不在这里写入缓存,由调用方解析成功后调用 _cache_message,
+        避免格式异常的输出在重跑时被反复复用。
+        传入 stop_re 时改用流式请求,正文中一出现 stop_re 的匹配即停止接收。
+        """
+        cache_key = LLMCache._key(self.model_name, temperature, messages, tools)
+        cached = self.llm_cache.get(cache_key)
+        if cached is not None:
+            return _message_from_dict(cached), None
+
+        kwargs = {"tools": tools} if tools else {}
+        if response_format is not None:
+            kwargs["response_format"] = response_format
+        kwargs.update(
+            model=self.model_name,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        if stop_re is not None:
+            message = await self._stream_message(stop_re, **kwargs)
         else:
-            # 默认标准
-            return """**全国通用数额标准参考:**
-- **盗窃罪**:
-  - 数额较大: 1000元以上不满30000元
-  - 数额巨大: 30000元以上不满300000元
-  - 数额特别巨大: 300000元以上
-- **诈骗罪**:
-  - 数额较大: 3000元以上不满30000元
-  - 数额巨大: 30000元以上不满500000元
-  - 数额特别巨大: 500000元以上"""
+            response = await self.client.chat.completions.create(**kwargs)
+            message = response.choices[0].message
+        return message, cache_key
 
-    def build_prompt_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
+    def _cache_message(self, cache_key, message):
         """
-        构建支持工具调用的刑期预测Prompt (Task 2)。
-        模型将使用计算器工具进行精确的刑期计算。
+        将解析成功的新响应写入缓存;cache_key 为None(响应本身来自缓存)时不做任何事。
         """
-        # 判断是否有法定减轻情节
-        statutory_mitigation_keywords = [
-            "自首", "立功", "重大立功",
-            "未成年人", "已满十四周岁不满十八周岁",
-            "从犯", "胁从犯",
-            "犯罪中止", "犯罪未遂", "犯罪预备",
-            "防卫过当", "避险过当",
-            "七十五周岁", "75周岁"
-        ]
-        has_statutory = any(kw in str(sentencing_factors) for kw in statutory_mitigation_keywords)
-
-        crime_type = self.identify_crime_type(defendant_info, case_description)
-        factors_str = "\n- ".join(sentencing_factors)
+        if cache_key is not None:
+            self.llm_cache.set(cache_key, _message_to_dict(message))
 
-        # 提取金额用于计算
-        amount = None
-        for factor in sentencing_factors:
-            if "盗窃金额既遂" in factor or "诈骗金额既遂" in factor:
-                # 确保我们提取的是盗窃或诈骗金额，而不是退赔金额
-                if "退赔" not in factor and "退赃" not in factor:
-                    try:
-                        amount = float(re.search(r'(\d+\.?\d*)元', factor).group(1))
-                    except:
-                        pass
-                    break
-
-        # 提取地区信息
-        region = self.extract_region(defendant_info, case_description)
-
-        # 特殊处理：如果诈骗次数>=3次，添加"多次诈骗"情节
-        if crime_type == "诈骗罪":
-            for factor in sentencing_factors:
-                if "诈骗次数" in factor:
-                    try:
-                        fraud_count = int(re.search(r'诈骗次数(\d+)次', factor).group(1))
-                        if fraud_count >= 3 and "多次诈骗" not in sentencing_factors:
-                            sentencing_factors.append("多次诈骗")
-                            factors_str = "\n- ".join(sentencing_factors)
+    async def _stream_message(self, stop_re=None, **kwargs):
+        """
+        以流式方式请求模型,拼装出与非流式返回结构一致的助手消息。
+        正文中已出现 stop_re 的匹配且没有工具调用时提前关闭流,不再等待模型继续输出;
+        因为只取第一个匹配,提前结束不影响解析结果。
+        """
+        stream = await self.client.chat.completions.create(stream=True, **kwargs)
+        parts = []
+        tool_calls = {}
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    parts.append(delta.content)
+                    if stop_re is not None and not tool_calls and stop_re.search("".join(parts)):
                         break
-                    except:
-                        pass
-
-        prompt = f"""你是一位精通量刑计算的刑事法官。你必须使用提供的专业计算器工具来进行精确计算, 任何涉及加减乘除的数值运算都不能凭心算或估计。
-
-        **重要束条件:**
-        1. 所有数值运算(金额折算、比例乘法、年/月换算等)都要调用计算器工具完成。
-        2. 总体从轻调节幅度原则上不得超过基准刑的 50%(除非存在法定减轻情节且情节明显, 确有必要突破)。
-        3. 本案{'有' if has_statutory else '无'}法定减轻情节。
-        4. 金额、数额档次、犯罪次数等**已经在确定基准刑时充分考虑**, 在后续调节环节**不要重复评价**。
-
-        **已认定的量刑情节(来自 Task1 的输出):**
-        {factors_str}
-
-        **案件地区:** {region}
-
-        请严格按照以下 4 个步骤完成计算:
-
-        ------------------------------------------------
-        **步骤1: 计算基准刑(月数)**
-        
-        首先，根据已提取的量刑情节和案件信息，使用 `calculate_base_sentence` 工具计算基准刑（单位：月）。
-
-        - 传入参数包括：罪名（crime_type）、涉案金额（amount）、地区（region）等；
-        - 对于诈骗罪，还需要传入相应的次数参数（fraud_count）；
-        - 工具会根据地区性的数额标准以及罪名相关的量刑规范，计算出准确的基准刑月份。
-
-        ------------------------------------------------
-        **步骤2: 识别量刑情节并分层**
-
-        请从 {factors_str} 中抽取、归类量刑情节, 并且**统一映射为标准名称**, 分成两个层次:
-
-        1. **第一层面情节(连乘, 法定减轻/法定从轻优先处理)**:
-           - 未成年人犯罪 → "未成年人"
-           - 从犯 → "从犯"
-           - 胁从犯 → "胁从犯"
-           - 犯罪预备 → "犯罪预备"
-           - 犯罪中止 → "犯罪中止"
-           - 犯罪未遂 → "犯罪未遂"
-
-        2. **第二层面情节(在第一层面处理完成后的加减)**:
-           - 累犯
-           - 自首
-           - 坦白
-           - 立功 / 重大立功
-           - 认罪认罚
-           - 退赃/退赔(包括 “退赔XXXX元”“退赃XXXX元”“退赔全部损失”等标签)
-           - 取得谅解
-           - 前科(仅在未构成累犯时使用)
-           - 多次诈骗
-           - 电信网络诈骗
-           - 主犯
-           - 犯罪对象为弱势群体(如“针对老年人实施诈骗”)
-           - 重大灾害期间犯罪
-
-        【映射规则举例】:
-        - 任何以“退赔”“退赃”开头的标签都归入“退赃/退赔”情节;
-        - “针对老年人实施诈骗”等归入“犯罪对象为弱势群体”;
-        - 若存在“累犯”, 不再把同一前案单独作为“前科”再次从重;
-        - 已用于确定基准刑的“数额档次”“次数”不要再当作第二层面情节;
-        - 当诈骗次数大于等于3次时，应添加“多次诈骗”情节到第二层面。
-
-        ------------------------------------------------
-        **步骤3: 选择调节比例, 调用分层计算工具**
-
-        先为每个情节选择一个合理的调节系数 ratio, 再调用 `calculate_layered_sentence_with_constraints` 工具。
-        使用下面的标准比例:
-
-        【法定从重情节】(通常放在第二层面)
-        - 累犯: 1.20   # 增加20%
-
-        【酌定从重情节】
-        - 前科: 1.10                      # 增加10%
-        - 犯罪对象为弱势群体: 1.10        # 增加10%
-        - 重大灾害期间犯罪: 1.20          # 增加20%
-        - 多次诈骗: 1.15 # 增加15%
-        - 电信网络诈骗: 1.30              # 增加30%
-        - 主犯: 1.25                      # 增加25%
-
-        【法定从轻、减轻情节】(第一层面, 按顺序连乘)
-        - 未成年人: 0.70   # 降低30%
-        - 从犯: 0.90       # 降低10%
-        - 胁从犯: 0.80     # 降低20%
-        - 犯罪预备: 0.50   # 减半
-        - 犯罪中止: 0.50   # 减半
-        - 犯罪未遂: 0.50   # 减半
-
-        【酌定从轻情节】(第二层面, 在第一层结果基础上连续微调)
-        - 自首: 0.75      # 降25%
-        - 坦白: 0.80      # 降低20%
-        - 立功: 0.80      # 降低20%
-        - 重大立功: 0.50  # 减半
-        - 认罪认罚: 0.95  # 降低5%
-        - 退赃/退赔: 0.85 # 降低15%
-        - 取得谅解: 0.95 # 降低5%
-
-        【重要约束】:
-        - 第一层面情节: 在基准刑基础上**依次连乘**其 ratio;
-        - 第二层面情节: 在第一层面结果基础上继续按比例连续调节;
-        - 第一层面 + 第二层面合并后的总从轻幅度, 原则上不得超过基准刑的 50%。如本案{'有' if has_statutory else '无'}法定减轻情节且情节显著, 才可以适度突破, 但也要保持合理。
-
-        在完成情节识别与比例选择后:
+                # 工具调用的参数分片到达,按 index 拼接
+                for tc in delta.tool_calls or ():
+                    entry = tool_calls.setdefault(tc.index, {"id": None, "name": "", "arguments": ""})
+                    if tc.id:
+                        entry["id"] = tc.id
+                    if tc.function is not None:
+                        if tc.function.name:
+                            entry["name"] += tc.function.name
+                        if tc.function.arguments:
+                            entry["arguments"] += tc.function.arguments
+        finally:
+            await stream.close()
+
+        return SimpleNamespace(
+            content="".join(parts) if parts else None,
+            tool_calls=[
+                SimpleNamespace(id=entry["id"],
+                                function=SimpleNamespace(name=entry["name"], arguments=entry["arguments"]))
+                for _, entry in sorted(tool_calls.items())
+            ] or None
+        )
 
-        1. 组装第一层面情节列表, 格式如:
-           第一层面 = [{{"name": "从犯", "ratio": 0.9}}, {{"name": "犯罪未遂", "ratio": 0.5}}]
-
-        2. 组装第二层面情节列表, 格式如:
-           第二层面 = [{{"name": "自首", "ratio": 0.75}}, {{"name": "认罪认罚", "ratio": 0.95}}, ...]
-
-        3. 使用 `calculate_layered_sentence_with_constraints` 工具:
-           - 传入: 基准刑(月数)、罪名、总金额、第一层面情节列表、第二层面情节列表、是否有法定减轻情节;
-           - 让工具在内部检查并保证“总减轻幅度原则上不超过基准刑 50%”这一束条件。
-
-        工具返回**最终折算的刑期月数**。
-
-        ------------------------------------------------
-        **步骤4: 生成刑期区间**
-
-        1. 使用 `months_to_range` 工具, 将最终刑期月数转换为一个合理区间 [下限, 上限]:
-           - 一般案件可在最终月数上下各浮动 3~6 个月形成区间;
-           - 情节复杂、量刑不确定性较大的案件, 区间可以适当加宽, 但总宽度一般控制在 6~18 个月内;
-           - 如果计算得到的区间下限小于或等于 0, 请将下限调整为 1。
-
-        2. 最终只输出刑期区间, 例如:
-           [32, 38]
-
-        不要输出任何解释性文字。
-        """
-
-        return prompt
-
-    def predict_task1_authoritative(self, defendant_info, case_description):
+    async def predict_task1_authoritative(self, defendant_info, case_description, region=None):
         """
         执行Task 1:提取量刑情节。
         """
-        prompt = self.build_prompt_task1_authoritative(defendant_info, case_description)
+        prompt = self.build_prompt_task1_authoritative(defendant_info, case_description, region)
+        messages = [
+            {"role": "system",
+             "content": "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"},
+            {"role": "user", "content": prompt}
+        ]
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system",
-                     "content": "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature_task1,  # Task1使用较高温度
-                max_tokens=self.max_tokens
+            if _JSON_MODE:
+                # 接口保证输出为合法 JSON 对象,直接解析,不再用正则从文本中截取
+                message, cache_key = await self._create_message(
+                    messages,
+                    self.temperature_task1,  # Task1使用较高温度
+                    self.max_tokens_task1,
+                    stop_re=_FACTORS_OBJECT_RE,  # JSON对象一闭合即停止接收
+                    response_format={"type": "json_object"}
+                )
+                factors = _loads(message.content)["factors"]
+                self._cache_message(cache_key, message)
+                return factors
+
+            message, cache_key = await self._create_message(
+                messages,
+                self.temperature_task1,  # Task1使用较高温度
+                self.max_tokens_task1,
+                stop_re=_JSON_ARRAY_RE  # JSON数组一闭合即停止接收
             )
-            result_text = response.choices[0].message.content.strip()
+            result_text = message.content.strip()
 
             # 使用正则表达式从文本中提取JSON数组
-            json_match = re.search(r'\[.*?\]', result_text, re.DOTALL)
+            json_match = _JSON_ARRAY_RE.search(result_text)
             if json_match:
-                return json.loads(json_match.group(0))
+                factors = _loads(json_match.group(0))
+                self._cache_message(cache_key, message)
+                return factors
             else:
                 print(f"警告 (Task 1): 未能在输出中找到JSON数组。返回: {result_text}")
                 return ["盗窃数额较大"]  # Fallback
@@ -405,20 +767,95 @@ class SentencingPredictor:
             print(f"错误 (Task 1): API调用或JSON解析失败: {e}")
             return ["盗窃数额较大"]  # Fallback
 
-    def predict_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
+    async def predict_task1_batch(self, cases):
+        """
+        执行Task 1的批量版本:一次调用提取多个案件的量刑情节。
+        返回与输入等长的列表;输出无法解析或数量不符时对应位置为None,由调用方逐条重试。
+        """
+        prompt = self.build_prompt_task1_batch(cases)
+        try:
+            message, cache_key = await self._create_message(
+                [
+                    {"role": "system",
+                     "content": "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"},
+                    {"role": "user", "content": prompt}
+                ],
+                self.temperature_task1,
+                self.max_tokens_task1 * len(cases)
+            )
+            result_text = message.content.strip()
+
+            start = result_text.find('[')
+            end = result_text.rfind(']')
+            if 0 <= start < end:
+                answers = _loads(result_text[start:end + 1])
+                if (isinstance(answers, list) and len(answers) == len(cases)
+                        and all(isinstance(answer, list) for answer in answers)):
+                    self._cache_message(cache_key, message)
+                    return answers
+            print(f"警告 (Task 1 批量): 输出格式不符,改为逐条提取。返回: {result_text}")
+        except Exception as e:
+            print(f"错误 (Task 1 批量): API调用或JSON解析失败: {e}")
+        return [None] * len(cases)
+
+    @staticmethod
+    def _preload_base_sentence(crime_type, region, factor_index):
+        """
+        基准刑只依赖罪名、金额、地区和次数,Task1 给出金额后即可在本地算出。
+        预先执行 calculate_base_sentence,返回该工具调用及其结果对应的对话消息,
+        模型从步骤2开始,省去发起该调用的一轮往返。金额未知或计算出错时返回空列表。
+        """
+        if factor_index.amount is None or crime_type not in ("诈骗罪", "盗窃罪"):
+            return []
+
+        function_args = {"crime_type": crime_type, "amount": factor_index.amount, "region": region}
+        if crime_type == "诈骗罪" and factor_index.fraud_count is not None:
+            function_args["fraud_count"] = factor_index.fraud_count
+        elif crime_type == "盗窃罪" and factor_index.theft_count is not None:
+            function_args["theft_count"] = factor_index.theft_count
+
+        function_response = execute_tool_call("calculate_base_sentence", function_args)
+        if "base_months" not in _loads(function_response):
+            return []
+        print(f"  🔧 预先计算基准刑: {_dumps(function_args)} -> {function_response}")
+
+        tool_call_id = "preload_base_sentence"
+        return [
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": tool_call_id,
+                    "type": "function",
+                    "function": {"name": "calculate_base_sentence", "arguments": _dumps(function_args)}
+                }]
+            },
+            {"role": "tool", "tool_call_id": tool_call_id, "content": function_response}
+        ]
+
+    async def predict_task2_with_tools(self, defendant_info, case_description, sentencing_factors,
+                                       crime_type=None, region=None):
         """
         执行Task 2:使用工具调用进行刑期预测。
         """
         if not sentencing_factors:
             sentencing_factors = ["犯罪情节较轻"]
 
-        prompt = self.build_prompt_task2_with_tools(defendant_info, case_description, sentencing_factors)
+        if crime_type is None:
+            crime_type = self.identify_crime_type(defendant_info, case_description)
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
+
+        # 量刑情节只解析一次(含"多次诈骗"的补充),提示词构建和每轮工具调用共用
+        factor_index = FactorIndex.from_factors(sentencing_factors, crime_type)
+        prompt = self.build_prompt_task2_with_tools(defendant_info, case_description, sentencing_factors, factor_index,
+                                                    crime_type, region)
 
         messages = [
-            {"role": "system",
-             "content": "你是一位刑事法官,必须使用提供的计算器工具进行精确计算,不要自己估算数值。请根据案件信息判断案件所在地区，如无法判断则使用默认标准。"},
+            {"role": "system", "content": _TASK2_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ]
+        messages.extend(self._preload_base_sentence(crime_type, region, factor_index))
 
         # 多轮对话处理工具调用
         max_iterations = 10
@@ -426,25 +863,23 @@ class SentencingPredictor:
 
         for iteration in range(max_iterations):
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    tools=SENTENCING_TOOLS,
-                    temperature=self.temperature_task2,  # Task2使用较低温度
-                    max_tokens=self.max_tokens
+                assistant_message, cache_key = await self._create_message(
+                    messages,
+                    self.temperature_task2,  # Task2使用较低温度
+                    self.max_tokens_task2_tool,
+                    tools=SENTENCING_TOOLS
                 )
 
-                assistant_message = response.choices[0].message
-
                 # 如果没有工具调用,说明完成
                 if not assistant_message.tool_calls:
                     content = assistant_message.content
                     print(f"  模型最终回复: {content}")
 
                     # 从最终响应中提取区间
-                    json_match = re.search(r'\[\s*(\d+)\s*,\s*(\d+)\s*\]', content)
+                    json_match = _RANGE_RE.search(content)
                     if json_match:
                         final_range = [int(json_match.group(1)), int(json_match.group(2))]
+                        self._cache_message(cache_key, assistant_message)
                         break
                     elif final_range:  # 如果之前已经计算出了区间
                         break
@@ -471,24 +906,16 @@ class SentencingPredictor:
                 # 执行工具调用
                 for tool_call in assistant_message.tool_calls:
                     function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
+                    function_args = _loads(tool_call.function.arguments)
 
                     print(f"  🔧 调用工具: {function_name}")
-                    print(f"     参数: {json.dumps(function_args, ensure_ascii=False)}")
+                    print(f"     参数: {_dumps(function_args)}")
 
                     # 特殊处理：在调用calculate_base_sentence时，提取盗窃次数参数
                     if function_name == "calculate_base_sentence" and "crime_type" in function_args and function_args[
                         "crime_type"] == "盗窃罪":
-                        # 从量刑情节中提取盗窃次数
-                        theft_count = None
-                        for factor in sentencing_factors:
-                            if "盗窃次数" in factor:
-                                try:
-                                    theft_count = int(re.search(r'盗窃次数(\d+)次', factor).group(1))
-                                    break
-                                except:
-                                    pass
-
+                        # 盗窃次数取自预先解析的量刑情节
+                        theft_count = factor_index.theft_count
                         if theft_count is not None:
                             function_args["theft_count"] = theft_count
                             print(f"     添加盗窃次数参数: {theft_count}")
@@ -500,16 +927,8 @@ class SentencingPredictor:
                     # 特殊处理：在调用calculate_base_sentence时，提取诈骗次数参数
                     if function_name == "calculate_base_sentence" and "crime_type" in function_args and function_args[
                         "crime_type"] == "诈骗罪":
-                        # 从量刑情节中提取诈骗次数
-                        fraud_count = None
-                        for factor in sentencing_factors:
-                            if "诈骗次数" in factor:
-                                try:
-                                    fraud_count = int(re.search(r'诈骗次数(\d+)次', factor).group(1))
-                                    break
-                                except:
-                                    pass
-
+                        # 诈骗次数取自预先解析的量刑情节
+                        fraud_count = factor_index.fraud_count
                         if fraud_count is not None:
                             function_args["fraud_count"] = fraud_count
                             print(f"     添加诈骗次数参数: {fraud_count}")
@@ -525,7 +944,7 @@ class SentencingPredictor:
                     # 检查是否是最终的区间结果
                     if function_name == "months_to_range":
                         try:
-                            result_data = json.loads(function_response)
+                            result_data = _loads(function_response)
                             if "range" in result_data:
                                 final_range = result_data["range"]
                         except:
@@ -538,6 +957,13 @@ class SentencingPredictor:
                         "content": function_response
                     })
 
+                # 本轮工具调用均已成功解析执行,缓存该轮响应
+                self._cache_message(cache_key, assistant_message)
+
+                # months_to_range 已给出区间,无需再请模型复述一遍,直接返回
+                if final_range:
+                    return final_range
+
             except Exception as e:
                 print(f"工具调用错误: {e}")
                 return [6, 12]  # Fallback
@@ -548,119 +974,161 @@ class SentencingPredictor:
             print("警告: 达到最大迭代次数但未获得结果")
             return [6, 12]  # Fallback
 
-    def process_all_data(self, preprocessed_data, output_file):
+    async def _process_one(self, idx, total, item_id, defendant_info, case_description, answer1=None):
         """
-        主处理流程:遍历所有数据,执行两阶段预测,并保存结果。
+        处理单条数据:执行两阶段预测,返回 (序号, 结果)。
+        answer1 为批量 Task1 已提取的情节,传入时跳过 Task1 调用。
         """
-        results = []
+        print(f"\n{'=' * 60}")
+        print(f"处理第 {idx + 1}/{total} 条数据 (ID: {item_id})")
+        print(f"{'=' * 60}")
 
-        for idx, item in enumerate(preprocessed_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(preprocessed_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
+        # 罪名和地区每条数据只识别一次(案件文本只拼接、去空白各一次),传给后续各步骤
+        text = defendant_info + case_description
+        crime_type = self.identify_crime_type_on_text(_normalize(text))
+        region = self.extract_region_on_text(text)
 
-            answer1, answer2 = [], []
-            try:
-                # 第一步:调用权威版 Task 1 预测,提取量刑情节
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    item['defendant_info'],
-                    item['case_description']
-                )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                # 第二步:使用工具调用进行刑期预测
-                print("\n【步骤2: 使用工具计算刑期】")
-                answer2 = self.predict_task2_with_tools(
-                    item['defendant_info'],
-                    item['case_description'],
-                    answer1,
-                )
-                print(f"✓ 预测刑期区间: {answer2}")
+        answer2 = []
+        try:
+            # 第一步:调用权威版 Task 1 预测,提取量刑情节
+            print("\n【步骤1: 提取量刑情节】")
+            if answer1 is None:
+                answer1 = await self.predict_task1_authoritative(defendant_info, case_description, region)
+            print(f"✓ 提取到的情节: {answer1}")
+
+            # 第二步:使用工具调用进行刑期预测
+            print("\n【步骤2: 使用工具计算刑期】")
+            answer2 = await self.predict_task2_with_tools(
+                defendant_info,
+                case_description,
+                answer1,
+                crime_type,
+                region,
+            )
+            print(f"✓ 预测刑期区间: {answer2}")
 
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["盗窃数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
-
-            result = {
-                "id": item['id'],
-                "answer1": answer1,
-                "answer2": answer2
-            }
-            results.append(result)
-
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
-
-            # 每处理10条数据保存一次,防止意外中断丢失进度
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
-
-        # 最终保存所有结果
-        self._save_results(results, output_file)
-        print(f"\n所有数据处理完成,结果已保存至: {output_file}")
-        return results
+        except Exception as e:
+            print(f"!!! 处理ID {item_id} 时发生未知严重错误: {e}")
+            answer1 = answer1 if answer1 else ["盗窃数额较大"]
+            answer2 = answer2 if answer2 else [6, 12]
 
-    def process_fact_data(self, fact_data, output_file):
-        """
-        处理fact格式的数据（新格式）
-        """
-        results = []
+        print(f"\n【最终结果 ID: {item_id}】")
+        print(f"  答案1 (情节提取): {answer1}")
+        print(f"  答案2 (刑期预测): {answer2}")
 
-        for idx, item in enumerate(fact_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(fact_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
+        return idx, {
+            "id": item_id,
+            "answer1": answer1,
+            "answer2": answer2
+        }
 
-            answer1, answer2 = [], []
-            try:
-                # 第一步:调用权威版 Task 1 预测,提取量刑情节
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    "",  # 被告人信息为空
-                    item['fact']  # 使用fact字段作为案情描述
-                )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                # 第二步:使用工具调用进行刑期预测
-                print("\n【步骤2: 使用工具计算刑期】")
-                # 从案件信息中提取地区
-                answer2 = self.predict_task2_with_tools(
-                    "",  # 被告人信息为空
-                    item['fact'],  # 使用fact字段作为案情描述
-                    answer1,
-                )
-                print(f"✓ 预测刑期区间: {answer2}")
+    async def _run(self, items, output_file, resume=False):
+        """
+        创建本次运行的客户端并处理全部数据,结束后关闭连接池。
+        """
+        self.client = self._create_client()
+        try:
+            return await self._process_items(items, output_file, resume)
+        finally:
+            await self.client.close()
+            self.client = None
 
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["盗窃数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
-
-            result = {
-                "id": item['id'],
-                "answer1": answer1,
-                "answer2": answer2
-            }
-            results.append(result)
-
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
-
-            # 每处理10条数据保存一次,防止意外中断丢失进度
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
-
-        # 最终保存所有结果
+    async def _process_items(self, items, output_file, resume=False):
+        """
+        并发处理 (id, 被告人信息, 案情描述) 列表,同时在途的请求不超过 max_concurrency 个。
+        每 task1_batch_size 条连续数据合并为一次 Task1 调用,Task2 仍逐条进行(各案件的工具调用状态互相独立)。
+        案情完全相同的数据只预测一次,结果复用到其余重复数据。
+        每完成一条即追加写入 output_file;resume 为 True 时跳过文件中已有结果的数据。
+        全部完成后按输入顺序整理一次结果文件。
+        """
+        finished = self._load_finished_results(output_file) if resume else {}
+        pending = [(idx, item) for idx, item in enumerate(items) if item[0] not in finished]
+        if finished:
+            print(f"断点续跑:已有 {len(items) - len(pending)} 条结果,剩余 {len(pending)} 条待处理")
+
+        # 按 (被告人信息, 案情描述) 的摘要分组,每组只处理第一条
+        groups = {}
+        for idx, (_, defendant_info, case_description) in pending:
+            key = hashlib.blake2b(
+                (defendant_info + "\0" + case_description).encode('utf-8'), digest_size=16
+            ).digest()
+            groups.setdefault(key, []).append(idx)
+        duplicates = {group[0]: group for group in groups.values()}
+        if len(groups) < len(pending):
+            print(f"去重:{len(pending)} 条待处理数据中有 {len(groups)} 条不同案情 "
+                  f"(重复率 {1 - len(groups) / len(pending):.1%})")
+        pending = [(idx, items[idx]) for idx in duplicates]
+
+        total = len(items)
+        results = [finished.get(item[0]) for item in items]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(idx, item, answer1):
+            async with semaphore:
+                return await self._process_one(idx, total, *item, answer1=answer1)
+
+        async def process_chunk(chunk):
+            answers1 = [None] * len(chunk)
+            if len(chunk) > 1:
+                async with semaphore:
+                    answers1 = await self.predict_task1_batch([(d, c) for _, (_, d, c) in chunk])
+            return await asyncio.gather(*(
+                bounded(idx, item, answers1[i]) for i, (idx, item) in enumerate(chunk)
+            ))
+
+        batch_size = max(1, self.task1_batch_size)
+        tasks = [process_chunk(pending[start:start + batch_size]) for start in range(0, len(pending), batch_size)]
+
+        # 完成一条追加一条(行缓冲),中断时已完成的结果不会丢失,也不再反复重写整个文件
+        with open(output_file, 'a' if finished else 'w', encoding='utf-8', buffering=1) as out:
+            if finished:
+                # 中断时末尾可能残留半行,续写前先换行,避免与新结果连成一行
+                out.write('\n')
+            for task in asyncio.as_completed(tasks):
+                for idx, result in await task:
+                    for dup_idx in duplicates[idx]:
+                        dup_result = dict(result, id=items[dup_idx][0])
+                        results[dup_idx] = dup_result
+                        out.write(_dumps(dup_result) + '\n')
+
+        # 追加顺序为完成顺序,最后按输入顺序整理一次
         self._save_results(results, output_file)
         print(f"\n所有数据处理完成,结果已保存至: {output_file}")
         return results
 
+    @staticmethod
+    def _load_finished_results(output_file):
+        """
+        读取已有结果文件,返回 {id: 结果};文件不存在时返回空字典。
+        中断时可能写了半行,无法解析的行直接跳过。
+        """
+        finished = {}
+        if not os.path.exists(output_file):
+            return finished
+        with open(output_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = _loads(line)
+                except ValueError:
+                    continue
+                finished[result["id"]] = result
+        return finished
+
+    def process_all_data(self, preprocessed_data, output_file, resume=False):
+        """
+        主处理流程:并发处理所有数据,执行两阶段预测,并保存结果。
+        """
+        items = [(item['id'], item['defendant_info'], item['case_description']) for item in preprocessed_data]
+        return asyncio.run(self._run(items, output_file, resume))
+
+    def process_fact_data(self, fact_data, output_file, resume=False):
+        """
+        处理fact格式的数据（新格式）
+        """
+        # 被告人信息为空,使用fact字段作为案情描述
+        items = [(item['id'], "", item['fact']) for item in fact_data]
+        return asyncio.run(self._run(items, output_file, resume))
+
     def _save_results(self, results, output_file):
         """
         将结果以jsonl格式保存到文件。
@@ -668,7 +1136,7 @@ class SentencingPredictor:
         try:
             with open(output_file, 'w', encoding='utf-8') as f:
                 for result in results:
-                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    f.write(_dumps(result) + '\n')
         except IOError as e:
             print(f"错误:无法写入文件 {output_file}。请检查权限或路径。错误信息: {e}")
 
@@ -682,7 +1150,7 @@ def load_preprocessed_data(preprocessed_file):
 
     print(f"正在加载预处理数据: {preprocessed_file}")
     with open(preprocessed_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+        data = _loads(f.read())
     print(f"✓ 成功加载 {len(data)} 条预处理数据")
     return data
 
@@ -699,7 +1167,7 @@ def load_fact_data(fact_file):
     with open(fact_file, 'r', encoding='utf-8') as f:
         for line in f:
             if line.strip():
-                data.append(json.loads(line.strip()))
+                data.append(_loads(line.strip()))
     print(f"✓ 成功加载 {len(data)} 条fact数据")
     return data
 
@@ -708,6 +1176,10 @@ def main():
     """
     主函数:初始化并运行整个预测流程。
     """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--resume", action="store_true", help="跳过结果文件中已有的数据,从中断处继续")
+    args = ap.parse_args()
+
     # 配置文件路径
     preprocessed_file = "extracted_info_fusai1.json"
     fact_file = "../data/zp.jsonl"
@@ -731,7 +1203,7 @@ def main():
         print("=" * 60 + "\n")
 
         predictor = SentencingPredictor()
-        results = predictor.process_fact_data(fact_data, output_file)
+        results = predictor.process_fact_data(fact_data, output_file, resume=args.resume)
 
         print("\n" + "=" * 60)
         print("✓ 任务完成!")
@@ -752,7 +1224,7 @@ def main():
     print("=" * 60 + "\n")
 
     predictor = SentencingPredictor()
-    results = predictor.process_all_data(preprocessed_data, output_file)
+    results = predictor.process_all_data(preprocessed_data, output_file, resume=args.resume)
 
     print("\n" + "=" * 60)
     print("✓ 任务完成!")
@@ -3,15 +3,174 @@
 提供精确的量刑计算功能，避免 LLM 直接进行数值计算
 """
 
+import io
 import json
-from typing import Dict, List, Union
+import logging
+import sys
+from collections import namedtuple
+from dataclasses import dataclass
+from functools import lru_cache
+from math import prod
+from types import MappingProxyType
+from typing import Dict, List, NamedTuple, Sequence, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # orjson 仅用于加速序列化，缺失时回退到标准库 json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# 驻留的罪名常量：调用方传入同一驻留对象时，比较可直接命中指针相等
+_FRAUD = sys.intern("诈骗罪")
+
+
+def _freeze_standards(mapping: dict) -> MappingProxyType:
+    """递归驻留地区名、档位键及城市映射中的省份名，并返回只读视图"""
+    return MappingProxyType({
+        sys.intern(k): (
+            _freeze_standards(v) if isinstance(v, dict)
+            else sys.intern(v) if isinstance(v, str)
+            else v
+        )
+        for k, v in mapping.items()
+    })
+
+
+@lru_cache(maxsize=128)
+def _get_standards_by_region(region: str) -> Dict:
+    """
+    根据 region 获取对应的标准字典（含 theft / fraud），带城市到省份映射。
+
+    地区取值有限，按 region 缓存；REGIONAL_STANDARDS 为只读视图，缓存无需失效。
+    """
+    all_std = SentencingCalculator.REGIONAL_STANDARDS
+    if region in all_std:
+        return all_std[region]
+    cities_map = all_std.get("cities_to_provinces", {})
+    if region in cities_map:
+        province = cities_map[region]
+        return all_std.get(province, all_std["default"])
+    return all_std["default"]
+
+
+def _fraud_kernel(A: float, L: float, H: float, EH: float, k1: float, k2: float, k3: float) -> int:
+    """
+    诈骗罪基准刑的纯数值部分：阈值与斜率已按地区预先算好（见 _FRAUD_COEFFS），仅做分段线性插值
+    """
+    # 低于立案标准：给一个低值
+    if A < L:
+        return 6
+
+    # 数额较大：在 [L, H) 之间线性插值到 6~36 月
+    if A < H:
+        return round(6 + (A - L) * k1)
+
+    # 数额巨大：在 [H, EH) 之间线性插值到 36~120 月
+    if A < EH:
+        return round(36 + (A - H) * k2)
+
+    # 数额特别巨大：120~160 月，随超额金额缓慢上浮，超额达到 EH 时封顶 160 月
+    return round(120 + min(40.0, (A - EH) * k3))
+
+
+# 诈骗罪法定刑档位：(金额上限, (最低月数, 最高月数))，按金额升序排列；超过最后上限为最高档
+_FRAUD_RANGES = (
+    (30000, (6, 36)),
+    (500000, (36, 120)),
+)
+_FRAUD_TOP_RANGE = (120, 180)
+_DEFAULT_RANGE = (6, 120)
+
+# 情节记录：层内循环直接按元组解包，避免逐项字典查找
+Factor = namedtuple("Factor", ["name", "ratio"])
+
+
+def _coerce_factors(factors) -> List[Factor]:
+    """
+    在调用边界将情节列表统一为 Factor(name, ratio)。
+    兼容 {"name"/"factor": ..., "ratio": ...} 字典与 (name, ratio) 序列两种写法。
+    """
+    if not factors:
+        return []
+    coerced = []
+    for factor in factors:
+        if isinstance(factor, dict):
+            get = factor.get
+            coerced.append(Factor(get("name") or get("factor"), factor["ratio"]))
+        else:
+            coerced.append(Factor(*factor))
+    return coerced
+
+
+def _trace_line(buf: io.StringIO, fmt: str, *args) -> None:
+    """按 % 格式化一行计算过程写入缓冲区"""
+    buf.write(fmt % args if args else fmt)
+    buf.write("\n")
+
+
+class LazySteps:
+    """计算步骤的延迟格式化容器：只记录 (格式串, 参数)，读取时才生成字符串"""
+
+    __slots__ = ("_raw",)
+
+    def __init__(self):
+        self._raw = []
+
+    def add(self, fmt: str, *args) -> None:
+        self._raw.append((fmt, args))
+
+    def __iter__(self):
+        for fmt, args in self._raw:
+            yield fmt % args
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [fmt % args for fmt, args in self._raw[index]]
+        fmt, args = self._raw[index]
+        return fmt % args
+
+    def __eq__(self, other):
+        if isinstance(other, (LazySteps, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"LazySteps({list(self)!r})"
+
+
+class SentenceResult(NamedTuple):
+    """分层量刑计算结果；需要 JSON 时调用 _asdict()"""
+    final_months: float
+    base_months: int
+    calculation_steps: Sequence[str]
+    constrained: bool
+
+
+def apply_factor(base_months: int, factor_name: str, factor_ratio: float, _round=round) -> float:
+    """
+    应用单个情节调节因子
+    """
+    return _round(base_months * factor_ratio, 2)
+
+
+def calculate_simple_adjustment(base_months: int, adjustment_percent: float, _round=round) -> int:
+    """
+    简单百分比调节计算
+    """
+    return _round(base_months * (1.0 + adjustment_percent / 100.0))
 
 
 class SentencingCalculator:
     """量刑计算器：用于精确计算刑期"""
 
     # 各地区盗窃罪、诈骗罪数额标准（单位：元）
-    REGIONAL_STANDARDS = {
+    REGIONAL_STANDARDS = _freeze_standards({
         "default": {
             "theft": {"large": 1000, "huge": 30000, "especially_huge": 300000},
             "fraud": {"large": 3000, "huge": 30000, "especially_huge": 500000}
@@ -269,60 +428,64 @@ class SentencingCalculator:
             "拉萨": "西藏",
             "兰州": "甘肃"
         }
-    }
+    })
 
-    @staticmethod
-    def _get_standards_by_region(region: str) -> Dict:
-        """
-        根据 region 获取对应的标准字典（含 theft / fraud），带城市到省份映射。
-        """
-        all_std = SentencingCalculator.REGIONAL_STANDARDS
-        if region in all_std:
-            return all_std[region]
-        cities_map = all_std.get("cities_to_provinces", {})
-        if region in cities_map:
-            province = cities_map[region]
-            return all_std.get(province, all_std["default"])
-        return all_std["default"]
+    _get_standards_by_region = staticmethod(_get_standards_by_region)
 
     @staticmethod
-    def _calculate_base_sentence_fraud(amount: float, region: str = "default") -> int:
+    def _calculate_base_sentence_fraud(amount: float, region: str = "default",
+                                       context: "SentencingContext" = None) -> int:
         """
         诈骗罪基准刑（单位：月）——线性插值版，重点调整“特别巨大”档位：
         - 数额较大：6~36 个月
         - 数额巨大：36~120 个月
         - 数额特别巨大：120~160 个月（而不是 120~180，避免普遍打到极高刑期）
+
+        传入 context 时直接使用其中已解析的地区参数，忽略 region。
+        """
+        coeffs = context.fraud_coeffs if context is not None else (
+            _FRAUD_COEFFS.get(region) or _FRAUD_COEFFS["default"])
+        return _fraud_kernel(amount or 0.0, *coeffs)
+
+    @staticmethod
+    def _calculate_base_sentence_fraud_batch(amounts, region: str = "default"):
         """
-        standards = SentencingCalculator._get_standards_by_region(region)
-        fraud_std = standards["fraud"]
-
-        A = amount or 0.0
-        L = fraud_std["large"]
-        H = fraud_std["huge"]
-        EH = fraud_std["especially_huge"]
-
-        # 低于立案标准：给一个低值
-        if A < L:
-            return 6
-
-        # 数额较大：在 [L, H) 之间线性插值到 6~36 月
-        if A < H:
-            ratio = (A - L) / float(H - L) if H > L else 0.0
-            base = 6 + ratio * (36 - 6)
-            return int(round(base))
-
-        # 数额巨大：在 [H, EH) 之间线性插值到 36~120 月
-        if A < EH:
-            ratio = (A - H) / float(EH - H) if EH > H else 0.0
-            base = 36 + ratio * (120 - 36)
-            return int(round(base))
-
-        # 数额特别巨大：120~160 月，随超额金额缓慢上浮
-        # extra_ratio = 0 时，对应刚刚超过特别巨大起点 → 120 月
-        # extra_ratio = 1 时，对应金额明显高于起点 → 160 月
-        extra_ratio = min(1.0, (A - EH) / float(EH)) if EH > 0 else 1.0
-        base = 120 + extra_ratio * 40  # 120→160
-        return int(round(base))
+        诈骗罪基准刑的批量版本：分段线性插值整体向量化，结果与逐条调用 _calculate_base_sentence_fraud 一致。
+        适用于数据集评估等一次计算大量金额的场景。
+        """
+        import numpy as np
+
+        region_idx = np.full(np.shape(amounts), fraud_region_index(region), dtype=np.intp)
+        return SentencingCalculator._calculate_base_sentence_fraud_batch_by_index(amounts, region_idx)
+
+    @staticmethod
+    def _calculate_base_sentence_fraud_batch_by_index(amounts, region_idx):
+        """
+        多地区混合的批量版本：region_idx 为每条金额对应的地区行号（由 fraud_region_index 得到），
+        阈值从 (地区数, 3) 的矩阵中按行号整体取出。
+        """
+        import numpy as np
+
+        A = np.asarray(amounts, dtype=np.float64)
+        rows = _fraud_matrix()[np.asarray(region_idx, dtype=np.intp)]
+        L = rows[..., 0].astype(np.float64)
+        H = rows[..., 1].astype(np.float64)
+        EH = rows[..., 2].astype(np.float64)
+
+        # 低于立案标准的默认取 6，其余三档按掩码分段覆盖（H<=L、EH<=H 时对应档位掩码为空）
+        out = np.full(A.shape, 6, dtype=np.int32)
+
+        m = (A >= L) & (A < H)
+        out[m] = np.rint(6 + (A[m] - L[m]) / (H[m] - L[m]) * (36 - 6))
+
+        m = (A >= H) & (A < EH)
+        out[m] = np.rint(36 + (A[m] - H[m]) / (EH[m] - H[m]) * (120 - 36))
+
+        m = A >= EH
+        with np.errstate(divide="ignore", invalid="ignore"):
+            extra_ratio = np.where(EH[m] > 0, np.minimum(1.0, (A[m] - EH[m]) / EH[m]), 1.0)
+        out[m] = np.rint(120 + extra_ratio * 40)
+        return out
 
     @staticmethod
     def calculate_base_sentence(
@@ -331,16 +494,20 @@ class SentencingCalculator:
         injury_level: str = None,
         region: str = "default",
         theft_count: int = None,
-        fraud_count: int = None
+        fraud_count: int = None,
+        context: "SentencingContext" = None
     ) -> int:
         """
         计算基准刑（单位：月）
         - 目前重点优化诈骗罪；
         - 其他罪名使用简单默认值，可按需扩展。
+        - 传入 context 时直接使用其中已解析的地区参数，忽略 region。
         """
-        # 诈骗罪：使用线性插值版本
-        if crime_type == "诈骗罪":
-            return SentencingCalculator._calculate_base_sentence_fraud(amount or 0.0, region)
+        # 诈骗罪：使用线性插值版本（本任务几乎全部为诈骗罪，直接内联阈值查找与插值）
+        if crime_type is _FRAUD or crime_type == _FRAUD:
+            coeffs = context.fraud_coeffs if context is not None else (
+                _FRAUD_COEFFS.get(region) or _FRAUD_COEFFS["default"])
+            return _fraud_kernel(amount if amount is not None else 0.0, *coeffs)
 
         # 其他罪名可以在此按需添加更精细的逻辑
         # 盗窃罪、故意伤害罪、职务侵占罪等目前返回一个中性基准值
@@ -351,108 +518,119 @@ class SentencingCalculator:
             base_months: int,
             crime_type: str,
             amount: float,
-            layer1_factors: List[Dict[str, Union[str, float]]],
-            layer2_factors: List[Dict[str, Union[str, float]]],
+            layer1_factors: List[Union[Dict[str, Union[str, float]], Factor]],
+            layer2_factors: List[Union[Dict[str, Union[str, float]], Factor]],
             has_statutory_mitigation: bool = False,
-            injury_level: str = None
-    ) -> Dict[str, Union[float, str]]:
+            injury_level: str = None,
+            verbose: bool = False
+    ) -> SentenceResult:
         """
-        分层计算最终刑期——打印完整计算过程。
+        分层计算最终刑期。
+
+        计算过程以 DEBUG 级别写入日志；verbose=True 时才记录 calculation_steps（LazySteps，读取时才格式化），否则为空。
         """
-        steps = []
+        debug = logger.isEnabledFor(logging.DEBUG)
+        steps = LazySteps()
         current_months = float(base_months)
 
-        print("====== [Calc] 分层量刑计算开始 ======")
-        print(f"[Calc] 罪名: {crime_type}, 金额: {amount}, 基准刑: {base_months} 月")
-        print(f"[Calc] 第一层情节: {layer1_factors}")
-        print(f"[Calc] 第二层情节: {layer2_factors}")
-        print(f"[Calc] 是否存在法定减轻情节: {has_statutory_mitigation}")
+        # 无任何情节且不记录过程（基线计算的常见情形）：直接返回基准刑
+        if not layer1_factors and not layer2_factors and not (verbose or debug):
+            return SentenceResult(round(current_months if current_months >= 1 else 1.0, 2), base_months, steps, False)
 
-        steps.append(f"基准刑: {base_months}个月")
+        if debug:
+            # 计算过程先写入缓冲区，结束时作为一条日志统一输出
+            buf = io.StringIO()
+            _trace_line(buf, "====== [Calc] 分层量刑计算开始 ======")
+            _trace_line(buf, "[Calc] 罪名: %s, 金额: %s, 基准刑: %s 月", crime_type, amount, base_months)
+            _trace_line(buf, "[Calc] 第一层情节: %s", layer1_factors)
+            _trace_line(buf, "[Calc] 第二层情节: %s", layer2_factors)
+            _trace_line(buf, "[Calc] 是否存在法定减轻情节: %s", has_statutory_mitigation)
+
+        if verbose:
+            steps.add("基准刑: %s个月", base_months)
+
+        layer1 = _coerce_factors(layer1_factors)
+        layer2 = _coerce_factors(layer2_factors)
+        # 不记录步骤和日志时，两层的连乘 / 累加直接交给 prod / sum 归约
+        trace = verbose or debug
 
         # 第一层面：连乘
-        layer1_multiplier = 1.0
-        for factor in layer1_factors or []:
-            name = factor.get("name") or factor.get("factor")
-            ratio = factor["ratio"]
-            layer1_multiplier *= ratio
-            steps.append(f"第一层面 - {name}: ×{ratio}")
-            print(f"[Calc] 第一层情节: {name}, 比例: {ratio}, 累计乘数: {layer1_multiplier:.4f}")
-
-        if layer1_factors:
-            current_months = base_months * layer1_multiplier
-            steps.append(f"第一层面结果: {current_months:.2f}个月")
-            print(f"[Calc] 第一层结果: {current_months:.2f} 月")
+        if trace:
+            layer1_multiplier = 1.0
+            for name, ratio in layer1:
+                layer1_multiplier *= ratio
+                if verbose:
+                    steps.add("第一层面 - %s: ×%s", name, ratio)
+                if debug:
+                    _trace_line(buf, "[Calc] 第一层情节: %s, 比例: %s, 累计乘数: %.4f", name, ratio, layer1_multiplier)
         else:
-            print("[Calc] 无第一层情节，当前刑期保持为基准刑。")
+            layer1_multiplier = prod([ratio for _, ratio in layer1])
+
+        if layer1:
+            current_months = base_months * layer1_multiplier
+            if verbose:
+                steps.add("第一层面结果: %.2f个月", current_months)
+            if debug:
+                _trace_line(buf, "[Calc] 第一层结果: %.2f 月", current_months)
+        elif debug:
+            _trace_line(buf, "[Calc] 无第一层情节，当前刑期保持为基准刑。")
 
         # 第二层面：按比例叠加
-        layer2_adjustment = 0.0
-        for factor in layer2_factors or []:
-            name = factor.get("name") or factor.get("factor")
-            ratio = factor["ratio"]
-            adjustment = ratio - 1.0
-            layer2_adjustment += adjustment
-            steps.append(f"第二层面 - {name}: {'+' if adjustment > 0 else ''}{adjustment * 100:.0f}%")
-            print(f"[Calc] 第二层情节: {name}, 比例: {ratio}, "
-                  f"本项增减: {adjustment * 100:.1f}%, 累计增减: {layer2_adjustment * 100:.1f}%")
-
-        if layer2_factors:
+        if trace:
+            layer2_adjustment = 0.0
+            for name, ratio in layer2:
+                adjustment = ratio - 1.0
+                layer2_adjustment += adjustment
+                if verbose:
+                    steps.add("第二层面 - %s: %s%.0f%%", name, "+" if adjustment > 0 else "", adjustment * 100)
+                if debug:
+                    _trace_line(buf, "[Calc] 第二层情节: %s, 比例: %s, 本项增减: %.1f%%, 累计增减: %.1f%%",
+                                name, ratio, adjustment * 100, layer2_adjustment * 100)
+        else:
+            layer2_adjustment = sum([ratio - 1.0 for _, ratio in layer2])
+
+        if layer2:
             layer2_multiplier = 1.0 + layer2_adjustment
             temp_final = current_months * layer2_multiplier
-            steps.append(f"第二层面初步结果: {temp_final:.2f}个月")
-            print(f"[Calc] 第二层乘数: {layer2_multiplier:.4f}, 第二层结果: {temp_final:.2f} 月")
+            if verbose:
+                steps.add("第二层面初步结果: %.2f个月", temp_final)
+            if debug:
+                _trace_line(buf, "[Calc] 第二层乘数: %.4f, 第二层结果: %.2f 月", layer2_multiplier, temp_final)
         else:
             temp_final = current_months
-            print("[Calc] 无第二层情节，当前刑期保持第一层结果。")
+            if debug:
+                _trace_line(buf, "[Calc] 无第二层情节，当前刑期保持第一层结果。")
 
         # 基本有效性检查：不得低于 1 个月
         if temp_final < 1:
-            steps.append(f"⚠️ 调整: 结果({temp_final:.2f}月)低于1个月，调整至1个月")
-            print(f"[Calc] 结果 {temp_final:.2f} 月 < 1 月，调整为 1 月。")
+            if verbose:
+                steps.add("⚠️ 调整: 结果(%.2f月)低于1个月，调整至1个月", temp_final)
+            if debug:
+                _trace_line(buf, "[Calc] 结果 %.2f 月 < 1 月，调整为 1 月。", temp_final)
             temp_final = 1.0
 
         final_months = round(temp_final, 2)
-        print(f"[Calc] 最终刑期: {final_months} 月")
-        print("====== [Calc] 分层量刑计算结束 ======\n")
-
-        return {
-            "final_months": final_months,
-            "base_months": base_months,
-            "calculation_steps": steps,
-            "constrained": False
-        }
+        if debug:
+            _trace_line(buf, "[Calc] 最终刑期: %s 月", final_months)
+            _trace_line(buf, "====== [Calc] 分层量刑计算结束 ======")
+            logger.debug("%s", buf.getvalue().rstrip("\n"))
+
+        return SentenceResult(final_months, base_months, steps, False)
 
     @staticmethod
     def _get_legal_range(crime_type: str, amount: float, injury_level: str = None) -> tuple:
         """
         获取法定刑档位的上下限（可根据需要使用）
         """
-        if crime_type == "诈骗罪":
-            if amount < 30000:
-                return (6, 36)
-            elif amount < 500000:
-                return (36, 120)
-            else:
-                return (120, 180)
-        return (6, 120)
+        if crime_type is _FRAUD or crime_type == _FRAUD:
+            for upper, legal_range in _FRAUD_RANGES:
+                if amount < upper:
+                    return legal_range
+            return _FRAUD_TOP_RANGE
+        return _DEFAULT_RANGE
 
-    @staticmethod
-    def apply_factor(base_months: int, factor_name: str, factor_ratio: float) -> float:
-        """
-        应用单个情节调节因子
-        """
-        result = base_months * factor_ratio
-        return round(result, 2)
-
-    @staticmethod
-    def calculate_simple_adjustment(base_months: int, adjustment_percent: float) -> int:
-        """
-        简单百分比调节计算
-        """
-        multiplier = 1.0 + (adjustment_percent / 100.0)
-        result = base_months * multiplier
-        return round(result)
+    apply_factor = staticmethod(apply_factor)
+    calculate_simple_adjustment = staticmethod(calculate_simple_adjustment)
 
     @staticmethod
     def months_to_range(center_months: float, width: int = None) -> List[int]:
@@ -466,10 +644,9 @@ class SentencingCalculator:
         min_months = max(1, round(center_months - half_width))
         max_months = max(1, round(center_months + half_width))
 
-        print("------ [Range] 刑期区间计算 ------")
-        print(f"[Range] 中心刑期: {center_months} 月, 预设宽度: {width} 月")
-        print(f"[Range] 计算得到区间: [{int(min_months)}, {int(max_months)}]")
-        print("------ [Range] 计算结束 ------\n")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[Range] 中心刑期: %s 月, 预设宽度: %s 月, 计算得到区间: [%d, %d]",
+                         center_months, width, min_months, max_months)
 
         return [int(min_months), int(max_months)]
 
@@ -485,6 +662,75 @@ class SentencingCalculator:
         return months
 
 
+def _build_thresholds(kind: str) -> Dict[str, Tuple[int, int, int]]:
+    """
+    将 REGIONAL_STANDARDS 展平为 region -> (large, huge, especially_huge)，城市提前解析到所属省份。
+    """
+    all_std = SentencingCalculator.REGIONAL_STANDARDS
+    table = {
+        region: (std[kind]["large"], std[kind]["huge"], std[kind]["especially_huge"])
+        for region, std in all_std.items()
+        if region != "cities_to_provinces"
+    }
+    for city, province in all_std.get("cities_to_provinces", {}).items():
+        # 与 _get_standards_by_region 一致：地区本身有标准时优先，省份缺失时回退到 default
+        table.setdefault(city, table.get(province, table["default"]))
+    return table
+
+
+# 展平后的数额标准：热路径上一次字典查找即可取得三档阈值
+FRAUD_THRESHOLDS = _build_thresholds("fraud")
+
+
+def _fraud_coeffs(L: int, H: int, EH: int) -> Tuple[float, ...]:
+    """将各档的刑期跨度与金额跨度预先折算成斜率，热路径上不再做除法"""
+    k1 = 30.0 / (H - L) if H > L else 0.0     # 6~36 月
+    k2 = 84.0 / (EH - H) if EH > H else 0.0   # 36~120 月
+    k3 = 40.0 / EH if EH > 0 else float("inf")  # 120~160 月；EH<=0 时直接封顶
+    return (L, H, EH, k1, k2, k3)
+
+
+# region -> (L, H, EH, k1, k2, k3)，供 _fraud_kernel 使用
+_FRAUD_COEFFS = {region: _fraud_coeffs(*t) for region, t in FRAUD_THRESHOLDS.items()}
+
+
+# 批量计算用的地区行号：按地区名排序编号，未知地区落到 default 行
+_FRAUD_REGIONS = tuple(sorted(FRAUD_THRESHOLDS))
+_REGION_INDEX = {name: i for i, name in enumerate(_FRAUD_REGIONS)}
+_DEFAULT_REGION_INDEX = _REGION_INDEX["default"]
+
+
+def fraud_region_index(region: str) -> int:
+    """地区名 -> 批量计算阈值矩阵中的行号"""
+    return _REGION_INDEX.get(region, _DEFAULT_REGION_INDEX)
+
+
+@lru_cache(maxsize=1)
+def _fraud_matrix():
+    """(地区数, 3) 的 int32 诈骗罪阈值矩阵，行号见 fraud_region_index；首次批量计算时构建"""
+    import numpy as np
+
+    return np.array([FRAUD_THRESHOLDS[name] for name in _FRAUD_REGIONS], dtype=np.int32)
+
+
+@dataclass(frozen=True, slots=True)
+class SentencingContext:
+    """
+    单个案件预先解析好的地区量刑参数：每案创建一次，在基准刑、区间宽度等步骤间传递，避免重复按地区查表。
+    """
+    region: str
+    fraud_coeffs: Tuple[float, ...]  # (L, H, EH, k1, k2, k3)，见 _FRAUD_COEFFS
+
+    @classmethod
+    def for_region(cls, region: str = "default") -> "SentencingContext":
+        return cls(region, _FRAUD_COEFFS.get(region) or _FRAUD_COEFFS["default"])
+
+    @property
+    def fraud_thresholds(self) -> Tuple[int, int, int]:
+        """诈骗罪 (数额较大, 数额巨大, 数额特别巨大) 起点"""
+        return self.fraud_coeffs[:3]
+
+
 # 工具函数定义（OpenAI Function Calling 格式）
 SENTENCING_TOOLS = [
     {
@@ -611,8 +857,16 @@ SENTENCING_TOOLS = [
                     "base_months": {"type": "integer"},
                     "crime_type": {"type": "string", "enum": ["盗窃罪", "诈骗罪", "故意伤害罪"]},
                     "amount": {"type": "number"},
-                    "layer1_factors": {"type": "array", "items": {"type": "object"}},
-                    "layer2_factors": {"type": "array", "items": {"type": "object"}},
+                    "layer1_factors": {
+                        "type": "array",
+                        "items": {"type": "object"},
+                        "description": "第一层面情节列表，每项为 {\"name\": 情节名称, \"ratio\": 调节比例}"
+                    },
+                    "layer2_factors": {
+                        "type": "array",
+                        "items": {"type": "object"},
+                        "description": "第二层面情节列表，每项为 {\"name\": 情节名称, \"ratio\": 调节比例}"
+                    },
                     "has_statutory_mitigation": {
                         "type": "boolean",
                         "description": "是否有法定减轻处罚情节(自首/立功/未成年人等)"
@@ -621,6 +875,10 @@ SENTENCING_TOOLS = [
                         "type": "string",
                         "description": "伤害等级，适用于故意伤害罪",
                         "enum": ["轻伤一级", "轻伤二级", "重伤一级", "重伤二级", "致人死亡", "死亡"]
+                    },
+                    "verbose": {
+                        "type": "boolean",
+                        "description": "是否返回计算步骤（默认不返回）"
                     }
                 },
                 "required": ["base_months", "crime_type", "amount", "layer1_factors", "layer2_factors"]
@@ -655,31 +913,87 @@ SENTENCING_TOOLS = [
 ]
 
 
-def execute_tool_call(tool_name: str, tool_arguments: dict) -> str:
+# default=list：LazySteps 等可迭代对象按列表输出
+if orjson is not None:
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, default=list).decode("utf-8")
+else:
+    def _dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=list)
+
+
+# 工具名 -> (计算函数, 结果序列化函数)
+# 基准刑恒为整数，直接按模板拼出 JSON，无需经过序列化器
+_DISPATCH = {
+    "calculate_base_sentence": (
+        SentencingCalculator.calculate_base_sentence, lambda r: f'{{"base_months":{r}}}'
+    ),
+    "calculate_layered_sentence_with_constraints": (
+        SentencingCalculator.calculate_layered_sentence_with_constraints, lambda r: _dumps(r._asdict())
+    ),
+    "months_to_range": (
+        SentencingCalculator.months_to_range, lambda r: _dumps({"range": r})
+    ),
+    "validate_legal_range": (
+        SentencingCalculator.validate_legal_range, lambda r: _dumps({"validated_months": r})
+    ),
+}
+
+
+class _FrozenDict(tuple):
+    """冻结后的字典：按键排序的 (key, value) 元组"""
+    __slots__ = ()
+
+
+class _FrozenList(tuple):
+    """冻结后的列表 / 元组"""
+    __slots__ = ()
+
+
+def _freeze(value):
     """
-    执行工具调用（为兼容保留；当前 Task2 已不依赖 LLM 工具调用，但你可在调试时继续使用）。
+    将工具参数递归转换为可哈希的缓存键。
+    叶子值带上类型，避免 1 / 1.0 / True 命中同一条缓存而输出不同的 JSON。
     """
-    calculator = SentencingCalculator()
+    if isinstance(value, dict):
+        return _FrozenDict((k, _freeze(v)) for k, v in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return _FrozenList(_freeze(v) for v in value)
+    return (type(value), value)
+
+
+def _thaw(value):
+    """_freeze 的逆操作"""
+    if type(value) is _FrozenDict:
+        return {k: _thaw(v) for k, v in value}
+    if type(value) is _FrozenList:
+        return [_thaw(v) for v in value]
+    return value[1]
+
 
+def _run_tool_call(tool_name: str, tool_arguments: dict) -> str:
+    func, serialize = _DISPATCH[tool_name]
     try:
-        if tool_name == "calculate_base_sentence":
-            result = calculator.calculate_base_sentence(**tool_arguments)
-            return json.dumps({"base_months": result}, ensure_ascii=False)
+        return serialize(func(**tool_arguments))
+    except Exception as e:
+        return _dumps({"error": str(e)})
 
-        elif tool_name == "calculate_layered_sentence_with_constraints":
-            result = calculator.calculate_layered_sentence_with_constraints(**tool_arguments)
-            return json.dumps(result, ensure_ascii=False)
 
-        elif tool_name == "months_to_range":
-            result = calculator.months_to_range(**tool_arguments)
-            return json.dumps({"range": result}, ensure_ascii=False)
+@lru_cache(maxsize=1024)
+def _cached_tool_call(tool_name: str, frozen_arguments: _FrozenDict) -> str:
+    """各工具均为确定性计算，评估回放中相同参数反复出现时直接复用序列化结果"""
+    return _run_tool_call(tool_name, _thaw(frozen_arguments))
 
-        elif tool_name == "validate_legal_range":
-            result = calculator.validate_legal_range(**tool_arguments)
-            return json.dumps({"validated_months": result}, ensure_ascii=False)
 
-        else:
-            return json.dumps({"error": f"未知工具: {tool_name}"}, ensure_ascii=False)
+def execute_tool_call(tool_name: str, tool_arguments: dict) -> str:
+    """
+    执行工具调用（为兼容保留；当前 Task2 已不依赖 LLM 工具调用，但你可在调试时继续使用）。
+    """
+    if tool_name not in _DISPATCH:
+        return _dumps({"error": f"未知工具: {tool_name}"})
 
-    except Exception as e:
-        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    try:
+        return _cached_tool_call(tool_name, _freeze(tool_arguments))
+    except TypeError:
+        # 参数中含不可哈希或无法排序的值：不走缓存
+        return _run_tool_call(tool_name, tool_arguments)
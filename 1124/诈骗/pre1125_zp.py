@@ -1,166 +1,178 @@
+import argparse
+import asyncio
+import hashlib
 import json
+import logging
 import os
 import re
-from openai import OpenAI
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-from cal_zp import SENTENCING_TOOLS, execute_tool_call, SentencingCalculator
+from cal_zp import SENTENCING_TOOLS, execute_tool_call, Factor, SentencingCalculator, SentencingContext
+
+try:
+    import orjson
+except ImportError:  # orjson 仅用于加速解析和序列化，缺失时回退到标准库 json
+    orjson = None
+
+# 解析与序列化 JSON（输入数据、结果文件）
+_loads = orjson.loads if orjson is not None else json.loads
+
+if orjson is not None:
+    def _dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
 
 # 加载环境变量
 load_dotenv()
 
-
-class SentencingPredictor:
+logger = logging.getLogger(__name__)
+
+# 设置 ZP_VERBOSE=1 输出逐条数据的详细过程（含 Task2 计算流程）
+_VERBOSE = os.getenv("ZP_VERBOSE", "").strip().lower() in ("1", "true", "yes")
+
+
+# 预编译的正则表达式，避免每条数据、每个情节标签重复查找 re 模块的内部缓存
+# 指控罪名
+_CHARGE_RE = re.compile(r'(因涉嫌|指控犯)(.*?)罪')
+# 模型输出中的 JSON 数组（单条）与 JSON 对象（批量）
+_JSON_ARRAY_RE = re.compile(r'\[.*?\]', re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+# 金额标签规范化：诈骗金额既遂/未遂 XXXX 元 / 万元，一次匹配同时取得单位
+_FRAUD_AMOUNT_RE = re.compile(r"(诈骗金额[既未]遂)([\d\.]+)(万?)元")
+# Task2 从标签中提取金额（万元/元一次匹配）与次数
+_AMOUNT_RE = re.compile(r"金额[既未]遂([\d\.]+)(万?)元")
+_FRAUD_COUNT_RE = re.compile(r"诈骗次数(\d+)次")
+
+# Task1 后处理中原样保留的标签
+_ALLOWED_EXACT = frozenset((
+    "诈骗数额较大", "诈骗数额巨大", "诈骗数额特别巨大",
+    "电信网络诈骗",
+    "自首", "坦白", "认罪认罚", "当庭自愿认罪",
+    "退赔全部损失", "退赔部分损失",
+    "取得谅解",
+    "前科", "累犯"
+))
+
+# 指控不明确时按关键词识别罪名，罪名按顺序优先
+_CRIME_KEYWORDS = (
+    ("盗窃罪", ("盗窃", "窃取", "扒窃", "盗走")),
+    ("故意伤害罪", ("故意伤害", "殴打", "打伤", "轻伤", "重伤")),
+    ("诈骗罪", ("诈骗", "骗取", "虚构事实")),
+    ("职务侵占罪", ("职务侵占", "挪用资金", "非法占有")),
+)
+_CRIME_NAMES = tuple(crime for crime, _ in _CRIME_KEYWORDS)
+_CRIME_KEYWORD_RANK = {kw: rank for rank, (_, kws) in enumerate(_CRIME_KEYWORDS) for kw in kws}
+
+# 常见的地区关键词（省份优先，其次城市；同类中按列表顺序优先）
+_PROVINCES = ("北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
+              "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
+              "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
+              "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
+              "香港", "澳门")
+_CITIES = ("江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
+           "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
+           "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
+           "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
+           "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
+           "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州")
+_REGION_NAMES = _PROVINCES + _CITIES
+_REGION_RANK = {name: rank for rank, name in enumerate(_REGION_NAMES)}
+
+
+def _keyword_scan_re(keywords):
     """
-    一个基于大型语言模型的法律量刑预测器。
-    Task1 使用 LLM 做情节抽取（带强约束提示词）；
-    Task2 改为纯规则 + 计算器的确定性计算，避免 LLM 在数值与权重上自由发挥。
+    把关键词合并为一个正则，一次线性扫描找出全部出现位置。
+    零宽先行断言使相互重叠的关键词（如"河北京"中的"河北"与"北京"）都能被匹配到。
     """
+    return re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))")
 
-    def __init__(self):
-        """
-        初始化客户端和模型配置。
-        """
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_BASE_URL")
-        )
-        self.model_name = os.getenv("OPENAI_MODEL", "qwen-max")
-        self.temperature_task1 = 0.1  # Task1 使用稍低温度，保证稳定 + 轻微多样性
-        self.temperature_task2 = 0.1  # Task2 已改为规则化，这个参数基本不会再用
-        self.max_tokens = 32768
 
-    # ===== 基础信息抽取工具 =====
+_CRIME_KEYWORD_RE = _keyword_scan_re(_CRIME_KEYWORD_RANK)
+_REGION_RE = _keyword_scan_re(_REGION_NAMES)
 
-    def identify_crime_type(self, defendant_info, case_description):
-        """
-        增强版的罪名识别函数。
-        优先从指控中识别,其次通过关键词匹配。
-        """
-        text = (defendant_info or "") + (case_description or "")
-        text = text.replace(" ", "").replace("\n", "")
 
-        # 1. 优先匹配指控罪名
-        charge_match = re.search(r'(因涉嫌|指控犯)(.*?)罪', text)
-        if charge_match:
-            crime = charge_match.group(2)
-            if "盗窃" in crime:
-                return "盗窃罪"
-            if "故意伤害" in crime:
-                return "故意伤害罪"
-            if "诈骗" in crime:
-                return "诈骗罪"
-            if "职务侵占" in crime:
-                return "职务侵占罪"
+# 罪名识别前去除的空白字符
+_STRIP_WHITESPACE = str.maketrans("", "", " \n")
 
-        # 2. 关键词备用
-        theft_keywords = ["盗窃", "窃取", "扒窃", "盗走"]
-        injury_keywords = ["故意伤害", "殴打", "打伤", "轻伤", "重伤"]
-        fraud_keywords = ["诈骗", "骗取", "虚构事实"]
-        embezzlement_keywords = ["职务侵占", "挪用资金", "非法占有"]
-
-        if any(k in text for k in theft_keywords):
-            return "盗窃罪"
-        if any(k in text for k in injury_keywords):
-            return "故意伤害罪"
-        if any(k in text for k in fraud_keywords):
-            return "诈骗罪"
-        if any(k in text for k in embezzlement_keywords):
-            return "职务侵占罪"
 
-        # 3. 默认回退
-        return "盗窃罪"
+def _normalize(text):
+    """去除空格和换行，str.translate 一次遍历完成"""
+    return text.translate(_STRIP_WHITESPACE)
 
-    def extract_region(self, defendant_info, case_description):
-        """
-        从案件信息中提取地区信息
-        """
-        text = (defendant_info or "") + (case_description or "")
 
-        regions = [
-            "北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林",
-            "黑龙江", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
-            "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
-            "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆",
-            "香港", "澳门"
-        ]
+def _best_rank(pattern, rank_of, text):
+    """一次扫描 text，返回命中关键词中优先级最高（rank 最小）者的 rank，未命中返回 None"""
+    best = None
+    for match in pattern.finditer(text):
+        rank = rank_of[match.group(1)]
+        if best is None or rank < best:
+            best = rank
+            if rank == 0:
+                break
+    return best
 
-        cities = [
-            "江门", "深圳", "广州", "珠海", "佛山", "东莞", "中山", "杭州",
-            "宁波", "温州", "嘉兴", "绍兴", "台州", "义乌", "南京", "苏州",
-            "无锡", "常州", "徐州", "济南", "青岛", "烟台", "潍坊", "大连",
-            "沈阳", "哈尔滨", "长春", "成都", "西安", "武汉", "长沙", "福州",
-            "厦门", "贵阳", "昆明", "南宁", "石家庄", "太原", "南昌", "合肥",
-            "郑州", "海口", "乌鲁木齐", "呼和浩特", "银川", "西宁", "拉萨", "兰州"
-        ]
 
-        for region in regions:
-            if region in text:
-                return region
+# 分层情节及其比例。直接以 Factor 元组传给计算器，免去每条数据构造字典、在计算器入口再逐个解析
+_F_MINOR = Factor("未成年人", 0.7)
+_F_PREPARATION = Factor("犯罪预备", 0.5)
+_F_DISCONTINUATION = Factor("犯罪中止", 0.5)
+_F_ATTEMPT = Factor("犯罪未遂", 0.5)
+_F_RECIDIVIST = Factor("累犯", 1.30)
+_F_PRIOR_RECORD = Factor("前科", 1.10)
+_F_REPEATED_FRAUD = Factor("多次诈骗", 1.10)
+_F_TELECOM_FRAUD = Factor("电信网络诈骗", 1.15)
+_F_SURRENDER = Factor("自首", 0.80)
+_F_CONFESSION = Factor("坦白", 0.80)
+_F_GUILTY_PLEA = Factor("认罪认罚", 0.95)
+_F_RESTITUTION = Factor("退赃/退赔", 0.85)
+_F_FORGIVENESS = Factor("取得谅解", 0.95)
 
-        for city in cities:
-            if city in text:
-                return city
 
-        return "default"
-
-    # ===== Prompt 构造（Task1） =====
-
-    def _get_amount_standards_for_prompt(self, crime_type, region):
-        """
-        根据罪名和地区的数额标准生成提示信息
-        """
-        standards_all = SentencingCalculator.REGIONAL_STANDARDS
+class LLMCache:
+    """
+    基于 SQLite 的 LLM 响应缓存。
+    以 (模型, 温度, 消息) 的 SHA256 为键，相同请求直接从本地返回；重跑或中断后续跑时已完成的案情不再重复请求。
+    """
 
-        if region in standards_all:
-            standards = standards_all[region]
-        elif region in standards_all.get("cities_to_provinces", {}):
-            province = standards_all["cities_to_provinces"][region]
-            standards = standards_all[province]
-        else:
-            standards = standards_all["default"]
+    def __init__(self, path):
+        # 所有读写都在事件循环线程内同步完成，无需加锁
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, resp TEXT, ts REAL)"
+        )
+        self._conn.commit()
 
-        if crime_type == "盗窃罪" and "theft" in standards:
-            theft_standards = standards["theft"]
-            return f"""**{region}盗窃罪数额标准:**
-- **数额较大**: {theft_standards['large']}元以上不满{theft_standards['huge']}元
-- **数额巨大**: {theft_standards['huge']}元以上不满{theft_standards['especially_huge']}元
-- **数额特别巨大**: {theft_standards['especially_huge']}元以上"""
+    @staticmethod
+    def key(model, temperature, messages):
+        payload = json.dumps(
+            {"model": model, "temperature": temperature, "messages": messages},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-        elif crime_type == "诈骗罪" and "fraud" in standards:
-            fraud_standards = standards["fraud"]
-            return f"""**{region}诈骗罪数额标准:**
-- **数额较大**: {fraud_standards['large']}元以上不满{fraud_standards['huge']}元
-- **数额巨大**: {fraud_standards['huge']}元以上不满{fraud_standards['especially_huge']}元
-- **数额特别巨大**: {fraud_standards['especially_huge']}元以上"""
+    def get(self, key):
+        row = self._conn.execute("SELECT resp FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
 
-        elif crime_type == "职务侵占罪":
-            # 使用河南标准作为默认
-            return """**河南职务侵占罪数额标准:**
-- **数额较大**: 6万元以上不满100万元
-- **数额巨大**: 100万元以上不满1500万元
-- **数额特别巨大**: 1500万元以上"""
+    def set(self, key, text):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, resp, ts) VALUES (?, ?, ?)",
+            (key, text, time.time())
+        )
+        self._conn.commit()
 
-        else:
-            return """**全国通用数额标准参考:**
-- **盗窃罪**:
-  - 数额较大: 1000元以上不满30000元
-  - 数额巨大: 30000元以上不满300000元
-  - 数额特别巨大: 300000元以上
-- **诈骗罪**:
-  - 数额较大: 3000元以上不满30000元
-  - 数额巨大: 30000元以上不满500000元
-  - 数额特别巨大: 500000元以上"""
 
-    def build_prompt_task1_authoritative(self, defendant_info, case_description):
-        """
-        Task1 提示词：锁死诈骗罪标签空间。
-        若你之后希望扩展到其他罪名，可以在此增加分支。
-        """
-        crime_type = "诈骗罪"  # 当前专门优化诈骗罪子任务
-        region = self.extract_region(defendant_info, case_description)
-        amount_standards = self._get_amount_standards_for_prompt(crime_type, region)
+# ===== Task1 提示词片段 =====
+# 单案情提示词 = 引言 + 数额标准 + 规则 + 输出格式 + 案情；批量提示词共用引言与规则，各案情附各自的数额标准
 
-        prompt = f"""
+_TASK1_INTRO = """
 你是一名中国刑事法官，专门办理诈骗罪案件。请从下面的案情事实中，提取**与量刑直接相关**的情节，且只能使用下面给定的标签形式。
 
 【标签种类和固定写法（只能用这些）】
@@ -174,8 +186,13 @@ class SentencingPredictor:
    - "诈骗数额较大"
    - "诈骗数额巨大"
    - "诈骗数额特别巨大"
-   判断标准请严格根据本地区数额标准：
-{amount_standards}
+"""
+
+_TASK1_STANDARDS_LINE = "   判断标准请严格根据本地区数额标准：\n"
+
+_TASK1_BATCH_STANDARDS_LINE = "   判断标准请严格根据每个案情下列出的本地区数额标准。"
+
+_TASK1_RULES = """
 
 3. 次数类（二选一，不能同时出现）：
    - "诈骗次数X次"   —— 能够从案情中精确统计次数时使用
@@ -205,16 +222,228 @@ class SentencingPredictor:
 - 若同时出现“累犯”和“前科”事实，只输出“累犯”，不要重复评价；
 - 已经用来确定“诈骗金额”“数额档次”“次数”的事实，在后续量刑情节中不要重复发明新标签描述。
 
-【输出格式】
+"""
+
+_TASK1_OUTPUT = """【输出格式】
 
 - 只输出一个 JSON 数组，不要输出任何解释和多余文字；
 - 例如：
   ["诈骗金额既遂50000元","诈骗数额较大","诈骗次数2次","电信网络诈骗","自首","认罪认罚","退赔全部损失"]
 
+"""
+
+_TASK1_BATCH_OUTPUT = """【输出格式】
+
+- 下面共有 %d 个案情，请对每个案情分别提取标签，各案情之间互不影响；
+- 只输出一个 JSON 对象，键为案情编号（字符串），值为该案情的标签数组，不要输出任何解释和多余文字；
+- 例如：
+  {"1": ["诈骗金额既遂50000元","诈骗数额较大","自首"], "2": ["诈骗金额既遂3000元","坦白","认罪认罚"]}
+
 【案情事实】
-{case_description}
+
 """
-        return prompt
+
+_TASK1_SYSTEM_PROMPT = "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"
+
+_TASK1_FALLBACK = ["诈骗数额较大"]
+
+
+@lru_cache(maxsize=128)
+def _get_amount_standards_for_prompt(crime_type, region):
+    """
+    根据罪名和地区的数额标准生成提示信息。
+    结果只依赖 (罪名, 地区)，缓存后每个组合只格式化一次。
+    """
+    # 地区 -> 标准的解析由计算器按地区缓存
+    standards = SentencingCalculator._get_standards_by_region(region)
+
+    if crime_type == "盗窃罪" and "theft" in standards:
+        theft_standards = standards["theft"]
+        return f"""**{region}盗窃罪数额标准:**
+- **数额较大**: {theft_standards['large']}元以上不满{theft_standards['huge']}元
+- **数额巨大**: {theft_standards['huge']}元以上不满{theft_standards['especially_huge']}元
+- **数额特别巨大**: {theft_standards['especially_huge']}元以上"""
+
+    elif crime_type == "诈骗罪" and "fraud" in standards:
+        fraud_standards = standards["fraud"]
+        return f"""**{region}诈骗罪数额标准:**
+- **数额较大**: {fraud_standards['large']}元以上不满{fraud_standards['huge']}元
+- **数额巨大**: {fraud_standards['huge']}元以上不满{fraud_standards['especially_huge']}元
+- **数额特别巨大**: {fraud_standards['especially_huge']}元以上"""
+
+    elif crime_type == "职务侵占罪":
+        # 使用河南标准作为默认
+        return """**河南职务侵占罪数额标准:**
+- **数额较大**: 6万元以上不满100万元
+- **数额巨大**: 100万元以上不满1500万元
+- **数额特别巨大**: 1500万元以上"""
+
+    else:
+        return """**全国通用数额标准参考:**
+- **盗窃罪**:
+  - 数额较大: 1000元以上不满30000元
+  - 数额巨大: 30000元以上不满300000元
+  - 数额特别巨大: 300000元以上
+- **诈骗罪**:
+  - 数额较大: 3000元以上不满30000元
+  - 数额巨大: 30000元以上不满500000元
+  - 数额特别巨大: 500000元以上"""
+
+
+@lru_cache(maxsize=128)
+def _task1_prefix(region):
+    """
+    单案情 Task1 提示词中案情之前的部分，只随地区变化，每个地区只拼接一次。
+    """
+    return "".join([
+        _TASK1_INTRO, _TASK1_STANDARDS_LINE, _get_amount_standards_for_prompt("诈骗罪", region),
+        _TASK1_RULES, _TASK1_OUTPUT,
+        "【案情事实】\n",
+    ])
+
+
+# 批量 Task1 提示词中各案情之前的固定部分（输出格式中的案情数在调用时填入）
+_TASK1_BATCH_HEAD = "".join([_TASK1_INTRO, _TASK1_BATCH_STANDARDS_LINE, _TASK1_RULES])
+
+
+class SentencingPredictor:
+    """
+    一个基于大型语言模型的法律量刑预测器。
+    Task1 使用 LLM 做情节抽取（带强约束提示词）；
+    Task2 改为纯规则 + 计算器的确定性计算，避免 LLM 在数值与权重上自由发挥。
+    """
+
+    def __init__(self):
+        """
+        初始化客户端和模型配置。
+        """
+        # 同时在途的请求数上限，应不超过接口允许的并发数
+        self.max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+        # 异步客户端，多条案情的请求可同时在途；遇到 429/5xx 或连接错误时由 SDK 指数退避重试。
+        # 连接池按并发数保持长连接，请求之间复用，不必反复建立 TLS 连接；
+        # OPENAI_HTTP2=1 时改用 HTTP/2 多路复用（需安装 httpx[http2]）
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")),
+            http_client=httpx.AsyncClient(
+                http2=os.getenv("OPENAI_HTTP2", "0") == "1",
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+                # 非流式调用要等整段输出生成完才返回,长输出/批量请求可能需要数分钟,读超时保持600秒
+                timeout=httpx.Timeout(connect=5.0, read=600.0, write=30.0, pool=5.0)
+            )
+        )
+        self.model_name = os.getenv("OPENAI_MODEL", "qwen-max")
+        self.temperature_task1 = 0.1  # Task1 使用稍低温度，保证稳定 + 轻微多样性
+        self.temperature_task2 = 0.1  # Task2 已改为规则化，这个参数基本不会再用
+        # Task1 只输出一个较短的 JSON 数组；上限贴近实际输出，异常时的长尾更短，服务端预留的 KV 缓存也更少
+        self.max_tokens_task1 = 512
+        # 每次 Task1 调用合并的案情数；设为 1 则逐条调用
+        self.task1_batch_size = int(os.getenv("ZP_TASK1_BATCH_SIZE", "10"))
+        # Task2 进程池大小；0 表示在事件循环中直接计算（单条仅为微秒级规则计算，进程间传参的开销通常更大）
+        self.task2_workers = int(os.getenv("ZP_TASK2_WORKERS", "0"))
+        self._task2_pool = None
+        # Task1 温度很低、案情不变，输出基本确定，对响应做本地缓存
+        self.llm_cache = LLMCache(os.getenv("LLM_CACHE_PATH", ".zp_llm_cache.sqlite"))
+
+    # ===== 基础信息抽取工具 =====
+
+    def identify_crime_type(self, defendant_info, case_description):
+        """
+        增强版的罪名识别函数。
+        优先从指控中识别,其次通过关键词匹配。
+        """
+        return self.identify_crime_type_on_text(_normalize((defendant_info or "") + (case_description or "")))
+
+    @staticmethod
+    def identify_crime_type_on_text(text):
+        """
+        在已去除空白的案件文本上识别罪名。
+        """
+        # 1. 优先匹配指控罪名
+        charge_match = _CHARGE_RE.search(text)
+        if charge_match:
+            crime = charge_match.group(2)
+            if "盗窃" in crime:
+                return "盗窃罪"
+            if "故意伤害" in crime:
+                return "故意伤害罪"
+            if "诈骗" in crime:
+                return "诈骗罪"
+            if "职务侵占" in crime:
+                return "职务侵占罪"
+
+        # 2. 关键词备用：一次扫描，取优先级最高的罪名
+        best = _best_rank(_CRIME_KEYWORD_RE, _CRIME_KEYWORD_RANK, text)
+        if best is not None:
+            return _CRIME_NAMES[best]
+
+        # 3. 默认回退
+        return "盗窃罪"
+
+    def extract_region(self, defendant_info, case_description):
+        """
+        从案件信息中提取地区信息
+        """
+        return self.extract_region_on_text((defendant_info or "") + (case_description or ""))
+
+    def _detect_crime_and_region(self, defendant_info, case_description):
+        """
+        识别罪名和地区，案情文本只拼接、去空白各一次。返回 (罪名, 地区)。
+        """
+        text = (defendant_info or "") + (case_description or "")
+        return self.identify_crime_type_on_text(_normalize(text)), self.extract_region_on_text(text)
+
+    @staticmethod
+    def extract_region_on_text(text):
+        """
+        在案件文本（未去除空白）上提取地区信息
+        """
+        # 一次扫描找出所有出现的地区，取优先级最高者（省份先于城市）
+        best = _best_rank(_REGION_RE, _REGION_RANK, text)
+        if best is not None:
+            return _REGION_NAMES[best]
+
+        return "default"
+
+    # ===== Prompt 构造（Task1） =====
+
+    def _get_amount_standards_for_prompt(self, crime_type, region):
+        """
+        根据罪名和地区的数额标准生成提示信息
+        """
+        return _get_amount_standards_for_prompt(crime_type, region)
+
+    def build_prompt_task1_authoritative(self, defendant_info, case_description, region=None):
+        """
+        Task1 提示词：锁死诈骗罪标签空间。
+        若你之后希望扩展到其他罪名，可以在此增加分支。
+        region 为调用方已识别的地区，未传入时在此识别。
+        """
+        # 当前专门优化诈骗罪子任务，静态部分按地区缓存（见 _task1_prefix）
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
+
+        return "".join([_task1_prefix(region), case_description, "\n"])
+
+    def build_prompt_task1_batch(self, cases, regions=None):
+        """
+        多案情合并的 Task1 提示词：规则只出现一次，各案情按【案情N】编号列出并附上各自地区的数额标准，
+        要求输出以案情编号为键的 JSON 对象。cases 为 (被告人信息, 案情描述) 列表。
+        regions 为调用方已识别的各案情地区，未传入时在此识别。
+        """
+        if regions is None:
+            regions = [self.extract_region(defendant_info, case_description)
+                       for defendant_info, case_description in cases]
+        blocks = []
+        for i, ((defendant_info, case_description), region) in enumerate(zip(cases, regions), 1):
+            blocks.append("".join([
+                "【案情", str(i), "】\n本地区数额标准：\n",
+                self._get_amount_standards_for_prompt("诈骗罪", region),
+                "\n案情事实：\n", case_description, "\n\n",
+            ]))
+        return "".join([_TASK1_BATCH_HEAD, _TASK1_BATCH_OUTPUT % len(cases), *blocks])
 
     # ===== Task1: 调用 + 轻量后处理 =====
 
@@ -231,6 +460,9 @@ class SentencingPredictor:
         cleaned = []
         has_count = False
         has_multi = False
+        has_recidivist = False
+        # “前科”在 cleaned 中的位置，同时存在“累犯”时按位置删除
+        prior_record_idx = []
 
         for f in raw_factors:
             if not isinstance(f, str):
@@ -238,16 +470,12 @@ class SentencingPredictor:
             f = f.strip()
 
             # 1. 过滤明显不在字典中的“自造标签”
-            allowed_exact = {
-                "诈骗数额较大", "诈骗数额巨大", "诈骗数额特别巨大",
-                "电信网络诈骗",
-                "自首", "坦白", "认罪认罚", "当庭自愿认罪",
-                "退赔全部损失", "退赔部分损失",
-                "取得谅解",
-                "前科", "累犯"
-            }
             # 前缀类标签另行处理
-            if f in allowed_exact:
+            if f in _ALLOWED_EXACT:
+                if f == "前科":
+                    prior_record_idx.append(len(cleaned))
+                elif f == "累犯":
+                    has_recidivist = True
                 cleaned.append(f)
                 continue
 
@@ -268,22 +496,16 @@ class SentencingPredictor:
             # 3. 金额类：保留，但规范小数位
             if f.startswith("诈骗金额既遂") or f.startswith("诈骗金额未遂"):
                 # 统一为最多两位小数
-                m_yuan = re.search(r"(诈骗金额[既未]遂)([\d\.]+)元", f)
-                m_wan = re.search(r"(诈骗金额[既未]遂)([\d\.]+)万元", f)
+                m = _FRAUD_AMOUNT_RE.search(f)
                 prefix = None
                 amount_val = None
-                unit = "元"
 
-                if m_wan:
-                    prefix = m_wan.group(1)
-                    try:
-                        amount_val = float(m_wan.group(2)) * 10000.0
-                    except Exception:
-                        amount_val = None
-                elif m_yuan:
-                    prefix = m_yuan.group(1)
+                if m:
+                    prefix = m.group(1)
                     try:
-                        amount_val = float(m_yuan.group(2))
+                        amount_val = float(m.group(2))
+                        if m.group(3):
+                            amount_val *= 10000.0
                     except Exception:
                         amount_val = None
 
@@ -304,155 +526,179 @@ class SentencingPredictor:
             cleaned.append(f)
 
         # 5. 若同时存在“累犯”和“前科”，去掉“前科”
-        if "累犯" in cleaned and "前科" in cleaned:
-            cleaned = [x for x in cleaned if x != "前科"]
+        if has_recidivist and prior_record_idx:
+            for idx in reversed(prior_record_idx):
+                del cleaned[idx]
 
         return cleaned
 
-    def predict_task1_authoritative(self, defendant_info, case_description):
+    async def predict_task1_authoritative(self, defendant_info, case_description, region=None):
         """
         执行 Task1: 提取量刑情节（诈骗罪专用）。
         """
-        prompt = self.build_prompt_task1_authoritative(defendant_info, case_description)
+        prompt = self.build_prompt_task1_authoritative(defendant_info, case_description, region)
+        messages = [
+            {"role": "system", "content": _TASK1_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一位经验丰富的刑事法官,精通中国刑法量刑情节认定,对细节极其敏感。"
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature_task1,
-                max_tokens=self.max_tokens
-            )
-            result_text = response.choices[0].message.content.strip()
+            cache_key = LLMCache.key(self.model_name, self.temperature_task1, messages)
+            result_text = self.llm_cache.get(cache_key)
+            fetched = result_text is None
+            if fetched:
+                response = await self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=self.temperature_task1,
+                    max_tokens=self.max_tokens_task1
+                )
+                result_text = response.choices[0].message.content.strip()
 
-            json_match = re.search(r'\[.*?\]', result_text, re.DOTALL)
+            json_match = _JSON_ARRAY_RE.search(result_text)
             if json_match:
                 raw_factors = json.loads(json_match.group(0))
+                # 新请求的输出解析成功才写入缓存，异常输出下次重新请求；命中缓存时无需重写
+                if fetched:
+                    self.llm_cache.set(cache_key, result_text)
                 # 当前聚焦诈骗罪，直接按诈骗罪规则后处理
                 processed = self._postprocess_fraud_factors(raw_factors)
                 return processed
             else:
-                print(f"警告 (Task 1): 未能在输出中找到JSON数组。返回: {result_text}")
-                return ["诈骗数额较大"]
+                logger.warning("警告 (Task 1): 未能在输出中找到JSON数组。返回: %s", result_text)
+                return list(_TASK1_FALLBACK)
         except Exception as e:
-            print(f"错误 (Task 1): API调用或JSON解析失败: {e}")
-            return ["诈骗数额较大"]
-
-    # ===== Task2：完全规则化的量刑计算 =====
+            logger.error("错误 (Task 1): API调用或JSON解析失败: %s", e)
+            return list(_TASK1_FALLBACK)
 
-    def _extract_amount_from_factors(self, factors):
+    async def predict_task1_batch(self, cases, regions=None):
         """
-        从 Task1 输出的标签中提取金额（元）。
-        支持：
-        - 诈骗金额既遂XXXX元 / 万元
-        - 诈骗金额未遂XXXX元 / 万元
+        Task1 批量版本：一次调用提取多个案情的量刑情节，cases 为 (被告人信息, 案情描述) 列表。
+        返回与输入等长的列表；某个案情在输出中缺失或格式不符时对应位置为 None，由调用方逐条重试。
         """
-        if not factors:
-            return None
-
-        for f in factors:
-            if not isinstance(f, str):
-                continue
-            if "金额既遂" in f or "金额未遂" in f:
-                m_wan = re.search(r"金额[既未]遂([\d\.]+)万元", f)
-                m_yuan = re.search(r"金额[既未]遂([\d\.]+)元", f)
-
-                if m_wan:
-                    try:
-                        return float(m_wan.group(1)) * 10000.0
-                    except Exception:
-                        continue
-                if m_yuan:
-                    try:
-                        return float(m_yuan.group(1))
-                    except Exception:
-                        continue
-        return None
+        prompt = self.build_prompt_task1_batch(cases, regions)
+        messages = [
+            {"role": "system", "content": _TASK1_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        answers = [None] * len(cases)
+        try:
+            cache_key = LLMCache.key(self.model_name, self.temperature_task1, messages)
+            result_text = self.llm_cache.get(cache_key)
+            fetched = result_text is None
+            if fetched:
+                response = await self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=self.temperature_task1,
+                    max_tokens=self.max_tokens_task1 * len(cases)
+                )
+                result_text = response.choices[0].message.content.strip()
+
+            json_match = _JSON_OBJECT_RE.search(result_text)
+            if not json_match:
+                logger.warning("警告 (Task 1 批量): 未能在输出中找到JSON对象，改为逐条提取。返回: %s", result_text)
+                return answers
+            by_number = json.loads(json_match.group(0))
+            if fetched:
+                self.llm_cache.set(cache_key, result_text)
+            for i in range(len(cases)):
+                raw_factors = by_number.get(str(i + 1))
+                if isinstance(raw_factors, list):
+                    answers[i] = self._postprocess_fraud_factors(raw_factors)
+        except Exception as e:
+            logger.error("错误 (Task 1 批量): API调用或JSON解析失败，改为逐条提取: %s", e)
+        return answers
 
-    def _extract_fraud_count(self, factors):
-        """
-        从标签中解析“诈骗次数X次”的次数。
-        """
-        if not factors:
-            return None
-        for f in factors:
-            if not isinstance(f, str):
-                continue
-            m = re.search(r"诈骗次数(\d+)次", f)
-            if m:
-                try:
-                    return int(m.group(1))
-                except Exception:
-                    continue
-        return None
+    # ===== Task2：完全规则化的量刑计算 =====
 
-    def _map_factors_from_answer1(self, crime_type, factors):
+    def _parse_factors(self, factors):
         """
-        将 Task1 的标签映射为分层量刑情节（完全在 Python 中确定，不再交给 LLM）。
+        一次遍历 Task1 的标签，同时完成金额、诈骗次数的提取与分层情节的映射（完全在 Python 中确定，不再交给 LLM）。
 
-        返回：
-        - layer1_factors: [{'name': str, 'ratio': float}, ...]
-        - layer2_factors: [{'name': str, 'ratio': float}, ...]
-        - has_statutory_mitigation: bool
+        返回 (amount, fraud_count, layer1_factors, layer2_factors, has_statutory_mitigation)：
+        - amount: 第一个可解析的“诈骗金额既遂/未遂XXXX元/万元”（元），没有则为 None
+        - fraud_count: 第一个“诈骗次数X次”的次数，没有则为 None
+        - layer1_factors / layer2_factors: [Factor(name, ratio), ...]
         """
+        amount = None
+        fraud_count = None
         layer1 = []
         layer2 = []
 
         # 可根据需要继续扩展
         has_statutory = False
-        tags = set(factors or [])
+        has_restitution = False
+        tags = set()
 
-        # ===== 第一层：法定减轻/从轻情节（连乘） =====
-        # 若你之后为其他罪名加入“未成年人”“从犯”等，可在此补充
-        # 示例：未成年人、犯罪未遂等
         for f in factors or []:
+            if not isinstance(f, str):
+                continue
+            tags.add(f)
+
+            # 金额 / 次数：先用 in 做廉价筛选，命中才跑正则
+            if amount is None and ("金额既遂" in f or "金额未遂" in f):
+                m = _AMOUNT_RE.search(f)
+                if m:
+                    try:
+                        amount = float(m.group(1))
+                        if m.group(2):
+                            amount *= 10000.0
+                    except Exception:
+                        amount = None
+            if fraud_count is None and "诈骗次数" in f:
+                m = _FRAUD_COUNT_RE.search(f)
+                if m:
+                    fraud_count = int(m.group(1))
+
+            # ===== 第一层：法定减轻/从轻情节（连乘） =====
+            # 若你之后为其他罪名加入“未成年人”“从犯”等，可在此补充
+            # 示例：未成年人、犯罪未遂等
             if "未成年人" in f:
-                layer1.append({"name": "未成年人", "ratio": 0.7})
+                layer1.append(_F_MINOR)
                 has_statutory = True
             if "犯罪预备" in f:
-                layer1.append({"name": "犯罪预备", "ratio": 0.5})
+                layer1.append(_F_PREPARATION)
                 has_statutory = True
             if "犯罪中止" in f:
-                layer1.append({"name": "犯罪中止", "ratio": 0.5})
+                layer1.append(_F_DISCONTINUATION)
                 has_statutory = True
             # 利用“金额未遂”标签推断犯罪未遂
             if "金额未遂" in f or "犯罪未遂" in f:
-                layer1.append({"name": "犯罪未遂", "ratio": 0.5})
+                layer1.append(_F_ATTEMPT)
                 has_statutory = True
 
+            # 退赔/退赃：视作酌定从轻
+            if f.startswith("退赔") or f.startswith("退赃"):
+                has_restitution = True
+
         # ===== 第二层：从重情节 =====
         if "累犯" in tags:
-            layer2.append({"name": "累犯", "ratio": 1.30})
+            layer2.append(_F_RECIDIVIST)
         if "前科" in tags and "累犯" not in tags:
-            layer2.append({"name": "前科", "ratio": 1.10})
+            layer2.append(_F_PRIOR_RECORD)
 
         # “多次诈骗”：作为酌定从重
         if "多次诈骗" in tags:
-            layer2.append({"name": "多次诈骗", "ratio": 1.10})
+            layer2.append(_F_REPEATED_FRAUD)
 
         # 电信网络诈骗：酌定从重 + 基准刑处已通过“就高”处理一部分
         if "电信网络诈骗" in tags:
-            layer2.append({"name": "电信网络诈骗", "ratio": 1.15})
+            layer2.append(_F_TELECOM_FRAUD)
 
         # ===== 第二层：从轻情节 =====
         if "自首" in tags:
-            layer2.append({"name": "自首", "ratio": 0.80})
+            layer2.append(_F_SURRENDER)
             has_statutory = True  # 自首也可视作法定减轻基础（此处记为有法定减轻）
 
         if "坦白" in tags:
-            layer2.append({"name": "坦白", "ratio": 0.80})
+            layer2.append(_F_CONFESSION)
 
         if "认罪认罚" in tags or "当庭自愿认罪" in tags:
             # 可视情况调到 0.9 或 0.95
-            layer2.append({"name": "认罪认罚", "ratio": 0.95})
+            layer2.append(_F_GUILTY_PLEA)
 
-        # 退赔/退赃：视作酌定从轻
-        if any(f.startswith("退赔") or f.startswith("退赃") for f in factors or []):
-            layer2.append({"name": "退赃/退赔", "ratio": 0.85})
+        if has_restitution:
+            layer2.append(_F_RESTITUTION)
 
         if "退赔全部损失" in tags:
             # 全额退赔 + 一般退赔叠加可能过度，这里可以微调逻辑：
@@ -461,29 +707,24 @@ class SentencingPredictor:
             pass
 
         if "取得谅解" in tags:
-            layer2.append({"name": "取得谅解", "ratio": 0.95})
+            layer2.append(_F_FORGIVENESS)
 
-        return layer1, layer2, has_statutory
+        return amount, fraud_count, layer1, layer2, has_statutory
 
-    def _choose_width_for_fraud(self, amount, region):
+    def _choose_width_for_fraud(self, amount, region, context=None):
         """
         根据金额档次选择默认区间宽度（可根据验证集微调）。
         - 数额较大：宽度 8
         - 数额巨大：宽度 10
         - 数额特别巨大：宽度 12
-        """
-        standards_all = SentencingCalculator.REGIONAL_STANDARDS
 
-        if region in standards_all:
-            standards = standards_all[region]
-        elif region in standards_all.get("cities_to_provinces", {}):
-            province = standards_all["cities_to_provinces"][region]
-            standards = standards_all[province]
+        传入 context（SentencingContext）时直接使用其中已解析的阈值。
+        """
+        if context is not None:
+            L, H, EH = context.fraud_thresholds
         else:
-            standards = standards_all["default"]
-
-        fraud_std = standards["fraud"]
-        L, H, EH = fraud_std["large"], fraud_std["huge"], fraud_std["especially_huge"]
+            fraud_std = SentencingCalculator._get_standards_by_region(region)["fraud"]
+            L, H, EH = fraud_std["large"], fraud_std["huge"], fraud_std["especially_huge"]
 
         if amount is None:
             return 10  # 中档宽度
@@ -495,42 +736,49 @@ class SentencingPredictor:
         else:
             return 12  # 数额特别巨大
 
-    def predict_task2_with_tools(self, defendant_info, case_description, sentencing_factors):
+    def predict_task2_with_tools(self, defendant_info, case_description, sentencing_factors,
+                                 crime_type=None, region=None):
         """
         执行 Task2：使用规则 + 计算器进行刑期预测，并在控制台打印完整计算过程。
+        crime_type / region 为调用方已识别的罪名与地区，未传入时在此识别。
 
         返回：[min_months, max_months]
         """
         if not sentencing_factors:
             sentencing_factors = ["犯罪情节较轻"]
 
-        crime_type = self.identify_crime_type(defendant_info, case_description)
-        region = self.extract_region(defendant_info, case_description)
-        amount = self._extract_amount_from_factors(sentencing_factors)
-        fraud_count = self._extract_fraud_count(sentencing_factors)
+        if crime_type is None:
+            crime_type = self.identify_crime_type(defendant_info, case_description)
+        if region is None:
+            region = self.extract_region(defendant_info, case_description)
+        # 金额、次数与分层情节一次遍历得到
+        amount, fraud_count, layer1_factors, layer2_factors, has_statutory = self._parse_factors(
+            sentencing_factors
+        )
+
+        logger.debug("\n******** [Task2] 刑期计算流程 ********")
+        logger.debug("[Task2] 罪名: %s", crime_type)
+        logger.debug("[Task2] 地区: %s", region)
+        logger.debug("[Task2] 识别出的金额: %s 元", amount)
+        logger.debug("[Task2] 识别出的诈骗次数: %s", fraud_count)
+        logger.debug("[Task2] 量刑情节标签: %s", sentencing_factors)
 
-        print("\n******** [Task2] 刑期计算流程 ********")
-        print(f"[Task2] 罪名: {crime_type}")
-        print(f"[Task2] 地区: {region}")
-        print(f"[Task2] 识别出的金额: {amount} 元")
-        print(f"[Task2] 识别出的诈骗次数: {fraud_count}")
-        print(f"[Task2] 量刑情节标签: {sentencing_factors}")
+        # 地区阈值每案只解析一次，供基准刑与区间宽度共用
+        context = SentencingContext.for_region(region)
 
         # 1. 基准刑
         base_months = SentencingCalculator.calculate_base_sentence(
             crime_type=crime_type,
             amount=amount,
-            region=region
+            region=region,
+            context=context
         )
-        print(f"[Task2] 计算得到基准刑: {base_months} 月")
+        logger.debug("[Task2] 计算得到基准刑: %s 月", base_months)
 
-        # 2. 映射分层情节
-        layer1_factors, layer2_factors, has_statutory = self._map_factors_from_answer1(
-            crime_type, sentencing_factors
-        )
-        print(f"[Task2] 第一层情节映射结果: {layer1_factors}")
-        print(f"[Task2] 第二层情节映射结果: {layer2_factors}")
-        print(f"[Task2] 是否存在法定减轻情节: {has_statutory}")
+        # 2. 分层情节（已由 _parse_factors 映射）
+        logger.debug("[Task2] 第一层情节映射结果: %s", layer1_factors)
+        logger.debug("[Task2] 第二层情节映射结果: %s", layer2_factors)
+        logger.debug("[Task2] 是否存在法定减轻情节: %s", has_statutory)
 
         # 3. 通过分层量刑计算最终刑期月数
         calc_result = SentencingCalculator.calculate_layered_sentence_with_constraints(
@@ -543,131 +791,172 @@ class SentencingPredictor:
             injury_level=None
         )
 
-        final_months = calc_result["final_months"]
-        print(f"[Task2] 分层计算后最终刑期: {final_months} 月")
+        final_months = calc_result.final_months
+        logger.debug("[Task2] 分层计算后最终刑期: %s 月", final_months)
 
         # 4. 根据金额档次选择区间宽度，并生成区间
         if crime_type == "诈骗罪":
-            width = self._choose_width_for_fraud(amount, region)
+            width = self._choose_width_for_fraud(amount, region, context)
         else:
             width = 10
 
-        print(f"[Task2] 选定区间宽度: {width} 月")
+        logger.debug("[Task2] 选定区间宽度: %s 月", width)
         final_range = SentencingCalculator.months_to_range(
             center_months=final_months,
             width=width
         )
-        print(f"[Task2] 最终刑期区间: {final_range}")
-        print("******** [Task2] 刑期计算流程结束 ********\n")
+        logger.debug("[Task2] 最终刑期区间: %s", final_range)
+        logger.debug("******** [Task2] 刑期计算流程结束 ********\n")
 
         return final_range
 
     # ===== 数据处理入口 =====
 
-    def process_all_data(self, preprocessed_data, output_file):
+    async def _process_one(self, idx, total, item_id, defendant_info, case_description, answer1=None,
+                           detected=None):
         """
-        主处理流程: 遍历所有数据, 执行两阶段预测, 并保存结果。
+        处理单条数据：执行两阶段预测，返回 (序号, 结果)。
+        answer1 为批量 Task1 已提取的情节，传入时跳过 Task1 调用；
+        detected 为调用方已识别的 (罪名, 地区)，未传入时在此识别。
         """
-        results = []
+        logger.debug("\n%s\n处理第 %d/%d 条数据 (ID: %s)\n%s", '=' * 60, idx + 1, total, item_id, '=' * 60)
 
-        for idx, item in enumerate(preprocessed_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(preprocessed_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
+        # 罪名和地区每条数据只识别一次，传给后续各步骤
+        if detected is None:
+            detected = self._detect_crime_and_region(defendant_info, case_description)
+        crime_type, region = detected
 
-            answer1, answer2 = [], []
-            try:
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    item.get('defendant_info', ""),
-                    item.get('case_description', "")
+        answer2 = []
+        try:
+            logger.debug("\n【步骤1: 提取量刑情节】")
+            if answer1 is None:
+                answer1 = await self.predict_task1_authoritative(defendant_info, case_description, region)
+            logger.debug("✓ 提取到的情节: %s", answer1)
+
+            logger.debug("\n【步骤2: 规则计算刑期】")
+            if self._task2_pool is not None:
+                answer2 = await asyncio.get_running_loop().run_in_executor(
+                    self._task2_pool, _task2_worker,
+                    defendant_info, case_description, answer1, crime_type, region
                 )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                print("\n【步骤2: 规则计算刑期】")
+            else:
                 answer2 = self.predict_task2_with_tools(
-                    item.get('defendant_info', ""),
-                    item.get('case_description', ""),
+                    defendant_info,
+                    case_description,
                     answer1,
+                    crime_type,
+                    region,
                 )
-                print(f"✓ 预测刑期区间: {answer2}")
-
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["诈骗数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
+            logger.debug("✓ 预测刑期区间: %s", answer2)
 
-            result = {
-                "id": item['id'],
-                "answer1": answer1,
-                "answer2": answer2
-            }
-            results.append(result)
+        except Exception as e:
+            logger.error("!!! 处理ID %s 时发生未知严重错误: %s", item_id, e)
+            answer1 = answer1 if answer1 else list(_TASK1_FALLBACK)
+            answer2 = answer2 if answer2 else [6, 12]
 
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
+        logger.debug("【最终结果 ID: %s】 答案1 (情节提取): %s 答案2 (刑期预测): %s", item_id, answer1, answer2)
 
-            # 可以改为每处理 N 条保存一次
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
+        return idx, {
+            "id": item_id,
+            "answer1": answer1,
+            "answer2": answer2
+        }
 
+    async def _process_items(self, items, output_file, resume=False):
+        """
+        并发处理 (id, 被告人信息, 案情描述) 列表，同时在途的请求不超过 max_concurrency 个。
+        每 task1_batch_size 条合并为一次 Task1 调用，Task2 逐条计算。
+        合并前按案情长度排序分批，长度相近的案情同批，避免个别超长案情拖慢整批输出。
+        每完成一条即追加写入 output_file；resume 为 True 时跳过文件中已有结果的数据。
+        全部完成后按输入顺序整理一次结果文件。
+        """
+        finished = self._load_finished_results(output_file) if resume else {}
+        total = len(items)
+        results = [finished.get(item[0]) for item in items]
+        pending = [idx for idx in range(total) if results[idx] is None]
+        if finished:
+            logger.info("断点续跑:已有 %d 条结果,剩余 %d 条待处理", total - len(pending), len(pending))
+        order = sorted(pending, key=lambda i: len(items[i][2]))
+        batch_size = max(1, self.task1_batch_size)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(idx, answer1, detected):
+            async with semaphore:
+                return await self._process_one(idx, total, *items[idx], answer1=answer1, detected=detected)
+
+        async def process_chunk(chunk):
+            # 罪名和地区每条只识别一次，批量提示词与 Task2 共用
+            detected = [self._detect_crime_and_region(*items[idx][1:]) for idx in chunk]
+            answers1 = [None] * len(chunk)
+            if len(chunk) > 1:
+                async with semaphore:
+                    logger.debug("【批量提取量刑情节】本批 %d 条", len(chunk))
+                    answers1 = await self.predict_task1_batch(
+                        [items[idx][1:] for idx in chunk], [region for _, region in detected]
+                    )
+            return await asyncio.gather(*(
+                bounded(idx, answer1, det) for idx, answer1, det in zip(chunk, answers1, detected)
+            ))
+
+        tasks = [process_chunk(order[start:start + batch_size]) for start in range(0, len(order), batch_size)]
+
+        if self.task2_workers > 0:
+            self._task2_pool = ProcessPoolExecutor(max_workers=self.task2_workers)
+        try:
+            # 完成一条追加一条（行缓冲），中断时已完成的结果不会丢失，也不再反复重写整个文件
+            with open(output_file, 'a' if finished else 'w', encoding='utf-8', buffering=1) as out:
+                if finished:
+                    # 中断时末尾可能残留半行，续写前先换行，避免与新结果连成一行
+                    out.write('\n')
+                for task in asyncio.as_completed(tasks):
+                    for idx, result in await task:
+                        results[idx] = result
+                        out.write(_dumps(result) + '\n')
+        finally:
+            if self._task2_pool is not None:
+                self._task2_pool.shutdown()
+                self._task2_pool = None
+
+        # 追加顺序为完成顺序，最后按输入顺序整理一次
         self._save_results(results, output_file)
-        print(f"\n所有数据处理完成,结果已保存至: {output_file}")
+        logger.info("所有数据处理完成,结果已保存至: %s", output_file)
         return results
 
-    def process_fact_data(self, fact_data, output_file):
+    @staticmethod
+    def _load_finished_results(output_file):
         """
-        处理 fact 格式的数据（新格式，仅有 fact 字段）。
+        读取已有结果文件，返回 {id: 结果}；文件不存在时返回空字典。
+        中断时可能写了半行，无法解析的行直接跳过。
         """
-        results = []
-
-        for idx, item in enumerate(fact_data):
-            print(f"\n{'=' * 60}")
-            print(f"处理第 {idx + 1}/{len(fact_data)} 条数据 (ID: {item['id']})")
-            print(f"{'=' * 60}")
-
-            answer1, answer2 = [], []
-            try:
-                print("\n【步骤1: 提取量刑情节】")
-                answer1 = self.predict_task1_authoritative(
-                    "",          # 被告人信息为空
-                    item['fact'] # 使用 fact 作为案情描述
-                )
-                print(f"✓ 提取到的情节: {answer1}")
-
-                print("\n【步骤2: 规则计算刑期】")
-                answer2 = self.predict_task2_with_tools(
-                    "",          # 被告人信息为空
-                    item['fact'],
-                    answer1,
-                )
-                print(f"✓ 预测刑期区间: {answer2}")
-
-            except Exception as e:
-                print(f"!!! 处理ID {item['id']} 时发生未知严重错误: {e}")
-                answer1 = answer1 if answer1 else ["诈骗数额较大"]
-                answer2 = answer2 if answer2 else [6, 12]
-
-            result = {
-                "id": item['id'],
-                "answer1": answer1,
-                "answer2": answer2
-            }
-            results.append(result)
-
-            print(f"\n【最终结果】")
-            print(f"  答案1 (情节提取): {answer1}")
-            print(f"  答案2 (刑期预测): {answer2}")
+        finished = {}
+        if not os.path.exists(output_file):
+            return finished
+        with open(output_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = _loads(line)
+                except ValueError:
+                    continue
+                finished[result["id"]] = result
+        return finished
 
-            if (idx + 1) % 1 == 0:
-                print(f"\n--- 进度保存:已处理 {idx + 1} 条数据 ---")
-                self._save_results(results, output_file)
+    def process_all_data(self, preprocessed_data, output_file, resume=False):
+        """
+        主处理流程: 并发处理所有数据, 执行两阶段预测, 并保存结果。
+        """
+        items = [
+            (item['id'], item.get('defendant_info', ""), item.get('case_description', ""))
+            for item in preprocessed_data
+        ]
+        return asyncio.run(self._process_items(items, output_file, resume))
 
-        self._save_results(results, output_file)
-        print(f"\n所有数据处理完成,结果已保存至: {output_file}")
-        return results
+    def process_fact_data(self, fact_data, output_file, resume=False):
+        """
+        处理 fact 格式的数据（新格式，仅有 fact 字段）。
+        """
+        # 被告人信息为空，使用 fact 作为案情描述
+        items = [(item['id'], "", item['fact']) for item in fact_data]
+        return asyncio.run(self._process_items(items, output_file, resume))
 
     def _save_results(self, results, output_file):
         """
@@ -676,9 +965,26 @@ class SentencingPredictor:
         try:
             with open(output_file, 'w', encoding='utf-8') as f:
                 for result in results:
-                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    f.write(_dumps(result) + '\n')
         except IOError as e:
-            print(f"错误:无法写入文件 {output_file}。请检查权限或路径。错误信息: {e}")
+            logger.error("错误:无法写入文件 %s。请检查权限或路径。错误信息: %s", output_file, e)
+
+
+# 进程池中的 Task2 预测器，每个工作进程创建一次
+_TASK2_PREDICTOR = None
+
+
+def _task2_worker(defendant_info, case_description, sentencing_factors, crime_type, region):
+    """
+    在进程池中执行 Task2。
+    Task2 为纯规则计算，不使用客户端与响应缓存，预测器跳过 __init__ 创建，工作进程中不建立连接、不打开缓存库。
+    """
+    global _TASK2_PREDICTOR
+    if _TASK2_PREDICTOR is None:
+        _TASK2_PREDICTOR = SentencingPredictor.__new__(SentencingPredictor)
+    return _TASK2_PREDICTOR.predict_task2_with_tools(
+        defendant_info, case_description, sentencing_factors, crime_type, region
+    )
 
 
 def load_preprocessed_data(preprocessed_file):
@@ -690,7 +996,7 @@ def load_preprocessed_data(preprocessed_file):
 
     print(f"正在加载预处理数据: {preprocessed_file}")
     with open(preprocessed_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+        data = _loads(f.read())
     print(f"✓ 成功加载 {len(data)} 条预处理数据")
     return data
 
@@ -706,8 +1012,9 @@ def load_fact_data(fact_file):
     data = []
     with open(fact_file, 'r', encoding='utf-8') as f:
         for line in f:
-            if line.strip():
-                data.append(json.loads(line.strip()))
+            # orjson 允许首尾空白，不必再 strip 一遍
+            if not line.isspace():
+                data.append(_loads(line))
     print(f"✓ 成功加载 {len(data)} 条 fact 数据")
     return data
 
@@ -716,6 +1023,11 @@ def main():
     """
     主函数: 初始化并运行整个预测流程。
     """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--resume", action="store_true", help="跳过结果文件中已有的数据,从中断处继续")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.DEBUG if _VERBOSE else logging.INFO, format="%(message)s")
+
     preprocessed_file = "extracted_info_fusai1.json"
     fact_file = "data/zp.jsonl"
     output_file = "result/submission_with_rules_fact_1125_fraud.jsonl"
@@ -738,7 +1050,7 @@ def main():
         print("=" * 60 + "\n")
 
         predictor = SentencingPredictor()
-        results = predictor.process_fact_data(fact_data, output_file)
+        results = predictor.process_fact_data(fact_data, output_file, resume=args.resume)
 
         print("\n" + "=" * 60)
         print("✓ 任务完成!")
@@ -759,7 +1071,7 @@ def main():
     print("=" * 60 + "\n")
 
     predictor = SentencingPredictor()
-    results = predictor.process_all_data(preprocessed_data, output_file)
+    results = predictor.process_all_data(preprocessed_data, output_file, resume=args.resume)
 
     print("\n" + "=" * 60)
     print("✓ 任务完成!")